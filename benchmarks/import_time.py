@@ -0,0 +1,217 @@
+"""
+import 耗时基准 - 基于 python -X importtime
+学习目标:
+1. import 一个 Agent 模块应该几乎不花时间: openai / tavily / numpy 等 SDK 和 .env 推迟到第一次调用时才加载
+2. 每个模块在全新子进程里 import (不带任何 Key), 用 -X importtime 的输出拆出最慢的直接依赖
+3. 超过耗时预算、或 import 时加载了重量级 SDK, 退出码为 1, 可以放进 CI
+
+用法:
+    python benchmarks/import_time.py                          # 全部模块
+    python benchmarks/import_time.py forum_agents react --repeat 5
+    python benchmarks/import_time.py --budget-ms 300 --top 5 --output /tmp/import_time.json
+    python benchmarks/import_time.py list
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 名字 -> 文件 (相对仓库根目录)
+MODULES = {
+    "client_registry": "week1/day4/client_registry.py",
+    "llm_calls": "week1/day4/llm_calls.py",
+    "multi_llm_manager": "week1/day4/multi_llm_manager.py",
+    "text_to_sql": "week1/day5/text_to_sql.py",
+    "insight_agent": "week1/day5/insight_agent.py",
+    "ingest": "week1/day5/ingest.py",
+    "query_plan_audit": "week1/day5/query_plan_audit.py",
+    "multi_agent_system": "week2/day6/multi_agent_system.py",
+    "forum_agents": "week2/day7/forum_agents.py",
+    "forum_host": "week2/day7/forum_host.py",
+    "report_agent": "week2/day8/report_agent.py",
+    "integrated_system": "week2/day8/integrated_system.py",
+    "real_api_tools": "week2/08_real_api_tools.py",
+    "agent_with_tavily": "week2/10_agent_with_tavily.py",
+    "react": "week3/11_react_agent.py",
+    "task_planning": "week3/12_task_planning_agent.py",
+    "dynamic_planning": "week3/13_dynamic_planning_agent.py",
+    "memory_agent": "week3/14_memory_agent.py",
+    "coordinator": "week4/15_multi_agent_system.py",
+    "topic_runner": "tools/topic_runner.py",
+}
+
+# import 时不应该出现的重量级依赖 (都应在第一次调用时才加载)
+HEAVY_MODULES = ("openai", "httpx", "tavily", "numpy", "requests", "dotenv")
+
+# import 时不带 Key: 模块级代码不应依赖它们
+SECRET_ENV = ("DEEPSEEK_API_KEY", "TAVILY_API_KEY", "OPENWEATHER_API_KEY")
+
+START_MARKER = "IMPORT_TIME_START"
+RESULT_MARKER = "IMPORT_TIME_RESULT "
+
+# 在子进程中执行: 按文件路径加载模块 (week3/11_react_agent.py 这类名字不能直接 import)
+_CHILD_CODE = """
+import sys, time, json, importlib.util
+path, name, heavy = sys.argv[1], sys.argv[2], sys.argv[3].split(",")
+sys.path.insert(0, __import__("os").path.dirname(path))
+sys.stderr.write("{start}\\n")
+sys.stderr.flush()
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location(name, path)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+spec.loader.exec_module(module)
+seconds = time.perf_counter() - start
+loaded = [m for m in heavy if m in sys.modules]
+print("{result}" + json.dumps({{"seconds": seconds, "loaded": loaded}}))
+""".format(start=START_MARKER, result=RESULT_MARKER)
+
+
+# ========== 单次测量 ==========
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    解析 -X importtime 输出中目标模块的直接依赖 (缩进为 0 的行)
+    每行格式: "import time: <self us> | <cumulative us> | <缩进><模块名>"
+    """
+    lines = stderr.splitlines()
+    if START_MARKER in lines:
+        lines = lines[lines.index(START_MARKER) + 1:]
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():  # 表头行
+            continue
+        name = parts[2][1:]  # "|" 后固定一个空格, 其余是每层两个空格的缩进
+        if name.startswith(" "):
+            continue
+        imports.append({
+            "module": name.strip(),
+            "self_ms": int(parts[0]) / 1000,
+            "cumulative_ms": int(parts[1]) / 1000,
+        })
+    return imports
+
+
+def measure(name: str, path: str) -> Dict:
+    """在全新子进程里 import 一次"""
+    env = {k: v for k, v in os.environ.items() if k not in SECRET_ENV}
+    env["PYTHONIOENCODING"] = "utf-8"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_CODE, path, name, ",".join(HEAVY_MODULES)],
+        capture_output=True, text=True, encoding="utf-8", cwd=REPO_ROOT, env=env
+    )
+    result_line = next((line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)), None)
+    if proc.returncode != 0 or result_line is None:
+        error = (proc.stderr.strip().splitlines() or ["未知错误"])[-1]
+        return {"error": error}
+    result = json.loads(result_line[len(RESULT_MARKER):])
+    return {
+        "ms": result["seconds"] * 1000,
+        "loaded": result["loaded"],
+        "imports": parse_importtime(proc.stderr),
+    }
+
+
+def measure_module(name: str, repeat: int, top: int) -> Dict:
+    """先跑一次预热 (生成 .pyc), 再跑 repeat 次取中位数"""
+    path = os.path.join(REPO_ROOT, MODULES[name])
+    warmup = measure(name, path)
+    if "error" in warmup:
+        return {"module": name, "path": MODULES[name], "error": warmup["error"]}
+
+    runs = [measure(name, path) for _ in range(repeat)]
+    failed = next((run for run in runs if "error" in run), None)
+    if failed:
+        return {"module": name, "path": MODULES[name], "error": failed["error"]}
+
+    median_run = sorted(runs, key=lambda run: run["ms"])[len(runs) // 2]
+    slowest = sorted(median_run["imports"], key=lambda row: -row["cumulative_ms"])[:top]
+    return {
+        "module": name,
+        "path": MODULES[name],
+        "ms": round(statistics.median(run["ms"] for run in runs), 2),
+        "min_ms": round(min(run["ms"] for run in runs), 2),
+        "heavy_loaded": median_run["loaded"],
+        "slowest_imports": [
+            {"module": row["module"], "cumulative_ms": round(row["cumulative_ms"], 2)} for row in slowest
+        ],
+    }
+
+
+# ========== 汇总 ==========
+
+def print_table(rows: List[Dict], budget_ms: float):
+    print(f"{'模块':20} {'耗时(ms)':>10} {'最快(ms)':>10}  最慢的直接依赖")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['module']:20} {'-':>10} {'-':>10}  ❌ {row['error']}")
+            continue
+        flag = " ⚠️" if row["ms"] > budget_ms else ""
+        slowest = ", ".join(f"{item['module']} {item['cumulative_ms']:.1f}" for item in row["slowest_imports"])
+        print(f"{row['module']:20} {row['ms']:>10.1f} {row['min_ms']:>10.1f}  {slowest}{flag}")
+        if row["heavy_loaded"]:
+            print(f"{'':20} ❌ import 时加载了: {', '.join(row['heavy_loaded'])}")
+
+
+def check(rows: List[Dict], budget_ms: float) -> List[str]:
+    """返回问题列表: 导入失败 / 超过预算 / 加载了重量级 SDK"""
+    problems = []
+    for row in rows:
+        if "error" in row:
+            problems.append(f"{row['module']}: 导入失败 ({row['error']})")
+            continue
+        if row["ms"] > budget_ms:
+            problems.append(f"{row['module']}: {row['ms']:.1f}ms > 预算 {budget_ms:.0f}ms")
+        if row["heavy_loaded"]:
+            problems.append(f"{row['module']}: import 时加载了 {', '.join(row['heavy_loaded'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各 Agent 模块的 import 耗时 (python -X importtime)")
+    parser.add_argument("names", nargs="*", help="要测的模块, 默认全部; 'list' 列出所有模块")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块测几次 (取中位数)")
+    parser.add_argument("--top", type=int, default=3, help="显示最慢的几个直接依赖")
+    parser.add_argument("--budget-ms", type=float, default=300, help="单个模块的 import 耗时预算")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.names == ["list"]:
+        for name, path in MODULES.items():
+            print(f"{name:20} {path}")
+        return
+
+    unknown = [name for name in args.names if name not in MODULES]
+    if unknown:
+        raise SystemExit(f"❌ 未知模块: {', '.join(unknown)} (用 list 查看)")
+    names = args.names or list(MODULES)
+
+    print(f"⏱️  import 耗时: {len(names)} 个模块 × {args.repeat} 次 | Python {sys.version.split()[0]}\n")
+    rows = [measure_module(name, args.repeat, args.top) for name in names]
+    print_table(rows, args.budget_ms)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"budget_ms": args.budget_ms, "modules": rows}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存: {args.output}")
+
+    problems = check(rows, args.budget_ms)
+    if problems:
+        print(f"\n❌ {len(problems)} 个问题:")
+        for item in problems:
+            print(f"   - {item}")
+        sys.exit(1)
+    print(f"\n✅ 全部模块在 {args.budget_ms:.0f}ms 内导入完成, 没有加载 {'/'.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+批量导入基准 - 吞吐量和内存是否随文件大小保持平稳
+学习目标:
+1. 流式导入的目标是 "和文件大小无关": 行数翻 10 倍, 行/秒不应明显下降, 内存峰值不应跟着涨
+2. 每种规模在全新的临时数据库和全新子进程里跑 (内存峰值是进程级的, 同一进程里测不准)
+   SQLite 的页缓存和 mmap 会随库变大涨到各自的上限 (默认 64MB / 256MB), 这里默认调小, 只看导入流程本身的内存
+3. 合成数据带一定比例的重复帖子和不合格行, 顺带检查去重和校验的计数
+4. 最大规模的吞吐量低于最小规模的一定比例、或内存峰值超出上限, 退出码为 1, 可以放进 CI
+
+用法:
+    python benchmarks/ingest_scaling.py                           # 默认 10000 / 100000 / 300000 行
+    python benchmarks/ingest_scaling.py --sizes 50000 500000 --drop-indexes always
+    python benchmarks/ingest_scaling.py --keep-files --output /tmp/ingest_scaling.json
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+INGEST_SCRIPT = os.path.join(REPO_ROOT, "week1/day5/ingest.py")
+
+PLATFORMS = ["微博", "抖音", "小红书", "知乎", "B站"]
+LABELS = [("positive", 0.6), ("negative", -0.5), ("neutral", 0.0)]
+WORDS = ["AI", "Agent", "大模型", "DeepSeek", "效率", "失业", "绘画", "编程", "国产", "未来", "担心", "惊艳"]
+
+
+def generate(path: str, rows: int, seed: int = 42, duplicate_rate: float = 0.05, invalid_rate: float = 0.01):
+    """写一个合成 JSONL 文件 (流式写, 不在内存里攒)"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            # 重复: 沿用之前某一行的 (platform, post_id)
+            n = rng.randrange(i) if i and rng.random() < duplicate_rate else i
+            platform = PLATFORMS[n % len(PLATFORMS)]
+            label, base = rng.choice(LABELS)
+            record = {
+                "platform": platform,
+                "post_id": f"p{n}",
+                "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))),
+                "author": f"用户{rng.randrange(rows // 10 + 1)}",
+                "author_followers": rng.randrange(100000),
+                "publish_time": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                                f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:00",
+                "likes": rng.randrange(10000),
+                "comments_count": rng.randrange(500),
+                "shares": rng.randrange(1000),
+                "sentiment": {
+                    "score": round(max(-1.0, min(1.0, base + rng.uniform(-0.4, 0.4))), 3),
+                    "label": label,
+                    "confidence": round(rng.uniform(0.5, 1.0), 3),
+                    "keywords": rng.sample(WORDS, 3),
+                },
+                "comments": [
+                    {"comment_id": f"c{n}_{j}", "content": rng.choice(WORDS), "likes": rng.randrange(100)}
+                    for j in range(rng.randrange(4))
+                ],
+            }
+            if rng.random() < invalid_rate:
+                record["likes"] = -1  # 不合格
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def run_ingest(path: str, db_path: str, drop_indexes: str, cache_size_kb: int, mmap_size: int) -> Dict:
+    """在子进程里导入, 解析最后一行 JSON 统计"""
+    env = {
+        **os.environ,
+        "PYTHONIOENCODING": "utf-8",
+        "SQLITE_CACHE_SIZE_KB": str(cache_size_kb),
+        "SQLITE_MMAP_SIZE": str(mmap_size),
+    }
+    proc = subprocess.run(
+        [sys.executable, INGEST_SCRIPT, path, "--db", db_path, "--json", "--drop-indexes", drop_indexes],
+        capture_output=True, text=True, encoding="utf-8", cwd=REPO_ROOT, env=env
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"❌ 导入失败 ({path}):\n{proc.stderr.strip()}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check(results: List[Dict], min_throughput_ratio: float, max_rss_growth_mb: float) -> List[str]:
+    """最大规模 vs 最小规模: 吞吐量不低于 min_throughput_ratio 倍, 内存峰值增长不超过 max_rss_growth_mb"""
+    if len(results) < 2:
+        return []
+    small, large = results[0], results[-1]
+    problems = []
+    ratio = large["rows_per_second"] / small["rows_per_second"] if small["rows_per_second"] else 0.0
+    if ratio < min_throughput_ratio:
+        problems.append(f"吞吐量从 {small['rows_per_second']:.0f} 降到 {large['rows_per_second']:.0f} 行/秒 "
+                        f"({ratio:.2f} < {min_throughput_ratio})")
+    if small["peak_rss_mb"] is not None and large["peak_rss_mb"] is not None:
+        growth = large["peak_rss_mb"] - small["peak_rss_mb"]
+        if growth > max_rss_growth_mb:
+            problems.append(f"内存峰值从 {small['peak_rss_mb']} MB 涨到 {large['peak_rss_mb']} MB "
+                            f"(+{growth:.1f} > {max_rss_growth_mb:.0f} MB)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入的吞吐量 / 内存随文件大小的变化")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 300000], help="各规模的行数")
+    parser.add_argument("--drop-indexes", choices=["auto", "always", "never"], default="auto")
+    parser.add_argument("--min-throughput-ratio", type=float, default=0.6,
+                        help="最大规模的行/秒至少是最小规模的多少倍")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64, help="内存峰值最多增长多少 MB")
+    parser.add_argument("--sqlite-cache-kb", type=int, default=8192, help="子进程的 SQLITE_CACHE_SIZE_KB")
+    parser.add_argument("--mmap-size", type=int, default=0, help="子进程的 SQLITE_MMAP_SIZE")
+    parser.add_argument("--keep-files", action="store_true", help="保留生成的数据和数据库")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ingest_scaling_")
+    print(f"📦 批量导入基准: {', '.join(str(n) for n in args.sizes)} 行 | 临时目录 {workdir}\n")
+    print(f"{'行数':>10} {'文件(MB)':>10} {'耗时(s)':>10} {'行/秒':>10} {'内存峰值(MB)':>14} {'新增帖子':>10} {'不合格':>8}")
+
+    results = []
+    for rows in sorted(args.sizes):
+        data_path = os.path.join(workdir, f"posts_{rows}.jsonl")
+        db_path = os.path.join(workdir, f"sentiment_{rows}.db")
+        generate(data_path, rows)
+        result = run_ingest(data_path, db_path, args.drop_indexes, args.sqlite_cache_kb, args.mmap_size)
+        result.update({"rows": rows, "file_mb": round(os.path.getsize(data_path) / 1024 / 1024, 1)})
+        results.append(result)
+        print(f"{rows:>10} {result['file_mb']:>10} {result['elapsed_seconds']:>10.2f} "
+              f"{result['rows_per_second']:>10.0f} {str(result['peak_rss_mb']):>14} "
+              f"{result['posts_inserted']:>10} {result['rejected']:>8}")
+        if not args.keep_files:
+            for path in (data_path, db_path, db_path + "-wal", db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    if not args.keep_files:
+        os.rmdir(workdir)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"drop_indexes": args.drop_indexes, "sqlite_cache_kb": args.sqlite_cache_kb,
+                       "mmap_size": args.mmap_size, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存: {args.output}")
+
+    problems = check(results, args.min_throughput_ratio, args.max_rss_growth_mb)
+    if problems:
+        print(f"\n❌ {len(problems)} 个问题:")
+        for item in problems:
+            print(f"   - {item}")
+        sys.exit(1)
+    print("\n✅ 吞吐量和内存峰值不随文件大小明显变化")
+
+
+if __name__ == "__main__":
+    main()
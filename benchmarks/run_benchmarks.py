@@ -0,0 +1,411 @@
+"""
+端到端基准测试 - 在本地 Mock LLM 上跑各个 Agent 流水线
+学习目标:
+1. 每次性能优化都用同一把尺子量: 墙钟时间、LLM 调用数、Tokens、峰值内存、各阶段耗时
+2. 每条流水线在独立子进程里跑, 峰值 RSS 互不干扰, 缓存/熔断器等全局状态也不串
+3. 结果存成 JSON, 可以和保存的基线对比, 超过阈值算退化
+
+用法:
+    python benchmarks/run_benchmarks.py run                      # 跑全部, 结果写到 benchmarks/results/
+    python benchmarks/run_benchmarks.py run forum react --repeat 3
+    python benchmarks/run_benchmarks.py run --save-baseline      # 同时保存为基线
+    python benchmarks/run_benchmarks.py compare                  # 最新结果 vs 基线, 有退化时退出码为 1
+    python benchmarks/run_benchmarks.py list
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+sys.path.append(os.path.join(REPO_ROOT, 'week1/day4'))
+sys.path.append(os.path.join(REPO_ROOT, 'tools'))
+
+RESULT_MARKER = "BENCH_RESULT "
+
+# 参与对比的指标 (越小越好)
+COMPARE_METRICS = ["wall_seconds", "llm_calls", "prompt_tokens", "completion_tokens", "peak_rss_mb"]
+
+TOPIC = "AI技术对教育领域的变革"
+
+# 流水线 import 了 key 模块时, 提前加载 value 这个 SDK
+PRELOAD_MODULES = {"client_registry": "openai", "semantic_cache": "numpy"}
+
+
+# ========== 确定性的搜索替身 ==========
+
+class FakeSearch:
+    """替代 TavilyClient: 同样的 query 永远返回同样的结果, 不访问网络"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query: str, **kwargs) -> Dict:
+        self.calls += 1
+        max_results = kwargs.get("max_results", 3)
+        return {
+            "query": query,
+            "answer": f"关于「{query}」的综合信息: 相关研究和报道持续增加, 各方观点不一。",
+            "results": [
+                {
+                    "title": f"{query} - 参考资料{i}",
+                    "url": f"https://example.com/{i}",
+                    "content": f"第{i}篇资料讨论了{query}的背景、现状和发展趋势。" * 4
+                }
+                for i in range(1, max_results + 1)
+            ]
+        }
+
+
+def _load_script(relative_path: str):
+    """按文件路径加载 week3/11_react_agent.py 这类不能直接 import 的脚本"""
+    path = os.path.join(REPO_ROOT, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0].lstrip("0123456789_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, "tavily_client"):
+        module.tavily_client = FakeSearch()
+    return module
+
+
+# ========== 流水线 ==========
+# 每个 setup 函数负责 import 和初始化, 返回真正要计时的函数
+
+def _setup_bettafish() -> Callable:
+    import multi_llm_manager
+    return multi_llm_manager.demo_bettafish_workflow
+
+
+def _setup_forum() -> Callable:
+    sys.path.append(os.path.join(REPO_ROOT, 'week2/day7'))
+    from forum_system import ForumSystem
+    return lambda: ForumSystem(TOPIC, max_rounds=3).run_forum()
+
+
+def _setup_integrated() -> Callable:
+    sys.path.append(os.path.join(REPO_ROOT, 'week2/day8'))
+    from integrated_system import IntegratedAnalysisSystem
+    return lambda: IntegratedAnalysisSystem(TOPIC).run_analysis()
+
+
+def _setup_coordinator() -> Callable:
+    module = _load_script('week4/15_multi_agent_system.py')
+    return lambda: module.CoordinatorAgent().coordinate(f"分析{TOPIC}, 写一份简短报告")
+
+
+def _setup_insight() -> Callable:
+    sys.path.append(os.path.join(REPO_ROOT, 'week1/day5'))
+    from text_to_sql import TextToSQLAgent
+    from insight_agent import InsightAgent
+    db_path = os.path.abspath("sentiment.db")
+    TextToSQLAgent(db_path=db_path)  # 建表并写入测试数据
+    return lambda: InsightAgent(db_path=db_path).comprehensive_analysis("AI技术的舆情分析")
+
+
+def _setup_react() -> Callable:
+    module = _load_script('week3/11_react_agent.py')
+    return lambda: module.react_agent("计算 15 的平方,然后搜索这个数字有什么特殊含义")
+
+
+def _setup_planning() -> Callable:
+    module = _load_script('week3/12_task_planning_agent.py')
+    return lambda: module.planning_agent(f"调研{TOPIC}的现状, 并总结三个关键趋势")
+
+
+BENCHMARKS = {
+    "bettafish": ("MultiLLMManager 的 demo_bettafish_workflow", _setup_bettafish),
+    "forum": ("ForumSystem.run_forum (3 轮)", _setup_forum),
+    "integrated": ("IntegratedAnalysisSystem.run_analysis", _setup_integrated),
+    "coordinator": ("CoordinatorAgent.coordinate", _setup_coordinator),
+    "insight": ("InsightAgent.comprehensive_analysis", _setup_insight),
+    "react": ("react_agent", _setup_react),
+    "planning": ("planning_agent", _setup_planning),
+}
+
+
+# ========== 子进程: 跑一条流水线 ==========
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB, macOS 是字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_worker(name: str, profile: str, seed: int, verbose: bool = False) -> Dict:
+    """在当前进程里启动 Mock LLM 并跑一条流水线, 返回指标"""
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    os.chdir(workdir)  # reports/、sentiment.db 等相对路径都落到临时目录
+
+    from mock_llm_server import start_server
+    server = start_server(profile=profile, seed=seed)
+
+    # 必须在 import 各模块之前设置, 它们在 import 时读取环境变量
+    os.environ["DEEPSEEK_BASE_URL"] = server.base_url
+    os.environ["DEEPSEEK_API_KEY"] = "mock"
+    os.environ["TAVILY_API_KEY"] = "mock"
+    for prefix in ("INSIGHT_ENGINE", "MEDIA_ENGINE", "QUERY_ENGINE", "REPORT_ENGINE", "FORUM_HOST"):
+        os.environ[f"{prefix}_BASE_URL"] = server.base_url
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.db")
+    # Mock 服务不限流, 本地限流器放开, 否则测出来的是限流器的等待时间
+    os.environ.setdefault("LLM_RATE_LIMIT_RPM", "100000")
+    os.environ.setdefault("LLM_RATE_LIMIT_TPM", "100000000")
+
+    from telemetry import TELEMETRY
+
+    sink = None if verbose else open(os.devnull, "w")
+    try:
+        with redirect_stdout(sink or sys.stdout), redirect_stderr(sink or sys.stderr):
+            setup_start = time.perf_counter()
+            run = BENCHMARKS[name][1]()
+            # SDK 和客户端在第一次调用时才加载/创建; 提前做掉, wall_seconds 只算流水线本身 (import 耗时见 import_time.py)
+            for user, module in PRELOAD_MODULES.items():
+                if user in sys.modules:
+                    importlib.import_module(module)
+            from client_registry import get_client
+            get_client()
+            setup_seconds = time.perf_counter() - setup_start
+
+            start = time.perf_counter()
+            run()
+            wall_seconds = time.perf_counter() - start
+    finally:
+        if sink:
+            sink.close()
+        server.shutdown()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    engines = TELEMETRY.summary("engine")
+    agents = TELEMETRY.summary("agent")
+    total = lambda key: sum(row[key] for row in engines.values())
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "setup_seconds": round(setup_seconds, 4),
+        "llm_calls": total("calls"),
+        "llm_errors": total("errors"),
+        "retries": total("retries"),
+        "prompt_tokens": total("prompt_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "prompt_cache_hit_tokens": total("prompt_cache_hit_tokens"),
+        "cache_hits": total("cache_hits"),
+        "peak_rss_mb": _peak_rss_mb(),
+        "mock_requests": server.config.stats["requests"],
+        "stages": [
+            {k: round(v, 4) if isinstance(v, float) else v for k, v in stage.items()}
+            for stage in TELEMETRY.stage_summary()
+        ],
+        "agents": {
+            agent: {"calls": row["calls"], "prompt_tokens": row["prompt_tokens"],
+                    "completion_tokens": row["completion_tokens"],
+                    "prompt_cache_hit_ratio": row["prompt_cache_hit_ratio"]}
+            for agent, row in agents.items()
+        },
+    }
+
+
+# ========== 主进程: 调度、汇总、对比 ==========
+
+def _spawn(name: str, args) -> Dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", name,
+           "--profile", args.profile, "--seed", str(args.seed)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=args.timeout, cwd=REPO_ROOT)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    tail = "\n".join((proc.stderr or proc.stdout).strip().splitlines()[-15:])
+    raise RuntimeError(f"{name} 运行失败 (退出码 {proc.returncode}):\n{tail}")
+
+
+def _aggregate(runs: List[Dict]) -> Dict:
+    """多次运行取中位数; 阶段和 Agent 明细取最后一次"""
+    result = dict(runs[-1])
+    for key in ("wall_seconds", "setup_seconds", "llm_calls", "prompt_tokens", "completion_tokens", "peak_rss_mb"):
+        values = [r[key] for r in runs if r.get(key) is not None]
+        if values:
+            middle = statistics.median_low(values) if isinstance(values[0], int) else statistics.median(values)
+            result[key] = round(middle, 4)
+    result["runs"] = len(runs)
+    if len(runs) > 1:
+        result["wall_seconds_all"] = [r["wall_seconds"] for r in runs]
+    return result
+
+
+def run_benchmarks(args) -> Dict:
+    names = args.names or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"❌ 未知的基准: {', '.join(unknown)} (可选: {', '.join(BENCHMARKS)})")
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "profile": args.profile,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "benchmarks": {}
+    }
+
+    print(f"🏁 基准测试: {len(names)} 条流水线 × {args.repeat} 次 | Mock profile: {args.profile}\n")
+    for name in names:
+        runs = []
+        for i in range(args.repeat):
+            try:
+                runs.append(_spawn(name, args))
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(f"❌ {name}: {e}\n")
+                break
+        if not runs:
+            continue
+        result = _aggregate(runs)
+        report["benchmarks"][name] = result
+        rss = f"{result['peak_rss_mb']:.0f}MB" if result["peak_rss_mb"] is not None else "-"
+        hit_ratio = result.get("prompt_cache_hit_tokens", 0) / result["prompt_tokens"] if result["prompt_tokens"] else 0.0
+        print(f"✅ {name:12} | {result['wall_seconds']:7.2f}s | LLM 调用: {result['llm_calls']:3} 次 | "
+              f"Tokens: {result['prompt_tokens']:6}+{result['completion_tokens']:<6} | 前缀缓存: {hit_ratio:.0%} | 峰值内存: {rss}")
+        for stage in result["stages"]:
+            print(f"   ⏱️  {stage['stage']:20} | {stage['seconds']:6.2f}s | LLM 调用: {stage['calls']:3} 次")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    _write_json(output, report)
+    print(f"\n💾 结果: {output}")
+    if args.save_baseline:
+        _write_json(BASELINE_PATH, report)
+        print(f"📌 已保存为基线: {BASELINE_PATH}")
+    return report
+
+
+def _write_json(path: str, data: Dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def latest_result() -> Optional[str]:
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    return os.path.join(RESULTS_DIR, files[-1]) if files else None
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """逐项对比, 返回退化项列表; 指标都是越小越好"""
+    regressions = []
+    if current.get("profile") != baseline.get("profile"):
+        print(f"⚠️  Mock profile 不同 (当前 {current.get('profile')} / 基线 {baseline.get('profile')}), 时间指标不可比")
+
+    print(f"{'基准':12} | {'指标':18} | {'基线':>10} | {'当前':>10} | 变化")
+    print("-" * 70)
+    for name, row in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            print(f"{name:12} | (基线中没有, 跳过)")
+            continue
+        for metric in COMPARE_METRICS:
+            old, new = base.get(metric), row.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            flag = ""
+            if change > threshold:
+                flag = " ❌ 退化"
+                regressions.append(f"{name}.{metric}: {old} → {new} ({change:+.0%})")
+            elif change < -threshold:
+                flag = " 🚀 改进"
+            print(f"{name:12} | {metric:18} | {old:>10} | {new:>10} | {change:+.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent 流水线端到端基准测试")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--profile", default="fast", help="Mock LLM 的延迟分布 (instant/fast/deepseek/slow/heavy_tail)")
+    parser.add_argument("--seed", type=int, default=42, help="Mock LLM 的随机种子")
+    parser.add_argument("--verbose", action="store_true", help="worker 模式下显示流水线自身的输出")
+    sub = parser.add_subparsers(dest="command")
+
+    run_parser = sub.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("names", nargs="*", help="要跑的流水线, 默认全部")
+    run_parser.add_argument("--repeat", type=int, default=1, help="每条流水线跑几次 (取中位数)")
+    run_parser.add_argument("--profile", default="fast", help="Mock LLM 的延迟分布")
+    run_parser.add_argument("--seed", type=int, default=42, help="Mock LLM 的随机种子")
+    run_parser.add_argument("--timeout", type=float, default=600, help="单次运行超时 (秒)")
+    run_parser.add_argument("--output", help="结果文件, 默认 benchmarks/results/<时间>.json")
+    run_parser.add_argument("--save-baseline", action="store_true", help="同时保存为基线")
+    run_parser.add_argument("--compare", action="store_true", help="跑完后和基线对比")
+    run_parser.add_argument("--threshold", type=float, default=0.10, help="退化阈值 (相对变化)")
+
+    compare_parser = sub.add_parser("compare", help="对比结果和基线")
+    compare_parser.add_argument("current", nargs="?", help="结果文件, 默认最新一次")
+    compare_parser.add_argument("--baseline", default=BASELINE_PATH)
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="退化阈值 (相对变化)")
+
+    sub.add_parser("list", help="列出所有流水线")
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.profile, args.seed, verbose=args.verbose)
+        print(RESULT_MARKER + json.dumps(result, ensure_ascii=False))
+        return
+
+    if args.command == "list":
+        for name, (description, _) in BENCHMARKS.items():
+            print(f"{name:12} {description}")
+        return
+
+    if args.command == "run":
+        current = run_benchmarks(args)
+        if not args.compare:
+            return
+        baseline_path = BASELINE_PATH
+    elif args.command == "compare":
+        current_path = args.current or latest_result()
+        if not current_path:
+            raise SystemExit("❌ 没有结果文件, 先运行: python benchmarks/run_benchmarks.py run")
+        current = _read_json(current_path)
+        baseline_path = args.baseline
+    else:
+        parser.print_help()
+        return
+
+    if not os.path.exists(baseline_path):
+        raise SystemExit(f"❌ 没有基线: {baseline_path} (用 run --save-baseline 生成)")
+    print()
+    regressions = compare(current, _read_json(baseline_path), args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项退化 (阈值 {args.threshold:.0%}):")
+        for item in regressions:
+            print(f"   - {item}")
+        sys.exit(1)
+    print(f"\n✅ 没有超过 {args.threshold:.0%} 的退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+"""
+本地 Mock LLM 服务 - OpenAI 兼容的 /chat/completions
+学习目标:
+1. 不需要 DeepSeek Key 也能跑通所有 Agent (CI、离线环境、压测)
+2. 可配置延迟分布 (首 token 时间 + 生成速度)、错误注入 (429/500/超时)
+3. 支持流式输出和 tool_calls; 规划 JSON、ReAct 的 Action: 格式都能被 Agent 解析
+4. 可用脚本文件指定固定回复
+5. 模拟 DeepSeek 的前缀缓存: 与之前请求相同的前缀 (按 64 tokens 分块) 计入 prompt_cache_hit_tokens, 首 token 更快
+
+用法:
+    python tools/mock_llm_server.py --port 8808 --profile deepseek
+
+    export DEEPSEEK_BASE_URL=http://127.0.0.1:8808
+    export DEEPSEEK_API_KEY=mock
+    # MultiLLMManager 的五个引擎分别读取各自的 *_BASE_URL, 也可以一起指向这里
+    export INSIGHT_ENGINE_BASE_URL=http://127.0.0.1:8808  (MEDIA_ / QUERY_ / REPORT_ENGINE_, FORUM_HOST_ 同理)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import math
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from token_budget import count_tokens, count_message_tokens
+
+# ========== 延迟分布 ==========
+
+# ttft: 首 token 时间的中位数 (秒), sigma: 对数正态分布的离散度, tps: 生成速度 (tokens/秒)
+PROFILES = {
+    "instant": {"ttft": 0.0, "sigma": 0.0, "tps": 0},
+    "fast": {"ttft": 0.05, "sigma": 0.2, "tps": 500},
+    "deepseek": {"ttft": 0.8, "sigma": 0.4, "tps": 40},
+    "slow": {"ttft": 3.0, "sigma": 0.5, "tps": 15},
+    "heavy_tail": {"ttft": 0.5, "sigma": 1.0, "tps": 40},  # 少数请求特别慢, 用来测对冲
+}
+
+PREFIX_BLOCK_TOKENS = 64       # 前缀缓存的最小单位
+PREFIX_CACHE_ENTRIES = 50000   # 最多记住多少个前缀块
+
+
+class MockConfig:
+    """服务配置 (命令行参数或 start_server 的关键字参数)"""
+
+    def __init__(
+        self,
+        profile: str = "fast",
+        ttft: Optional[float] = None,
+        sigma: Optional[float] = None,
+        tps: Optional[float] = None,
+        output_tokens: int = 120,
+        error_429: float = 0.0,
+        error_500: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 30.0,
+        retry_after: float = 1.0,
+        script: Optional[str] = None,
+        seed: Optional[int] = None,
+        prefix_cache: bool = True,
+        cache_speedup: float = 0.5
+    ):
+        base = PROFILES[profile]
+        self.profile = profile
+        self.ttft = base["ttft"] if ttft is None else ttft
+        self.sigma = base["sigma"] if sigma is None else sigma
+        self.tps = base["tps"] if tps is None else tps
+        self.output_tokens = output_tokens
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.retry_after = retry_after
+        self.rules = load_script(script) if script else []
+        self.prefix_cache = prefix_cache
+        self.cache_speedup = cache_speedup  # 提示全部命中时首 token 时间缩短的比例
+        self.prefix_blocks = OrderedDict()  # 前缀块哈希 -> None (LRU)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "streams": 0, "tool_calls": 0, "injected_429": 0,
+                      "injected_500": 0, "injected_timeouts": 0, "scripted": 0,
+                      "prompt_tokens": 0, "prompt_cache_hit_tokens": 0}
+
+    def sample_ttft(self, cache_hit_ratio: float = 0.0) -> float:
+        """对数正态分布的首 token 时间; 前缀缓存命中的部分不用重新计算, 按比例缩短"""
+        if self.ttft <= 0:
+            return 0.0
+        with self.lock:
+            ttft = self.ttft * math.exp(self.sigma * self.rng.gauss(0, 1))
+        return ttft * (1 - self.cache_speedup * cache_hit_ratio)
+
+    def lookup_prefix(self, messages: List[Dict]) -> int:
+        """
+        前缀缓存: 返回命中的 tokens, 并记住本次请求的所有前缀块
+        和 DeepSeek 一样只认从头开始完全相同的部分, 中间任何一个字不同, 之后的块都不命中
+        """
+        if not self.prefix_cache:
+            return 0
+        blocks = _prefix_blocks(messages)
+        hit = 0
+        with self.lock:
+            for digest, tokens in blocks:
+                if digest not in self.prefix_blocks:
+                    break
+                self.prefix_blocks.move_to_end(digest)
+                hit += tokens
+            for digest, _ in blocks:
+                self.prefix_blocks[digest] = None
+                self.prefix_blocks.move_to_end(digest)
+            while len(self.prefix_blocks) > PREFIX_CACHE_ENTRIES:
+                self.prefix_blocks.popitem(last=False)
+        return hit
+
+    def sample_fault(self) -> Optional[str]:
+        """按配置的概率抽取要注入的故障"""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.error_429:
+            return "429"
+        if roll < self.error_429 + self.error_500:
+            return "500"
+        if roll < self.error_429 + self.error_500 + self.timeout_rate:
+            return "timeout"
+        return None
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+def _prefix_blocks(messages: List[Dict]) -> List[tuple]:
+    """把消息序列切成约 64 tokens 的块, 返回 [(到该块为止的前缀哈希, 块的 tokens)]"""
+    text = "".join(f"{m.get('role')}:{_text(m)}\n" for m in messages)
+    hasher = hashlib.sha1()
+    blocks, tokens = [], 0
+    for i in range(0, len(text), 16):
+        piece = text[i:i + 16]
+        hasher.update(piece.encode("utf-8"))
+        tokens += count_tokens(piece)
+        if tokens >= PREFIX_BLOCK_TOKENS:
+            blocks.append((hasher.hexdigest(), tokens))
+            tokens = 0
+    # 不足一块的尾巴不缓存
+    return blocks
+
+
+def load_script(path: str) -> List[Dict]:
+    """
+    读取脚本回复文件, 格式:
+    {"rules": [
+        {"match": "诺贝尔", "content": "固定回复"},
+        {"match": "天气", "tool_calls": [{"name": "get_weather", "arguments": {"city": "北京"}}]},
+        {"match": ".*", "error": 429, "times": 2}
+    ]}
+    match 是正则, 按最后一条消息匹配, 第一条命中的规则生效; times 用完后规则失效
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    rules = data["rules"] if isinstance(data, dict) else data
+    for rule in rules:
+        rule["pattern"] = re.compile(rule.get("match", ".*"), re.S)
+    return rules
+
+
+# ========== 回复生成 ==========
+
+def _text(message) -> str:
+    return str(message.get("content") or "")
+
+
+def _last_user_text(messages: List[Dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return _text(message)
+    return ""
+
+
+def _topic(text: str) -> str:
+    """从提示里提取主题/任务 (找不到就取开头)"""
+    for label in ("讨论主题", "主题", "任务", "原始任务", "用户问题", "问题"):
+        match = re.search(label + r"[:：]\s*(.+)", text)
+        if match:
+            return match.group(1).strip()[:60]
+    return text.strip().splitlines()[0][:60] if text.strip() else "该主题"
+
+
+def _filler(topic: str, tokens: int, rng: random.Random) -> str:
+    """生成大约 tokens 长度的确定性中文段落"""
+    sentences = [
+        f"关于{topic},现有信息显示整体趋势较为明确。",
+        "从数据来看,主要指标在近期保持稳定增长。",
+        "不同来源的观点存在一定分歧,需要结合更多证据判断。",
+        "短期内的影响有限,但长期意义值得持续关注。",
+        "建议从技术、市场和政策三个角度综合评估。",
+        "核心风险在于信息不完整和外部环境的不确定性。",
+    ]
+    parts = []
+    while count_tokens("".join(parts)) < tokens:
+        parts.append(rng.choice(sentences))
+    return "".join(parts)
+
+
+def _expression(text: str) -> Optional[str]:
+    """提取算式, 如 "15 的平方" -> 15**2"""
+    match = re.search(r"(\d+)\s*的平方", text)
+    if match:
+        return f"{match.group(1)}**2"
+    match = re.search(r"\d+(?:\.\d+)?(?:\s*[-+*/^%]\s*\(?\d+(?:\.\d+)?\)?)+", text)
+    return match.group(0).replace(" ", "") if match else None
+
+
+def _pick_tool(tools: List[Dict], text: str) -> Dict:
+    """按用户问题挑一个最相关的工具"""
+    def named(*keywords):
+        for tool in tools:
+            name = tool["function"]["name"].lower()
+            if any(k in name for k in keywords):
+                return tool
+        return None
+
+    if re.search(r"天气|气温|weather", text, re.I):
+        tool = named("weather")
+        if tool:
+            return tool
+    if _expression(text) or "计算" in text:
+        tool = named("calc", "math")
+        if tool:
+            return tool
+    return named("search") or tools[0]
+
+
+def _tool_arguments(tool: Dict, text: str) -> Dict:
+    """按 JSON Schema 生成参数"""
+    schema = tool["function"].get("parameters") or {}
+    properties = schema.get("properties") or {}
+    required = schema.get("required") or list(properties)
+    city = re.search(r"(北京|上海|广州|深圳|杭州|成都|南京|武汉|西安|东京|纽约|伦敦)", text)
+    arguments = {}
+    for name in required:
+        spec = properties.get(name, {})
+        if spec.get("type") in ("number", "integer"):
+            arguments[name] = 1
+        elif spec.get("type") == "boolean":
+            arguments[name] = True
+        elif name in ("city", "location"):
+            arguments[name] = city.group(1) if city else "北京"
+        elif name in ("expression", "expr"):
+            arguments[name] = _expression(text) or "1+1"
+        else:
+            arguments[name] = text.strip()[:50]
+    return arguments
+
+
+def generate_reply(request: Dict, config: MockConfig) -> Dict:
+    """
+    根据请求内容生成回复, 返回 {"content": str|None, "tool_calls": list|None}
+    规则顺序: 工具调用 > 规划 JSON > ReAct > SQL > 编号列表 > 普通段落 (脚本规则在这之前匹配)
+    """
+    messages = request.get("messages") or []
+    last = _text(messages[-1]) if messages else ""
+    prompt = "\n".join(_text(m) for m in messages)
+    # 固定指令可能放在 system 消息里 (前缀缓存友好的写法), 识别格式要求时一起看
+    cue = "\n".join(_text(m) for m in messages if m.get("role") == "system") + "\n" + last
+    rng = random.Random(prompt)  # 相同请求得到相同回复
+    limit = min(config.output_tokens, request.get("max_tokens") or config.output_tokens)
+
+    # 1. 工具调用: 带 tools 且最后一条还不是工具结果
+    tools = request.get("tools")
+    if tools and request.get("tool_choice") != "none" and messages and messages[-1].get("role") != "tool":
+        tool = _pick_tool(tools, last)
+        return {"content": None, "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {
+                "name": tool["function"]["name"],
+                "arguments": json.dumps(_tool_arguments(tool, last), ensure_ascii=False)
+            }
+        }]}
+    if messages and messages[-1].get("role") == "tool":
+        return {"content": f"根据工具返回的结果: {_text(messages[-1])[:100]}。" + _filler(_topic(prompt), limit // 2, rng)}
+
+    # 2. 任务规划 JSON (12_task_planning_agent)
+    if '"steps"' in cue and "JSON" in cue:
+        task = _topic(last)
+        plan = {
+            "task_analysis": f"任务分析:这个任务需要先搜索 {task} 的基本信息,再补充细节",
+            "steps": [
+                {"step": 1, "action": "web_search", "query": task, "purpose": "获取基本信息"},
+                {"step": 2, "action": "web_search", "query": f"{task} 最新进展", "purpose": "补充细节"}
+            ],
+            "final_goal": f"给出关于 {task} 的完整回答"
+        }
+        return {"content": json.dumps(plan, ensure_ascii=False, indent=2)}
+
+    # 3. 动态规划 / 记忆 Agent 的决策 JSON (13, 14): 第一轮继续搜索, 之后完成
+    if '"status"' in cue and "JSON" in cue:
+        task = _topic(last)
+        started = not re.search(r"尚未开始", last)
+        decision = {
+            "status": "completed" if started else "continue",
+            "reasoning": "已有足够信息, 可以给出答案" if started else "还没有任何信息, 需要先搜索",
+            "next_action": None if started else {"tool": "web_search", "query": task},
+            "action": None if started else {"type": "web_search", "query": task},
+            "final_answer": _filler(task, limit // 2, rng) if started else None
+        }
+        return {"content": json.dumps(decision, ensure_ascii=False, indent=2)}
+
+    # 4. ReAct: 还没有 Observation 时给出 Action, 有了之后给出 Answer
+    if any("ReAct" in _text(m) for m in messages if m.get("role") == "system"):
+        question = _last_user_text(messages[:2]) or last
+        if "Observation:" not in last:
+            expression = _expression(question)
+            if expression:
+                return {"content": f"Thought: 我需要先计算 {expression}\nAction: calculate: {expression}"}
+            return {"content": f"Thought: 我需要搜索相关信息\nAction: web_search: {question[:50]}"}
+        return {"content": f"Thought: 我已经得到足够的信息\nAnswer: {_filler(_topic(question), limit // 2, rng)}"}
+
+    # 5. SQL 生成
+    if "只返回SQL" in cue or re.search(r"SQL:\s*$", last):
+        return {"content": "SELECT platform, COUNT(*) AS post_count, AVG(likes) AS avg_likes "
+                           "FROM posts GROUP BY platform ORDER BY post_count DESC LIMIT 10"}
+
+    # 6. 编号列表
+    if "每行一个" in cue:
+        topic = _topic(last)
+        return {"content": "\n".join(f"{i}. {topic} 的第 {i} 个分析角度是什么?" for i in range(1, 4))}
+
+    # 7. 普通段落
+    return {"content": _filler(_topic(last), limit, rng)}
+
+
+def _scripted(request: Dict, config: MockConfig) -> Optional[Dict]:
+    """匹配脚本规则"""
+    messages = request.get("messages") or []
+    last = _text(messages[-1]) if messages else ""
+    with config.lock:
+        for rule in config.rules:
+            if rule.get("times") == 0 or not rule["pattern"].search(last):
+                continue
+            if "times" in rule:
+                rule["times"] -= 1
+            return rule
+    return None
+
+
+# ========== HTTP 服务 ==========
+
+def _usage(request: Dict, completion: str, tool_calls: Optional[List], cache_hit: int = 0) -> Dict:
+    prompt_tokens = count_message_tokens(request.get("messages") or [])
+    cache_hit = min(cache_hit, prompt_tokens)
+    completion_tokens = count_tokens(completion or "") + sum(
+        count_tokens(c["function"]["arguments"]) for c in tool_calls or []
+    )
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": cache_hit,
+        "prompt_cache_miss_tokens": prompt_tokens - cache_hit
+    }
+
+
+def _hit_ratio(usage: Dict) -> float:
+    return usage["prompt_cache_hit_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions (也接受 /v1/ 前缀)"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, 与真实服务一致
+    config: MockConfig = None
+
+    def log_message(self, *args):
+        pass  # 不打印访问日志
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict] = None):
+        error_type = "rate_limit_error" if status == 429 else "server_error"
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": status}}, headers)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path in ("/models", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "deepseek-chat", "object": "model"}]})
+        elif path == "/stats":
+            self._send_json(200, self.config.stats)
+        else:
+            self._send_error(404, "not found")
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_error(404, "not found")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "invalid JSON")
+            return
+
+        config = self.config
+        config.count("requests")
+
+        # 脚本规则优先, 其次随机故障
+        rule = _scripted(request, config)
+        fault = None
+        if rule is not None:
+            config.count("scripted")
+            if rule.get("delay"):
+                time.sleep(rule["delay"])
+            if rule.get("error"):
+                fault = "timeout" if rule["error"] == "timeout" else str(rule["error"])
+        else:
+            fault = config.sample_fault()
+
+        if fault == "timeout":
+            config.count("injected_timeouts")
+            time.sleep(config.timeout_seconds)  # 客户端超时先触发
+            self._send_error(504, "mock timeout")
+            return
+        if fault is not None:
+            status = int(fault)
+            config.count("injected_429" if status == 429 else "injected_500")
+            headers = {"Retry-After": str(config.retry_after)} if status == 429 else None
+            self._send_error(status, f"mock injected {status}", headers)
+            return
+
+        if rule is not None and ("content" in rule or "tool_calls" in rule):
+            reply = {"content": rule.get("content"), "tool_calls": [
+                {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                 "function": {"name": c["name"], "arguments": json.dumps(c.get("arguments", {}), ensure_ascii=False)}}
+                for c in rule.get("tool_calls", [])
+            ] or None}
+        else:
+            reply = generate_reply(request, config)
+        if reply.get("tool_calls"):
+            config.count("tool_calls")
+
+        usage = _usage(request, reply.get("content"), reply.get("tool_calls"),
+                       config.lookup_prefix(request.get("messages") or []))
+        config.count("prompt_tokens", usage["prompt_tokens"])
+        config.count("prompt_cache_hit_tokens", usage["prompt_cache_hit_tokens"])
+
+        if request.get("stream"):
+            config.count("streams")
+            self._stream(request, reply, usage)
+        else:
+            self._complete(request, reply, usage)
+
+    def _complete(self, request: Dict, reply: Dict, usage: Dict):
+        content, tool_calls = reply.get("content"), reply.get("tool_calls")
+        tps = self.config.tps
+        ttft = self.config.sample_ttft(_hit_ratio(usage))
+        time.sleep(ttft + (usage["completion_tokens"] / tps if tps else 0))
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": usage
+        })
+
+    def _stream(self, request: Dict, reply: Dict, usage: Dict):
+        content, tool_calls = reply.get("content"), reply.get("tool_calls")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        model = request.get("model", "deepseek-chat")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")  # 流结束即关闭连接, 不用 chunked 编码
+        self.end_headers()
+        self.close_connection = True
+
+        def send(delta: Dict, finish_reason=None, chunk_usage=None):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            }
+            if chunk_usage is not None:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(self.config.sample_ttft(_hit_ratio(usage)))
+        send({"role": "assistant", "content": ""})
+        if tool_calls:
+            send({"tool_calls": [{**call, "index": i} for i, call in enumerate(tool_calls)]})
+        else:
+            pieces = re.findall(r".{1,8}", content or "", re.S)  # 每块约几个 token
+            for piece in pieces:
+                if self.config.tps:
+                    time.sleep(count_tokens(piece) / self.config.tps)
+                send({"content": piece})
+        send({}, finish_reason="tool_calls" if tool_calls else "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send(None, chunk_usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, **config) -> ThreadingHTTPServer:
+    """创建服务 (port=0 时自动选端口), 地址见 server.base_url, 配置和统计见 server.config"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": MockConfig(**config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.config = handler.config
+    return server
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **config) -> ThreadingHTTPServer:
+    """在后台线程启动服务 (供压测 / 基准测试在进程内使用)"""
+    server = make_server(host, port, **config)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地 Mock LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="延迟分布")
+    parser.add_argument("--ttft", type=float, help="首 token 时间中位数 (秒), 覆盖 profile")
+    parser.add_argument("--sigma", type=float, help="首 token 时间的对数正态离散度, 覆盖 profile")
+    parser.add_argument("--tps", type=float, help="生成速度 tokens/秒, 0 表示不限, 覆盖 profile")
+    parser.add_argument("--output-tokens", type=int, default=120, help="普通回复的长度")
+    parser.add_argument("--error-429", type=float, default=0.0, help="注入 429 的概率")
+    parser.add_argument("--error-500", type=float, default=0.0, help="注入 500 的概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="注入超时的概率")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="超时请求挂起多久")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--script", help="脚本回复文件 (JSON)")
+    parser.add_argument("--seed", type=int, help="随机种子 (延迟和故障可复现)")
+    parser.add_argument("--no-prefix-cache", dest="prefix_cache", action="store_false", help="关闭前缀缓存模拟")
+    parser.add_argument("--cache-speedup", type=float, default=0.5, help="提示全部命中缓存时首 token 时间缩短的比例")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("host", "port")}
+    server = make_server(args.host, args.port, **config)
+    base_url = server.base_url
+
+    print(f"🧪 Mock LLM 服务已启动: {base_url}  (profile: {args.profile})")
+    print("   让 Agent 指向它:")
+    print(f"   export DEEPSEEK_BASE_URL={base_url} DEEPSEEK_API_KEY=mock")
+    for prefix in ("INSIGHT_ENGINE", "MEDIA_ENGINE", "QUERY_ENGINE", "REPORT_ENGINE", "FORUM_HOST"):
+        print(f"   export {prefix}_BASE_URL={base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 统计: {json.dumps(server.config.stats, ensure_ascii=False)}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+多主题批量分析 - 一次跑一批主题的 BettaFish 工作流
+学习目标:
+1. LLM 调用是 I/O 密集的: 所有主题在同一个事件循环里并发, 用信号量限制同时在跑的主题数
+2. 每个 LLM 提供方的并发 / RPM 上限仍由全局限流器控制, 主题再多也不会把提供方打爆;
+   每个主题是全局调度器里的一个作业, LLM / 搜索 / 数据库名额在主题之间公平轮转
+3. 报告的后处理 (关键词、情感倾向、结构统计) 是 CPU 密集的, 可以放进进程池, 不占事件循环
+4. 每个主题的报告、日志和指标各写一个文件; 最后打印汇总表: 成功/失败数、吞吐量 (主题/分钟)
+
+用法:
+    python tools/topic_runner.py topics.txt                        # 每行一个主题, # 开头为注释
+    python tools/topic_runner.py -t "2024年诺贝尔物理学奖的意义" -t "AI Agent 的发展趋势"
+    python tools/topic_runner.py topics.txt --concurrency 8 --processes 4 --llm-concurrency 16
+    python tools/topic_runner.py topics.txt --workflow integrated  # 跑 Day 8 的完整分析系统
+    python tools/topic_runner.py topics.txt --output-dir reports/topics/daily --resume   # 跳过已成功的主题
+    python tools/topic_runner.py topics.txt --mock                 # 在本地 Mock LLM 上跑 (不需要 API Key)
+
+输出目录 (默认 reports/topics/<时间戳>/):
+    001_<主题>.md / .log / .json   每个主题的报告、完整输出和指标
+    summary.json                    汇总
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import contextvars
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+sys.path.append(os.path.join(REPO_ROOT, 'week1/day4'))
+sys.path.append(os.path.join(REPO_ROOT, 'week2/day6'))
+sys.path.append(os.path.join(REPO_ROOT, 'week2/day7'))
+sys.path.append(os.path.join(REPO_ROOT, 'week2/day8'))
+sys.path.append(os.path.join(REPO_ROOT, 'tools'))
+
+DEFAULT_OUTPUT_ROOT = os.path.join("reports", "topics")
+WORKFLOWS = ("bettafish", "integrated")
+
+
+# ========== 主题列表 ==========
+
+def load_topics(path: str) -> List[str]:
+    """读取主题文件: 每行一个主题, 也支持 JSONL ({"topic": ...}); "-" 表示标准输入"""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    topics = []
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["topic"]
+            topics.append(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return topics
+
+
+def topic_slug(index: int, topic: str, max_chars: int = 40) -> str:
+    """文件名: 序号 + 主题 (保留中文、字母和数字), 序号保证同名主题不冲突"""
+    slug = re.sub(r"[^\w一-鿿]+", "_", topic).strip("_")[:max_chars]
+    return f"{index:03d}_{slug or 'topic'}"
+
+
+# ========== 报告后处理 (CPU 密集, 可在子进程中运行) ==========
+
+# 模块级函数和常量, 子进程按模块名导入, 不能依赖主进程里的任何对象
+POSITIVE_WORDS = ("增长", "提升", "突破", "利好", "积极", "创新", "领先", "成功", "机遇", "改善", "优势", "认可")
+NEGATIVE_WORDS = ("下降", "风险", "担忧", "争议", "负面", "危机", "下滑", "质疑", "挑战", "损失", "问题", "不足")
+STOP_CHARS = set("的了是在和与及或等这那其之为对就也都而且但并从以于把被让给个们中上下")
+
+
+def analyze_report(report: str, top_k: int = 10) -> Dict:
+    """
+    报告后处理: 结构统计 + 高频关键词 + 情感倾向
+
+    关键词按中文二元组 / 英文单词计数 (不依赖分词库); 情感倾向 = (正面词 - 负面词) / 总数, 范围 [-1, 1]
+    """
+    headings = [line for line in report.splitlines() if line.lstrip().startswith("#")]
+    bullets = [line for line in report.splitlines() if re.match(r"\s*([-*•]|\d+[.、])\s", line)]
+
+    grams = Counter()
+    for run in re.findall(r"[一-鿿]+", report):
+        for i in range(len(run) - 1):
+            gram = run[i:i + 2]
+            if gram[0] not in STOP_CHARS and gram[1] not in STOP_CHARS:
+                grams[gram] += 1
+    for word in re.findall(r"[A-Za-z][A-Za-z0-9\-]{2,}", report):
+        grams[word.lower()] += 1
+
+    positive = sum(report.count(word) for word in POSITIVE_WORDS)
+    negative = sum(report.count(word) for word in NEGATIVE_WORDS)
+    total = positive + negative
+
+    return {
+        "chars": len(report),
+        "headings": len(headings),
+        "bullets": len(bullets),
+        "keywords": [word for word, count in grams.most_common(top_k) if count > 1],
+        "sentiment": round((positive - negative) / total, 3) if total else 0.0,
+        "positive_hits": positive,
+        "negative_hits": negative,
+    }
+
+
+# ========== 按主题分流的标准输出 ==========
+
+# 当前协程 / 线程所属主题的日志文件; 未设置时写到原来的终端
+_topic_log = contextvars.ContextVar("topic_log", default=None)
+
+
+class TopicStdout:
+    """
+    替换 sys.stdout: 各主题的 print 写进自己的日志文件, 不在终端上交错
+    asyncio 任务和 to_thread 都会复制 contextvars, 所以工作流内部再并发也能分对
+    """
+
+    def __init__(self, console):
+        self.console = console
+
+    def write(self, text: str) -> int:
+        log = _topic_log.get()
+        if log is not None and log.closed:  # 超时后仍在后台线程里跑完的主题, 输出直接丢弃
+            return len(text)
+        return (log or self.console).write(text)
+
+    def flush(self):
+        log = _topic_log.get()
+        if log is None or not log.closed:
+            (log or self.console).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.console, name)
+
+
+# ========== 工作流 ==========
+
+class TopicRunner:
+    """多主题并发执行器"""
+
+    def __init__(
+        self,
+        topics: List[str],
+        workflow: str = "bettafish",
+        output_dir: Optional[str] = None,
+        concurrency: int = 4,
+        processes: int = 0,
+        timeout: Optional[float] = None,
+        resume: bool = False,
+        hedge: bool = False
+    ):
+        """
+        Args:
+            concurrency: 同时在跑的主题数上限 (LLM 调用另受全局限流器约束)
+            processes: 后处理进程数, 0 表示在事件循环线程里直接算
+            timeout: 单个主题的超时秒数, 超时记为失败
+            resume: 输出目录里已成功的主题直接沿用结果, 不重跑
+            hedge: bettafish 工作流的并行分析是否开启对冲
+        """
+        if workflow not in WORKFLOWS:
+            raise ValueError(f"未知的工作流: {workflow}, 可选: {WORKFLOWS}")
+        self.topics = topics
+        self.workflow = workflow
+        self.output_dir = output_dir or os.path.join(DEFAULT_OUTPUT_ROOT, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.concurrency = max(1, concurrency)
+        self.processes = processes
+        self.timeout = timeout
+        self.resume = resume
+        self.hedge = hedge
+        self.manager = None
+        self.rows: List[Dict] = []
+        self._done = 0
+        self._console_lock = threading.Lock()
+
+    # ----- 单个主题 -----
+
+    async def _run_bettafish(self, topic: str) -> str:
+        """并行分析 → Forum 综合 → 报告, 全程在事件循环里, 所有主题共享一个 MultiLLMManager"""
+        from telemetry import TELEMETRY
+        with TELEMETRY.stage("1_parallel_analysis"):
+            agent_results = await self.manager.aparallel_analysis(topic, hedge=self.hedge)
+        with TELEMETRY.stage("2_forum_synthesis"):
+            synthesis = await self.manager.aforum_synthesis(agent_results)
+        with TELEMETRY.stage("3_generate_report"):
+            return await self.manager.agenerate_report(synthesis, topic)
+
+    def _run_integrated(self, topic: str) -> str:
+        """Day 8 的完整系统是同步代码, 在线程池里跑"""
+        from integrated_system import IntegratedAnalysisSystem
+        return IntegratedAnalysisSystem(topic).run_analysis()
+
+    async def _run_topic(self, index: int, topic: str, semaphore: asyncio.Semaphore,
+                         threads: ThreadPoolExecutor, processes: Optional[ProcessPoolExecutor]) -> Dict:
+        slug = topic_slug(index, topic)
+        paths = {ext: os.path.join(self.output_dir, f"{slug}.{ext}") for ext in ("md", "log", "json")}
+
+        if self.resume and os.path.exists(paths["json"]):
+            with open(paths["json"], encoding="utf-8") as f:
+                previous = json.load(f)
+            if previous.get("status") == "ok":
+                previous["resumed"] = True
+                self._progress(previous)
+                return previous
+
+        from governor import job_context
+        row = {"index": index, "topic": topic, "slug": slug, "status": "ok", "error": None}
+        async with semaphore:
+            start = time.perf_counter()
+            with open(paths["log"], "w", encoding="utf-8") as log, job_context(slug):
+                token = _topic_log.set(log)
+                try:
+                    if self.workflow == "bettafish":
+                        coro = self._run_bettafish(topic)
+                    else:
+                        loop = asyncio.get_running_loop()
+                        context = contextvars.copy_context()
+                        coro = loop.run_in_executor(threads, context.run, self._run_integrated, topic)
+                    report = await asyncio.wait_for(coro, self.timeout)
+                    row["seconds"] = round(time.perf_counter() - start, 3)
+
+                    with open(paths["md"], "w", encoding="utf-8") as f:
+                        f.write(f"# {topic}\n\n{report}\n")
+
+                    if processes:
+                        analysis = await asyncio.get_running_loop().run_in_executor(processes, analyze_report, report)
+                    else:
+                        analysis = analyze_report(report)
+                    row.update(analysis)
+                except asyncio.TimeoutError:
+                    row["status"] = "timeout"
+                    row["error"] = f"超过 {self.timeout}s"
+                except Exception as e:
+                    row["status"] = "error"
+                    row["error"] = f"{type(e).__name__}: {e}"
+                    print(f"\n❌ 失败: {row['error']}")
+                finally:
+                    _topic_log.reset(token)
+            row.setdefault("seconds", round(time.perf_counter() - start, 3))
+
+        with open(paths["json"], "w", encoding="utf-8") as f:
+            json.dump(row, f, ensure_ascii=False, indent=2)
+        self._progress(row)
+        return row
+
+    def _progress(self, row: Dict):
+        with self._console_lock:
+            self._done += 1
+            icon = {"ok": "✅", "timeout": "⏰"}.get(row["status"], "❌")
+            extra = " (沿用上次结果)" if row.get("resumed") else f" | {row['seconds']:.1f}s"
+            if row["error"]:
+                extra += f" | {row['error']}"
+            print(f"{icon} [{self._done}/{len(self.topics)}] {row['topic']}{extra}", file=sys.__stdout__, flush=True)
+
+    # ----- 整批 -----
+
+    async def arun(self) -> Dict:
+        """并发跑完所有主题, 返回汇总"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.workflow == "bettafish":
+            from multi_llm_manager import MultiLLMManager
+            self.manager = MultiLLMManager()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        threads = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="topic")
+        processes = ProcessPoolExecutor(max_workers=self.processes) if self.processes > 0 else None
+
+        console = sys.stdout
+        sys.stdout = TopicStdout(console)
+        start = time.perf_counter()
+        try:
+            self.rows = await asyncio.gather(*[
+                self._run_topic(index, topic, semaphore, threads, processes)
+                for index, topic in enumerate(self.topics, 1)
+            ])
+        finally:
+            wall_seconds = time.perf_counter() - start
+            sys.stdout = console
+            threads.shutdown(wait=False)
+            if processes:
+                processes.shutdown()
+
+        summary = self._summarize(wall_seconds)
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+    def run(self) -> Dict:
+        return asyncio.run(self.arun())
+
+    def _summarize(self, wall_seconds: float) -> Dict:
+        from telemetry import TELEMETRY
+        from governor import GOVERNOR
+        from multi_llm_manager import percentile
+
+        ran = [row for row in self.rows if not row.get("resumed")]
+        succeeded = [row for row in ran if row["status"] == "ok"]
+        failures = Counter(row["status"] for row in ran if row["status"] != "ok")
+        latencies = [row["seconds"] for row in succeeded]
+        engines = TELEMETRY.summary("engine")
+        total = lambda key: sum(row[key] for row in engines.values())
+
+        return {
+            "workflow": self.workflow,
+            "output_dir": self.output_dir,
+            "concurrency": self.concurrency,
+            "processes": self.processes,
+            "topics": len(self.topics),
+            "ran": len(ran),
+            "resumed": len(self.rows) - len(ran),
+            "succeeded": len(succeeded),
+            "failed": sum(failures.values()),
+            "failures": dict(failures),
+            "wall_seconds": round(wall_seconds, 3),
+            "topics_per_minute": round(len(succeeded) / wall_seconds * 60, 2) if wall_seconds else None,
+            "topic_p50_seconds": percentile(latencies, 50),
+            "topic_p95_seconds": percentile(latencies, 95),
+            "llm_calls": total("calls"),
+            "llm_errors": total("errors"),
+            "prompt_tokens": total("prompt_tokens"),
+            "completion_tokens": total("completion_tokens"),
+            "pools": GOVERNOR.get_stats(),
+            "rows": self.rows,
+        }
+
+
+# ========== 汇总表 ==========
+
+def _width(text: str) -> int:
+    """终端显示宽度: 中文等全角字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+
+def _cell(text: str, width: int) -> str:
+    """截断并补齐到指定显示宽度"""
+    if _width(text) > width:
+        while _width(text) > width - 1:
+            text = text[:-1]
+        text += "…"
+    return text + " " * (width - _width(text))
+
+
+def print_summary(summary: Dict):
+    print(f"\n{'='*78}")
+    print(f"📋 多主题分析汇总 ({summary['workflow']})")
+    print(f"{'='*78}")
+    print(f"{'#':>4}  {_cell('主题', 32)} {_cell('状态', 8)} {'耗时':>6} {'字数':>4} {'情感':>4}  关键词")
+    for row in summary["rows"]:
+        status = "沿用" if row.get("resumed") else row["status"]
+        seconds = f"{row['seconds']:.1f}s" if "seconds" in row else "-"
+        chars = str(row.get("chars", "-"))
+        sentiment = f"{row['sentiment']:+.2f}" if "sentiment" in row else "-"
+        keywords = "、".join(row.get("keywords", [])[:4]) or (row["error"] or "")
+        print(f"{row['index']:>4}  {_cell(row['topic'], 32)} {_cell(status, 8)} {seconds:>8} {chars:>6} {sentiment:>6}  {_cell(keywords, 30).rstrip()}")
+    print("-"*78)
+
+    failures = ", ".join(f"{status} {count}" for status, count in summary["failures"].items())
+    print(f"✅ 成功: {summary['succeeded']}/{summary['ran']} | ❌ 失败: {summary['failed']}" +
+          (f" ({failures})" if failures else "") +
+          (f" | ⏭️ 沿用: {summary['resumed']}" if summary["resumed"] else ""))
+    throughput = summary["topics_per_minute"]
+    print(f"⏱️  总耗时: {summary['wall_seconds']:.1f}s | 吞吐量: {throughput if throughput is not None else '-'} 主题/分钟 | "
+          f"并发: {summary['concurrency']} | 后处理进程: {summary['processes'] or '无'}")
+    if summary["topic_p50_seconds"] is not None:
+        print(f"📊 单主题耗时 p50: {summary['topic_p50_seconds']:.1f}s | p95: {summary['topic_p95_seconds']:.1f}s")
+    print(f"🤖 LLM 调用: {summary['llm_calls']} 次 (错误 {summary['llm_errors']}) | "
+          f"Tokens: {summary['prompt_tokens']} 输入 + {summary['completion_tokens']} 输出")
+    for pool in summary.get("pools", []):
+        p95 = f"{pool['wait_p95']:.2f}s" if pool["wait_p95"] is not None else "-"
+        print(f"🎛️  {pool['name']} | 上限: {pool['capacity']} | 排队峰值: {pool['max_queue_depth']} | "
+              f"等待 p95: {p95}, 累计 {pool['total_wait']:.1f}s")
+    print(f"📁 输出目录: {summary['output_dir']}")
+    print(f"{'='*78}\n")
+
+
+# ========== 命令行 ==========
+
+def main():
+    parser = argparse.ArgumentParser(description="多主题并发运行 BettaFish 工作流")
+    parser.add_argument("topics_file", nargs="?", help="主题文件 (每行一个主题, 或 JSONL; '-' 为标准输入)")
+    parser.add_argument("-t", "--topic", action="append", default=[], help="直接指定主题, 可重复")
+    parser.add_argument("--workflow", choices=WORKFLOWS, default="bettafish",
+                        help="bettafish: MultiLLMManager 三阶段流程; integrated: Day 8 完整分析系统")
+    parser.add_argument("--output-dir", help=f"输出目录, 默认 {DEFAULT_OUTPUT_ROOT}/<时间戳>")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时在跑的主题数")
+    parser.add_argument("--processes", type=int, default=0, help="报告后处理的进程数, 0 表示不用进程池")
+    parser.add_argument("--llm-concurrency", type=int, help="每个 LLM 提供方的并发上限 (LLM_MAX_CONCURRENCY)")
+    parser.add_argument("--rpm", type=int, help="每个 LLM 提供方的每分钟请求上限 (LLM_RATE_LIMIT_RPM)")
+    parser.add_argument("--pools", help='全局调度器的池大小, 如 "llm=24,tavily=2,sqlite=4" (GOVERNOR_POOLS)')
+    parser.add_argument("--timeout", type=float, help="单个主题的超时秒数")
+    parser.add_argument("--resume", action="store_true", help="跳过输出目录中已成功的主题 (需配合 --output-dir)")
+    parser.add_argument("--hedge", action="store_true", help="并行分析阶段开启对冲请求")
+    parser.add_argument("--mock", action="store_true", help="启动本地 Mock LLM 服务, 所有引擎指向它")
+    parser.add_argument("--mock-profile", default="fast", help="Mock 服务的延迟分布")
+    args = parser.parse_args()
+
+    topics = (load_topics(args.topics_file) if args.topics_file else []) + args.topic
+    if not topics:
+        parser.error("请提供主题文件或 --topic")
+
+    # 限流器和各引擎在 import 时读取环境变量, 必须在加载工作流之前设置
+    if args.llm_concurrency:
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.rpm:
+        os.environ["LLM_RATE_LIMIT_RPM"] = str(args.rpm)
+    if args.pools:
+        os.environ["GOVERNOR_POOLS"] = args.pools
+    server = None
+    if args.mock:
+        from mock_llm_server import start_server
+        server = start_server(profile=args.mock_profile)
+        # 直接覆盖而不是 setdefault: mock 运行不能带上开发者的真实 Key
+        os.environ["DEEPSEEK_BASE_URL"] = server.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "mock"
+        os.environ["TAVILY_API_KEY"] = "mock"
+        for prefix in ("INSIGHT_ENGINE", "MEDIA_ENGINE", "QUERY_ENGINE", "REPORT_ENGINE", "FORUM_HOST"):
+            os.environ[f"{prefix}_BASE_URL"] = server.base_url
+        print(f"🧪 Mock LLM: {server.base_url} ({args.mock_profile})")
+
+    print(f"🗂️  {len(topics)} 个主题 | 工作流: {args.workflow} | 并发: {args.concurrency}")
+    runner = TopicRunner(
+        topics,
+        workflow=args.workflow,
+        output_dir=args.output_dir,
+        concurrency=args.concurrency,
+        processes=args.processes,
+        timeout=args.timeout,
+        resume=args.resume,
+        hedge=args.hedge
+    )
+    try:
+        summary = runner.run()
+    finally:
+        if server:
+            server.shutdown()
+
+    print_summary(summary)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+批量推理 - 离线重跑成千上万个请求
+学习目标:
+1. 请求写成 JSONL 批文件, 每行一个 custom_id
+2. 有界 worker 池并发消费, 吞吐量由限流器 (RPM/TPM/并发窗口) 决定, 调用方不用逐个等待
+3. 结果按 custom_id 逐行追加到结果文件; 进程崩溃后用同一个 batch_id 重新提交, 已完成的请求直接跳过
+4. batch_id 带随机后缀, 同一秒提交的两个批次不会共用文件; 已有批次的请求文件不会被另一批请求覆盖
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+DEFAULT_BATCH_DIR = os.getenv("LLM_BATCH_DIR", "week1/day4/batches")
+PROGRESS_EVERY = 50  # 每完成多少个请求打印一次进度
+
+
+# ========== 批文件读写 ==========
+
+def batch_paths(batch_id: str, batch_dir: str = DEFAULT_BATCH_DIR):
+    """批次的 (请求文件, 结果文件) 路径"""
+    return (
+        os.path.join(batch_dir, f"{batch_id}.jsonl"),
+        os.path.join(batch_dir, f"{batch_id}.results.jsonl")
+    )
+
+
+def write_batch_file(path: str, requests: Iterable[Dict]) -> int:
+    """
+    写请求文件, 返回请求数; custom_id 缺失或重复时报错
+    文件已存在时只允许内容完全相同 (续跑); 内容不同说明 batch_id 撞了别的批次, 报 FileExistsError,
+    否则旧结果文件里的 custom_id 会被当成新请求已完成而跳过
+    """
+    seen = set()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for request in requests:
+            custom_id = request.get("custom_id")
+            if not custom_id:
+                raise ValueError(f"批量请求缺少 custom_id: {request}")
+            if custom_id in seen:
+                raise ValueError(f"custom_id 重复: {custom_id}")
+            seen.add(custom_id)
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    if os.path.exists(path):
+        with open(path, "rb") as old, open(tmp_path, "rb") as new:
+            same = old.read() == new.read()
+        os.remove(tmp_path)
+        if not same:
+            raise FileExistsError(f"批次文件已存在且请求不同: {path} (换一个 batch_id, 或 requests=None 续跑)")
+        return len(seen)
+    os.replace(tmp_path, path)  # 原子替换, 中途崩溃不会留下半个请求文件
+    return len(seen)
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    """逐行读取 JSONL, 跳过空行和崩溃时写了一半的行"""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    """结果文件 -> {custom_id: 记录}; 同一个 custom_id 以最后一条为准 (续跑时失败的请求会重试)"""
+    return {record["custom_id"]: record for record in read_jsonl(path) if "custom_id" in record}
+
+
+def completed_ids(path: str) -> Set[str]:
+    """已成功完成的 custom_id"""
+    return {custom_id for custom_id, record in load_results(path).items() if record.get("status") == "ok"}
+
+
+def _repair_tail(path: str):
+    """进程崩溃可能留下没有换行结尾的半行, 截掉它, 否则续跑追加的第一条记录会和它粘在一起"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+# ========== 批次句柄 ==========
+
+class BatchJob:
+    """一次批量提交; 在后台执行, 调用方用 wait() / progress() 查看"""
+
+    def __init__(self, batch_id: str, input_path: str, output_path: str, total: int, skipped: int = 0):
+        self.batch_id = batch_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.total = total          # 请求文件中的请求数
+        self.skipped = skipped      # 续跑时已完成、跳过的请求数
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.future = None          # concurrent.futures.Future, 由提交方设置
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.skipped
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def record(self, record: Dict):
+        with self._lock:
+            if record["status"] == "ok":
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            finished = self.succeeded + self.failed
+        if finished % PROGRESS_EVERY == 0 or finished == self.pending:
+            stats = self.progress()
+            print(f"📦 批次 {self.batch_id}: {finished}/{self.pending} | 失败 {self.failed} | "
+                  f"{stats['throughput']:.1f} req/s")
+
+    def wait(self, timeout: Optional[float] = None) -> "BatchJob":
+        """等待批次跑完; 批次本身出错 (如请求文件损坏) 时抛出异常"""
+        self.future.result(timeout)
+        return self
+
+    def progress(self) -> Dict:
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.started
+        finished = self.succeeded + self.failed
+        return {
+            "batch_id": self.batch_id,
+            "total": self.total,
+            "skipped": self.skipped,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "remaining": self.pending - finished,
+            "elapsed": round(elapsed, 2),
+            "throughput": finished / elapsed if elapsed > 0 else 0.0,
+            "done": self.done
+        }
+
+
+def new_batch_id() -> str:
+    """时间戳便于按时间排序, 随机后缀保证并发提交不撞名"""
+    return f"{datetime.now():batch_%Y%m%d_%H%M%S_%f}_{uuid.uuid4().hex[:8]}"
+
+
+# ========== 执行 ==========
+
+async def run_batch(
+    job: BatchJob,
+    call: Callable[[Dict], Awaitable[str]],
+    concurrency: int
+) -> BatchJob:
+    """
+    用 concurrency 个 worker 消费请求文件中未完成的请求
+    每个结果立即追加写入结果文件并 flush, 崩溃时最多丢失正在进行中的请求
+    """
+    _repair_tail(job.output_path)
+    done_ids = completed_ids(job.output_path)
+    # 请求文件逐行读, 不把几千个请求一次性放进内存
+    pending = (r for r in read_jsonl(job.input_path) if r["custom_id"] not in done_ids)
+
+    with open(job.output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            # 单线程事件循环里共享同一个生成器和文件句柄是安全的
+            for request in pending:
+                start = time.perf_counter()
+                record = {"custom_id": request["custom_id"], "agent_type": request.get("agent_type")}
+                try:
+                    record["result"] = await call(request)
+                    record["status"] = "ok"
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = f"{type(e).__name__}: {e}"
+                record["latency"] = round(time.perf_counter() - start, 3)
+                record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                job.record(record)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, job.pending)))])
+
+    job.finished = time.perf_counter()
+    return job
+
+
+def count_requests(path: str) -> int:
+    return sum(1 for _ in read_jsonl(path))
+
+
+def summarize(results: Dict[str, Dict]) -> Dict:
+    """结果汇总: 成功/失败数和失败的 custom_id"""
+    failed: List[str] = [custom_id for custom_id, r in results.items() if r.get("status") != "ok"]
+    return {"total": len(results), "succeeded": len(results) - len(failed), "failed": failed}
@@ -0,0 +1,181 @@
+"""
+熔断器 + 健康评分
+学习目标:
+1. 三种状态: closed (正常) → open (熔断, 直接失败) → half_open (放一个探测请求)
+2. 端点挂掉时只付出一个探测间隔的代价, 而不是每次调用都重试退避
+3. 按近期错误率和延迟给引擎打健康分, 用于路由
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+DEFAULT_PROBE_INTERVAL = float(os.getenv("LLM_BREAKER_PROBE_INTERVAL", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态, 请求未发出"""
+
+
+def is_outage_error(error: Exception) -> bool:
+    """
+    是否算作端点故障
+    连接错误/超时 (没有状态码) 和 5xx 算; 429 由限流器处理, 4xx 是调用方的问题, 都不算
+    """
+    status = getattr(error, "status_code", None)
+    return status is None or status >= 500
+
+
+class CircuitBreaker:
+    """
+    单个引擎的熔断器
+
+    - failure_threshold: 连续失败多少次后打开
+    - probe_interval: 打开后多久放一个探测请求
+    - latency_ref: 健康分的参考延迟 (秒), 延迟等于它时健康分减半
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        probe_interval: float = DEFAULT_PROBE_INTERVAL,
+        latency_ref: float = 10.0,
+        alpha: float = 0.2
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.latency_ref = latency_ref
+        self.alpha = alpha  # EWMA 平滑系数
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = 0.0
+
+        self.error_rate = 0.0     # 错误率 EWMA
+        self.latency = None       # 延迟 EWMA
+        self.rejected = 0         # 熔断期间直接拒绝的请求数
+        self.trips = 0            # 打开次数
+
+        self._lock = threading.Lock()
+
+    def _probe_due(self, now: float) -> bool:
+        if self.state == OPEN:
+            return now - self.opened_at >= self.probe_interval
+        if self.state == HALF_OPEN:
+            # 探测请求迟迟没有结果 (比如被取消), 允许重新探测
+            return now - self.probe_started_at >= self.probe_interval
+        return False
+
+    def allow_request(self) -> bool:
+        """是否允许发请求 (open 状态到期时转为 half_open 并放行一个探测)"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self._probe_due(now):
+                self.state = HALF_OPEN
+                self.probe_started_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def is_available(self) -> bool:
+        """只读检查: 当前是否可能放行 (路由时使用, 不改变状态)"""
+        with self._lock:
+            return self.state == CLOSED or self._probe_due(time.monotonic())
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.error_rate = (1 - self.alpha) * self.error_rate
+            self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"💚 [{self.name}] 探测成功, 熔断器关闭")
+            self.state = CLOSED
+
+    def record_failure(self, error: Optional[Exception] = None):
+        if error is not None and not is_outage_error(error):
+            return
+        with self._lock:
+            self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    print(f"💔 [{self.name}] 熔断器打开, {self.probe_interval:.0f}s 后探测")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def health_score(self) -> float:
+        """健康分 0~1: 熔断中为 0, 否则 (1 - 错误率) × 延迟因子"""
+        with self._lock:
+            if self.state == OPEN and not self._probe_due(time.monotonic()):
+                return 0.0
+            latency_factor = 1.0 if self.latency is None else 1.0 / (1.0 + self.latency / self.latency_ref)
+            return (1.0 - self.error_rate) * latency_factor
+
+    def get_stats(self):
+        """获取统计信息"""
+        return {
+            "name": self.name,
+            "state": self.state,
+            "health": round(self.health_score(), 3),
+            "error_rate": round(self.error_rate, 3),
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "trips": self.trips,
+            "rejected": self.rejected
+        }
+
+
+def call_with_breaker(breaker: CircuitBreaker, fn: Callable):
+    """熔断保护下执行一次调用: 熔断中直接抛 CircuitOpenError, 否则记录结果"""
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"[{breaker.name}] 熔断中, 请求未发出")
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    breaker.record_success(time.perf_counter() - start)
+    return result
+
+
+# ========== 全局注册表 ==========
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_key(model: Optional[str], base_url: str) -> str:
+    """
+    熔断器的 key: "<模型>@<base_url>"
+    引擎客户端、llm_calls 和模型路由都用它, 路由检查的就是实际调用记录的那个熔断器
+    (openai 客户端的 base_url 带结尾的 "/", 这里去掉)
+    """
+    return f"{model or 'unknown'}@{str(base_url).rstrip('/')}"
+
+
+def get_breaker(key: str) -> CircuitBreaker:
+    """按 key (见 breaker_key) 获取共享熔断器 (多个管理器或 Agent 共用)"""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key)
+            _BREAKERS[key] = breaker
+        return breaker
+
+
+def all_breakers():
+    """所有已创建的熔断器"""
+    with _BREAKERS_LOCK:
+        return list(_BREAKERS.values())
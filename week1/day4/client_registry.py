@@ -0,0 +1,185 @@
+"""
+OpenAI 客户端注册表 - 全进程共享
+学习目标:
+1. 按 (base_url, api_key) 复用客户端, 避免每个 Agent 各建一个
+2. 所有客户端共享同一个 HTTP 连接池, 减少 TLS 握手和打开的 socket
+3. 懒加载: 第一次使用时才创建; openai / httpx / tavily SDK 和 .env 也推迟到第一次创建客户端时才加载,
+   import 各 Agent 模块不需要 Key, 也不付 SDK 的导入开销 (openai 约 0.5 秒)
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI, AsyncOpenAI
+    from tavily import TavilyClient
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+_POOL_LIMITS = dict(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+_TIMEOUT = dict(timeout=120.0, connect=10.0)
+
+_lock = threading.Lock()
+_env_loaded = False
+_http_client: Optional["httpx.Client"] = None
+_clients: Dict[tuple, "OpenAI"] = {}
+_tavily_clients: Dict[Optional[str], "TavilyClient"] = {}
+
+# 异步连接池绑定事件循环, 每个循环一份
+_async_http_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+_async_clients = weakref.WeakKeyDictionary()       # event loop -> {key: AsyncOpenAI}
+
+_stats = {"clients_created": 0, "async_clients_created": 0, "http_pools_created": 0}
+
+
+def load_env():
+    """读取 .env (只读一次); 在第一次需要 Key 或配置时调用, 而不是在 import 时"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv, find_dotenv
+    # 先找当前目录往上的 .env, 再找仓库根目录的; 都不覆盖已经设置的环境变量
+    load_dotenv(find_dotenv(usecwd=True))
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".env"))
+    _env_loaded = True
+
+
+def _resolve(api_key: Optional[str], base_url: Optional[str]) -> tuple:
+    """补全默认值: 未指定时使用 DeepSeek 配置"""
+    load_env()
+    api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+    base_url = base_url or os.getenv("DEEPSEEK_BASE_URL", DEFAULT_BASE_URL)
+    return api_key, base_url
+
+
+def get_http_client() -> "httpx.Client":
+    """全进程共享的同步 keep-alive 连接池"""
+    global _http_client
+    import httpx
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(**_POOL_LIMITS),
+                timeout=httpx.Timeout(_TIMEOUT["timeout"], connect=_TIMEOUT["connect"])
+            )
+            _stats["http_pools_created"] += 1
+        return _http_client
+
+
+def get_async_http_client() -> "httpx.AsyncClient":
+    """当前事件循环共享的异步 keep-alive 连接池"""
+    import httpx
+    loop = asyncio.get_running_loop()
+    with _lock:
+        http_client = _async_http_clients.get(loop)
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(**_POOL_LIMITS),
+                timeout=httpx.Timeout(_TIMEOUT["timeout"], connect=_TIMEOUT["connect"])
+            )
+            _async_http_clients[loop] = http_client
+            _stats["http_pools_created"] += 1
+        return http_client
+
+
+def get_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> "OpenAI":
+    """
+    获取共享的同步客户端
+
+    Args:
+        api_key: 默认读取 DEEPSEEK_API_KEY
+        base_url: 默认读取 DEEPSEEK_BASE_URL, 再退回 https://api.deepseek.com
+    """
+    api_key, base_url = _resolve(api_key, base_url)
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        from openai import OpenAI
+        http_client = get_http_client()
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+                _clients[key] = client
+                _stats["clients_created"] += 1
+    return client
+
+
+def get_async_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> "AsyncOpenAI":
+    """获取当前事件循环中共享的异步客户端"""
+    from openai import AsyncOpenAI
+    api_key, base_url = _resolve(api_key, base_url)
+    key = (base_url, api_key)
+    loop = asyncio.get_running_loop()
+    http_client = get_async_http_client()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            clients[key] = client
+            _stats["async_clients_created"] += 1
+        return client
+
+
+def get_tavily_client(api_key: Optional[str] = None) -> "TavilyClient":
+    """获取共享的 Tavily 搜索客户端 (默认读取 TAVILY_API_KEY)"""
+    load_env()
+    api_key = api_key or os.getenv("TAVILY_API_KEY")
+    with _lock:
+        client = _tavily_clients.get(api_key)
+        if client is None:
+            from tavily import TavilyClient
+            client = TavilyClient(api_key=api_key)
+            _tavily_clients[api_key] = client
+        return client
+
+
+class LazyClient:
+    """
+    客户端占位对象: 第一次访问属性时才调用 factory 创建真正的客户端
+    供脚本在模块顶层声明 openai_client / tavily_client, import 时不加载 SDK、不检查 Key
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = self._factory()
+        return getattr(self._client, name)
+
+
+def lazy_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> LazyClient:
+    """get_client 的懒加载版本"""
+    return LazyClient(lambda: get_client(api_key, base_url))
+
+
+def lazy_tavily_client(api_key: Optional[str] = None) -> LazyClient:
+    """get_tavily_client 的懒加载版本"""
+    return LazyClient(lambda: get_tavily_client(api_key))
+
+
+def get_registry_stats():
+    """获取统计信息 (创建了多少客户端和连接池)"""
+    with _lock:
+        return {
+            **_stats,
+            "active_clients": len(_clients),
+            "active_async_loops": len(_async_http_clients)
+        }
+
+
+def close_all():
+    """关闭同步连接池 (进程退出前调用)"""
+    global _http_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
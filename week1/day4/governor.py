@@ -0,0 +1,385 @@
+"""
+全局并发调度 - LLM、搜索、天气、数据库共用的资源池
+学习目标:
+1. 按资源命名的并发池: llm:<base_url>、tavily、openweather、sqlite:<路径>, 每个池有自己的并发上限
+2. 加权公平排队: 池满时不按先来先到, 而是按作业 (如多主题运行时的每个主题) 轮流放行,
+   一个主题一次扇出几十个查询, 也不会把别的主题饿死; 权重高的作业按比例多拿名额
+3. 同步和异步调用方排同一个队, 名额归还时直接交给下一个等待者
+4. 记录排队深度和等待时间 (直方图), 打印汇总并导出为 Prometheus 指标, 用来在真实负载下调整池大小
+
+与限流器的分工: 限流器管 "提供方能承受多少" (RPM / TPM / AIMD 窗口),
+调度器管 "本进程里谁先用" (全局并发上限 + 作业之间公平)
+
+用法:
+    from governor import GOVERNOR, job_context, llm_pool, sqlite_pool
+
+    with job_context("topic-1", weight=2):          # 这个 with 块 (含其中创建的协程) 内的调用都记到 topic-1
+        with GOVERNOR.slot(sqlite_pool(db_path)):
+            cursor.execute(sql)
+        async with GOVERNOR.aslot(llm_pool(base_url)):
+            await client.chat.completions.create(...)
+
+环境变量:
+    GOVERNOR=off                          关闭, slot() 不再排队
+    GOVERNOR_LLM_CONCURRENCY=16           每个 llm:<base_url> 池的并发上限, 其余前缀同理
+    GOVERNOR_POOLS="llm=24,tavily=2,sqlite:week1/day5/sentiment.db=4"   按池名或前缀单独指定
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from telemetry import TELEMETRY, Histogram, histogram_lines, prometheus_labels
+
+GOVERNOR_ENABLED = os.getenv("GOVERNOR", "on").lower() not in ("off", "0", "false")
+
+# 各类资源池的默认并发上限 (池名冒号前的部分)
+DEFAULT_POOL_SIZES = {
+    "llm": 16,
+    "tavily": 4,
+    "openweather": 4,
+    "sqlite": 8,
+}
+DEFAULT_POOL_SIZE = 8
+DEFAULT_JOB = "default"
+
+# 排队等待时间的桶 (秒), 比 LLM 延迟的桶细
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 当前作业: (名称, 权重)
+_current_job = contextvars.ContextVar("governor_job", default=(DEFAULT_JOB, 1.0))
+
+
+@contextmanager
+def job_context(name: str, weight: float = 1.0):
+    """with 块内 (含其中创建的协程和 copy_context 的线程) 申请的名额都算这个作业的"""
+    if weight <= 0:
+        raise ValueError(f"作业权重必须大于 0: {weight}")
+    token = _current_job.set((name, float(weight)))
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def current_job() -> Tuple[str, float]:
+    return _current_job.get()
+
+
+def llm_pool(base_url: str) -> str:
+    return f"llm:{str(base_url).rstrip('/')}"
+
+
+def sqlite_pool(db_path: str) -> str:
+    """同一个数据库文件 (不管相对路径怎么写) 用同一个池"""
+    return f"sqlite:{os.path.abspath(db_path)}"
+
+
+def _parse_pool_overrides(value: Optional[str]) -> Dict[str, int]:
+    """GOVERNOR_POOLS="tavily=2,sqlite:a.db=4" → {"tavily": 2, "sqlite:<绝对路径>": 4}"""
+    overrides = {}
+    for item in (value or "").split(","):
+        name, sep, size = item.strip().rpartition("=")
+        if not sep or not name:
+            continue
+        if name.startswith("sqlite:"):
+            name = sqlite_pool(name[len("sqlite:"):])
+        overrides[name] = int(size)
+    return overrides
+
+
+def default_capacity(name: str) -> int:
+    """池的并发上限: GOVERNOR_POOLS 按全名 > 按前缀 > GOVERNOR_<前缀>_CONCURRENCY > 默认值"""
+    overrides = _parse_pool_overrides(os.getenv("GOVERNOR_POOLS"))
+    prefix = name.split(":", 1)[0]
+    for key in (name, prefix):
+        if key in overrides:
+            return overrides[key]
+    env = os.getenv(f"GOVERNOR_{prefix.upper()}_CONCURRENCY")
+    if env:
+        return int(env)
+    return DEFAULT_POOL_SIZES.get(prefix, DEFAULT_POOL_SIZE)
+
+
+class _Waiter:
+    """排队中的一次申请; 同步调用方用 Event 等, 异步调用方用 Future 等"""
+
+    __slots__ = ("job", "weight", "enqueued", "event", "loop", "future", "granted")
+
+    def __init__(self, job: str, weight: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.job = job
+        self.weight = weight
+        self.enqueued = time.monotonic()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:  # 事件循环已关闭, 没人会用这个名额了
+            return False
+        return True
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class ResourcePool:
+    """
+    单个资源的并发池 (加权公平排队)
+
+    每个作业有一个虚拟时间: 每拿到一个名额前进 1/权重。池满时, 虚拟时间最小的作业的最早等待者先拿;
+    空闲了一段时间的作业从当前进度开始算, 不能攒下额度一次性抢占 (start-time fair queuing)
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self._waiters: List[_Waiter] = []
+        self._vtime: Dict[str, float] = defaultdict(float)  # 作业 → 下一个名额的虚拟开始时间
+        self._clock = 0.0                                    # 最近放行的虚拟时间
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.max_queue = 0
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.recent_waits = deque(maxlen=1000)
+        self.job_acquired = defaultdict(int)
+        self.job_wait = defaultdict(float)
+
+    # ----- 调度 -----
+
+    def _grant(self, waiter: _Waiter):
+        """在锁内把一个名额交给 waiter"""
+        start = max(self._vtime[waiter.job], self._clock)
+        self._clock = start
+        self._vtime[waiter.job] = start + 1.0 / waiter.weight
+        self.in_use += 1
+        waiter.granted = True
+
+        waited = time.monotonic() - waiter.enqueued
+        self.acquired += 1
+        self.wait.observe(waited)
+        self.recent_waits.append(waited)
+        self.job_acquired[waiter.job] += 1
+        self.job_wait[waiter.job] += waited
+
+    def _pick(self) -> _Waiter:
+        """虚拟时间最小的作业; 同一作业内先来先到"""
+        best = None
+        best_tag = None
+        for waiter in self._waiters:
+            tag = max(self._vtime[waiter.job], self._clock)
+            if best is None or tag < best_tag:
+                best, best_tag = waiter, tag
+        self._waiters.remove(best)
+        return best
+
+    def _dispatch(self) -> List[_Waiter]:
+        """在锁内放行尽可能多的等待者, 返回需要唤醒的列表"""
+        woken = []
+        while self._waiters and self.in_use < self.capacity:
+            waiter = self._pick()
+            self._grant(waiter)
+            woken.append(waiter)
+        return woken
+
+    def _enqueue(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Waiter:
+        """申请名额: 有空位且没人排队时直接拿到, 否则排进队列"""
+        job, weight = current_job()
+        waiter = _Waiter(job, weight, loop)
+        with self._lock:
+            if not self._waiters and self.in_use < self.capacity:
+                self._grant(waiter)
+            else:
+                self._waiters.append(waiter)
+                self.max_queue = max(self.max_queue, len(self._waiters))
+        return waiter
+
+    def _wake_all(self, woken: List[_Waiter]):
+        for waiter in woken:
+            if waiter.wake() is False:
+                self.release()
+
+    # ----- 对外接口 -----
+
+    def acquire(self):
+        """同步获取名额 (阻塞)"""
+        waiter = self._enqueue()
+        if not waiter.granted:
+            waiter.event.wait()
+
+    async def aacquire(self):
+        """异步获取名额; 排队时被取消会退出队列, 已经拿到的名额会归还"""
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter.granted:
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+            woken = self._dispatch()
+        self._wake_all(woken)
+
+    def resize(self, capacity: int):
+        """调整并发上限, 变大时立即放行排队者"""
+        with self._lock:
+            self.capacity = max(1, capacity)
+            woken = self._dispatch()
+        self._wake_all(woken)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        with self._lock:
+            waits = sorted(self.recent_waits)
+            jobs = {
+                job: {"acquired": count, "wait": round(self.job_wait[job], 3)}
+                for job, count in self.job_acquired.items()
+            }
+            return {
+                "name": self.name,
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue,
+                "acquired": self.acquired,
+                "total_wait": round(self.wait.sum, 3),
+                "wait_p50": waits[len(waits) // 2] if waits else None,
+                "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+                "jobs": jobs,
+            }
+
+
+class _NullSlot:
+    """调度器关闭时的空名额"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class Governor:
+    """全进程共享的资源池注册表"""
+
+    def __init__(self, enabled: bool = GOVERNOR_ENABLED):
+        self.enabled = enabled
+        self._pools: Dict[str, ResourcePool] = {}
+        self._lock = threading.Lock()
+
+    def pool(self, name: str) -> ResourcePool:
+        """按名获取资源池, 第一次用到时按配置创建"""
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = ResourcePool(name, default_capacity(name))
+                self._pools[name] = pool
+            return pool
+
+    def set_capacity(self, name: str, capacity: int):
+        self.pool(name).resize(capacity)
+
+    def slot(self, name: str):
+        """with GOVERNOR.slot("tavily"): ... 同步用法"""
+        return self.pool(name).slot() if self.enabled else _NullSlot()
+
+    def aslot(self, name: str):
+        """async with GOVERNOR.aslot(llm_pool(url)): ... 异步用法"""
+        return self.pool(name).aslot() if self.enabled else _NullSlot()
+
+    def pools(self) -> List[ResourcePool]:
+        with self._lock:
+            return list(self._pools.values())
+
+    def get_stats(self) -> List[Dict]:
+        return [pool.get_stats() for pool in self.pools()]
+
+    def print_summary(self):
+        """打印各资源池的并发、排队深度和等待时间"""
+        for stats in self.get_stats():
+            p95 = f"{stats['wait_p95']:.3f}s" if stats["wait_p95"] is not None else "-"
+            jobs = len(stats["jobs"])
+            print(f"🎛️  {stats['name']} | 上限: {stats['capacity']} | 使用中: {stats['in_use']} | "
+                  f"排队: {stats['queue_depth']} (峰值 {stats['max_queue_depth']}) | 放行: {stats['acquired']} | "
+                  f"等待 p95: {p95}, 累计 {stats['total_wait']:.2f}s | 作业: {jobs}")
+
+    def prometheus_lines(self) -> List[str]:
+        """导出为 Prometheus 指标 (由 TELEMETRY.to_prometheus 收集)"""
+        pools = self.pools()
+        out = []
+        gauges = [
+            ("governor_pool_capacity", "资源池并发上限", "capacity"),
+            ("governor_pool_in_use", "资源池正在使用的名额", "in_use"),
+            ("governor_queue_depth", "资源池排队中的申请数", "_waiters"),
+        ]
+        for metric, help_text, attr in gauges:
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} gauge")
+            for pool in pools:
+                value = getattr(pool, attr)
+                value = len(value) if isinstance(value, list) else value
+                out.append(f"{metric}{prometheus_labels(pool=pool.name)} {value}")
+
+        out.append("# HELP governor_acquired_total 各作业拿到的名额数")
+        out.append("# TYPE governor_acquired_total counter")
+        for pool in pools:
+            with pool._lock:
+                for job, count in sorted(pool.job_acquired.items()):
+                    out.append(f"governor_acquired_total{prometheus_labels(pool=pool.name, job=job)} {count}")
+
+        out.append("# HELP governor_wait_seconds 申请名额的排队时间")
+        out.append("# TYPE governor_wait_seconds histogram")
+        for pool in pools:
+            with pool._lock:
+                out.extend(histogram_lines("governor_wait_seconds", pool.wait, pool=pool.name))
+        return out
+
+
+GOVERNOR = Governor()
+TELEMETRY.add_collector(GOVERNOR.prometheus_lines)
@@ -0,0 +1,182 @@
+"""
+LLM 响应缓存 - SQLite 持久化
+学习目标:
+1. 内容寻址: 相同请求 (模型 + 地址 + 消息 + 温度) 得到相同的 key
+2. TTL 过期 + 按容量的 LRU 淘汰
+3. 内存热层, 命中时微秒级返回
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "week1/day4/llm_cache.db")
+
+
+class ResponseCache:
+    """
+    磁盘缓存 (SQLite) + 内存 LRU 热层
+
+    - ttl: 条目存活秒数, 过期后视为未命中并删除
+    - max_bytes: 磁盘缓存上限 (按响应文本字节数), 超出时淘汰最久未访问的条目
+    - memory_entries: 内存热层保存的条目数
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: float = 7 * 24 * 3600,
+        max_bytes: int = 50 * 1024 * 1024,
+        memory_entries: int = 512
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (response, created_at)
+        self._touched = {}            # key -> last_access, 写入时批量落盘
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, base_url: str, messages: list, temperature: float) -> str:
+        """根据请求内容生成缓存 key"""
+        payload = json.dumps(
+            {
+                "model": model,
+                "base_url": base_url,
+                "messages": messages,
+                "temperature": temperature
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存, 未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            response, created_at = entry
+            if now - created_at > self.ttl:
+                self._memory.pop(key, None)
+                self._touched.pop(key, None)
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                self.misses += 1
+                return None
+
+            self._memory.move_to_end(key)
+            self._touched[key] = now
+            self.hits += 1
+            return response
+
+    def set(self, key: str, response: str, model: str = ""):
+        """写入缓存并按容量淘汰"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, (response, now))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now)
+            )
+            self._flush_touched()
+            self._evict()
+            self.conn.commit()
+
+    def _remember(self, key: str, entry: tuple):
+        """放入内存热层"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """把命中时记录的访问时间写回磁盘 (LRU 依据)"""
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(ts, key) for key, ts in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """删除过期条目, 再按最久未访问淘汰到容量以内"""
+        cursor = self.conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        self.evictions += cursor.rowcount
+
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        for (key,) in victims:
+            self._memory.pop(key, None)
+        self.evictions += len(victims)
+
+    def get_stats(self):
+        """获取统计信息"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """落盘并关闭"""
+        with self._lock:
+            self._flush_touched()
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,163 @@
+"""
+LLM 调用统一入口
+学习目标:
+1. 所有 Agent 都通过 chat_completion() 调用, 参数与 client.chat.completions.create 一致
+2. 在入口处统一做预算裁剪、请求合并、熔断、遥测等横切逻辑, Agent 代码不用关心
+3. 传了 task_type 时由模型路由按任务挑选模型 (SQL/判断走便宜快速的模型, 报告走高档位模型)
+4. 失败按共享的重试策略处理: 4xx 不重试, 429/5xx/网络错误 full jitter 退避, 遵守 Retry-After 和全局重试预算
+5. 发送前向全局调度器申请 llm:<base_url> 的名额, 多个作业 (主题) 之间公平排队,
+   再经过提供方共享的自适应限流器 (和 MultiLLMManager 的引擎共用, 合起来不超过提供方的上限)
+6. 流式请求返回原样的 chunk 迭代器, 读完才记熔断器成功和遥测, 中途断开记失败 (和 ChatStream 一致)
+"""
+
+import time
+from typing import Optional
+from singleflight import SINGLE_FLIGHT, request_key
+from circuit_breaker import CircuitOpenError, breaker_key, get_breaker, call_with_breaker
+from token_budget import fit_messages
+from telemetry import TELEMETRY
+from model_router import ROUTER, same_provider
+from retry_policy import LLM_RETRY
+from governor import GOVERNOR, llm_pool
+from rate_limiter import get_limiter, estimate_request_tokens
+from client_registry import get_client
+
+
+def _create(client, agent: Optional[str], **kwargs):
+    """真正发请求, 并上报耗时和 tokens; 非流式请求占用限流器许可直到拿到响应"""
+    engine = kwargs.get("model") or "unknown"
+    start = time.perf_counter()
+    try:
+        with GOVERNOR.slot(llm_pool(client.base_url)):
+            if kwargs.get("stream"):
+                response = client.chat.completions.create(**kwargs)
+            else:
+                limiter = get_limiter(str(client.base_url), getattr(client, "api_key", None))
+                with limiter.slot(estimate_request_tokens(kwargs["messages"])) as slot:
+                    response = client.chat.completions.create(**kwargs)
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        slot.actual_tokens = usage.total_tokens
+    except Exception as e:
+        TELEMETRY.record_call(engine, time.perf_counter() - start, agent=agent, error=e)
+        raise
+    if kwargs.get("stream"):
+        return RecordedStream(response, engine, agent, start)
+    TELEMETRY.record_call(engine, time.perf_counter() - start, getattr(response, "usage", None), agent=agent)
+    return response
+
+
+class RecordedStream:
+    """
+    包装 stream=True 的原始响应: 迭代得到的仍是原来的 chunk
+    流读完时记一次成功调用 (耗时、usage、首 token 时间), 中途出错记失败; 其他属性透传给原响应
+    """
+
+    def __init__(self, response, engine: str, agent: Optional[str], start: float, breaker=None):
+        self.response = response
+        self.engine = engine
+        self.agent = agent
+        self.start = start
+        self.breaker = breaker  # chat_completion 在建立连接后填上
+
+    def __iter__(self):
+        usage = None
+        ttft = None
+        try:
+            for chunk in self.response:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                    ttft = time.perf_counter() - self.start
+                yield chunk
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            TELEMETRY.record_call(self.engine, time.perf_counter() - self.start, agent=self.agent, error=e)
+            raise
+        elapsed = time.perf_counter() - self.start
+        if self.breaker is not None:
+            self.breaker.record_success(elapsed)
+        TELEMETRY.record_call(self.engine, elapsed, usage, agent=self.agent, ttft=ttft)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        close = getattr(self.response, "close", None)
+        if close:
+            close()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+
+def _open_stream(client, breaker, agent: Optional[str], **kwargs) -> RecordedStream:
+    """建立流式连接: 连接失败记熔断器失败; 成功与否等流读完再记"""
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"[{breaker.name}] 熔断中, 请求未发出")
+    try:
+        stream = _create(client, agent, **kwargs)
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    stream.breaker = breaker
+    return stream
+
+
+def route_model(
+    client,
+    task_type: str,
+    messages: list,
+    model: Optional[str],
+    agent: Optional[str] = None,
+    max_tokens: Optional[int] = None
+):
+    """
+    按任务类型路由, 返回 (client, model)
+    选中的模型在别的提供方时换成对应的共享客户端 (用候选自己的 Key); 没有路由时原样返回
+    """
+    decision = ROUTER.route(task_type, messages, base_url=str(client.base_url), max_tokens=max_tokens, agent=agent)
+    if not decision.routed:
+        return client, model
+    if decision.base_url and not same_provider(decision.base_url, str(client.base_url)):
+        client = get_client(decision.api_key, decision.base_url)
+    return client, decision.model
+
+
+def chat_completion(client, agent: Optional[str] = None, task_type: Optional[str] = None, **kwargs):
+    """
+    调用 chat.completions.create 并返回原始 response
+
+    Args:
+        agent: 遥测里的 Agent 名, 默认取 agent_context() 或入口脚本名
+        task_type: 任务类型 (sql / decision / analysis / synthesis / report), 传了才做模型路由,
+                   不传时使用调用方指定的 model
+
+    发送前按模型上下文上限和预算裁剪 messages (如 ReAct 不断追加的 Observation);
+    相同参数的并发请求只发一次, 其余调用方共享结果;
+    流式请求无法共享, 也不经过限流器 (要限流的流式输出用 ChatStream); 返回的迭代器读完才记成功;
+    端点连续故障时熔断, 后续调用立即抛出 CircuitOpenError 而不是各自等待超时;
+    可重试的失败在 single-flight 内部重试, 等待同一结果的调用方不会各自再重试一遍
+    (流式请求只重试建立连接, 开始输出后出错直接抛出)
+    """
+    if task_type:
+        client, kwargs["model"] = route_model(
+            client, task_type, kwargs["messages"], kwargs.get("model"), agent, kwargs.get("max_tokens")
+        )
+    kwargs["messages"] = fit_messages(kwargs["messages"], kwargs.get("model"), kwargs.get("max_tokens"))
+    base_url = str(client.base_url)
+    breaker = get_breaker(breaker_key(kwargs.get("model"), base_url))
+    engine = kwargs.get("model") or "unknown"
+    if kwargs.get("stream"):
+        return LLM_RETRY.call(lambda: _open_stream(client, breaker, agent, **kwargs), engine=engine, agent=agent)
+    send = lambda: LLM_RETRY.call(
+        lambda: call_with_breaker(breaker, lambda: _create(client, agent, **kwargs)),
+        engine=engine, agent=agent, paced_throttle=True
+    )
+
+    key = request_key(base_url, **kwargs)
+    return SINGLE_FLIGHT.do(key, send)
@@ -0,0 +1,192 @@
+"""
+流式输出 - 边生成边返回
+学习目标:
+1. stream=True 逐块读取, 调用方可以立刻显示
+2. 记录首 token 时间 (TTFT) 和生成速度 (tokens/秒)
+3. 流结束后仍然拿到完整文本和 usage, 兼容原来的返回值
+4. 熔断器按整个流记结果: 读完才算成功, 输出到一半断开也记一次失败
+"""
+
+import time
+import threading
+from collections import defaultdict
+from typing import Callable, Iterator, Optional
+from rate_limiter import estimate_request_tokens
+from token_budget import fit_messages
+from telemetry import TELEMETRY
+from retry_policy import LLM_RETRY
+from governor import GOVERNOR, llm_pool
+from circuit_breaker import CircuitOpenError, breaker_key, get_breaker
+
+
+class ChatStream:
+    """
+    可迭代的流式响应
+
+    用法:
+        stream = ChatStream(client, "deepseek-chat", messages, name="ReportAgent")
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        stream.text / stream.usage / stream.ttft  # 迭代结束后可用
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        messages: list,
+        temperature: float = 0.7,
+        name: str = "",
+        limiter=None,
+        on_finish: Optional[Callable[["ChatStream"], None]] = None,
+        cached: Optional[str] = None,
+        engine: Optional[str] = None,
+        agent: Optional[str] = None,
+        breaker=None
+    ):
+        self.client = client
+        self.model = model
+        self.messages = fit_messages(messages, model)  # 发送前预算检查
+        self.temperature = temperature
+        self.name = name
+        self.limiter = limiter
+        self.on_finish = on_finish
+        self.cached = cached  # 缓存命中时直接整块返回, 不发请求
+        self.engine = engine or model  # 遥测标签
+        self.agent = agent
+        # 默认用 (模型, 端点) 的共享熔断器, 和路由 / 非流式调用看到的是同一个;
+        # 传入 breaker 的调用方 (LLMClient.stream) 已经检查过, 直接构造时在这里检查, 熔断中不发请求
+        if breaker is None:
+            breaker = get_breaker(breaker_key(model, str(client.base_url)))
+            if cached is None and not breaker.allow_request():
+                raise CircuitOpenError(f"[{name or model}] 熔断中, 请求未发出")
+        self.breaker = breaker
+
+        self.text = ""
+        self.usage = None
+        self.chunk_count = 0
+        self.ttft = None       # 首个内容块到达的秒数
+        self.duration = None   # 整个流的秒数
+        self.finished = False
+
+    def _open(self):
+        """建立流式连接; 只重试建立连接这一步, 开始输出后出错直接抛出"""
+        return LLM_RETRY.call(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True}  # 最后一块带 usage
+            ),
+            engine=self.engine, agent=self.agent
+        )
+
+    def _iterate(self, response, start: float) -> Iterator[str]:
+        parts = []
+        for chunk in response:
+            if getattr(chunk, "usage", None):
+                self.usage = chunk.usage
+            if not chunk.choices:
+                continue
+            piece = chunk.choices[0].delta.content
+            if not piece:
+                continue
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - start
+            self.chunk_count += 1
+            parts.append(piece)
+            yield piece
+        self.text = "".join(parts)
+
+    def __iter__(self) -> Iterator[str]:
+        if self.cached is not None:
+            self.text = self.cached
+            self.ttft = self.duration = 0.0
+            self.finished = True
+            yield self.cached
+            return
+
+        start = time.perf_counter()
+        try:
+            # 全局调度的名额在整个流读完 (或被放弃) 之前一直占用
+            with GOVERNOR.slot(llm_pool(self.client.base_url)):
+                if self.limiter is not None:
+                    with self.limiter.slot(estimate_request_tokens(self.messages)) as slot:
+                        yield from self._iterate(self._open(), start)
+                        if self.usage is not None:
+                            slot.actual_tokens = self.usage.total_tokens
+                else:
+                    yield from self._iterate(self._open(), start)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            TELEMETRY.record_call(self.engine, time.perf_counter() - start, agent=self.agent, error=e)
+            raise
+
+        self.duration = time.perf_counter() - start
+        self.finished = True
+        self.breaker.record_success(self.duration)
+        STREAM_STATS.record(self.name, self)
+        TELEMETRY.record_call(self.engine, self.duration, self.usage, agent=self.agent, ttft=self.ttft)
+        if self.on_finish:
+            self.on_finish(self)
+
+    @property
+    def completion_tokens(self) -> int:
+        """生成的 tokens (没有 usage 时按块数估算)"""
+        if self.usage is not None:
+            return self.usage.completion_tokens
+        return self.chunk_count
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """生成速度, 不含首 token 之前的等待"""
+        if not self.duration or self.ttft is None:
+            return 0.0
+        generation = self.duration - self.ttft
+        return self.completion_tokens / generation if generation > 0 else 0.0
+
+    def consume(self, on_chunk: Optional[Callable[[str], None]] = None) -> str:
+        """读完整个流并返回完整文本"""
+        for piece in self:
+            if on_chunk:
+                on_chunk(piece)
+        return self.text
+
+
+class StreamStats:
+    """按引擎/Agent 汇总 TTFT 和生成速度"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = defaultdict(list)  # name -> [(ttft, tokens_per_sec)]
+
+    def record(self, name: str, stream: ChatStream):
+        with self._lock:
+            self._records[name or "unknown"].append((stream.ttft or 0.0, stream.tokens_per_sec))
+
+    def summary(self):
+        """获取统计信息"""
+        with self._lock:
+            return {
+                name: {
+                    "streams": len(items),
+                    "avg_ttft": sum(t for t, _ in items) / len(items),
+                    "avg_tokens_per_sec": sum(s for _, s in items) / len(items)
+                }
+                for name, items in self._records.items()
+            }
+
+    def print_summary(self):
+        """打印流式统计"""
+        for name, stats in self.summary().items():
+            print(f"⚡ {name:20} | 流式: {stats['streams']:3} 次 | "
+                  f"TTFT: {stats['avg_ttft']:.2f}s | 速度: {stats['avg_tokens_per_sec']:.1f} tokens/s")
+
+
+STREAM_STATS = StreamStats()
+
+
+def print_chunk(piece: str):
+    """默认的逐块打印回调"""
+    print(piece, end="", flush=True)
@@ -0,0 +1,283 @@
+"""
+模型路由 - 按任务类型为每个请求挑选模型
+学习目标:
+1. 候选模型登记在注册表里: 质量档位、输入/输出价格、上下文上限、延迟先验
+2. 任务类型决定最低档位和对延迟的敏感度: SQL 生成、继续/结束判断这类短小确定的调用走便宜快速的模型,
+   长报告走高档位模型
+3. 在满足档位的候选里按 "预估成本 + 预估延迟 × 延迟权重" 打分, 延迟优先用遥测里的实测值
+4. 每次路由决策 (含所有候选的打分和淘汰原因) 追加写入 JSONL, 方便事后审计
+5. 候选模型带自己的提供方 (base_url + Key): 调用方在别的提供方 (如 Kimi) 时, 选中的 DeepSeek 模型发到 DeepSeek,
+   不会把 DeepSeek 的模型名发到调用方的端点; 别的提供方没有配置 Key 的候选直接淘汰
+   DeepSeek 的地址每次路由时读 DEEPSEEK_BASE_URL (和 client_registry 一致), 指向 mock / 代理时路由也跟着走
+
+注册表默认只有 DeepSeek 的两个模型; 设置 LLM_MODEL_REGISTRY 指向 JSON 文件可以换成自己的候选, 例如:
+[
+  {"name": "qwen-turbo", "model": "qwen-turbo", "tier": 1, "input_price": 0.3, "output_price": 0.6,
+   "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1", "api_key_env": "DASHSCOPE_API_KEY"},
+  {"name": "deepseek-chat", "model": "deepseek-chat", "tier": 2, "input_price": 2, "output_price": 8}
+]
+没有 base_url 的候选与调用方使用同一个提供方 (只适合调用方都在同一个提供方的部署);
+"base_url_env" 指定的环境变量有值时优先于 base_url (和 api_key_env 一样在用到时才读)
+"""
+
+import os
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from circuit_breaker import breaker_key, get_breaker
+from token_budget import count_message_tokens, get_context_limit
+from telemetry import TELEMETRY, current_agent
+
+# 质量档位: 1 便宜快速, 2 通用, 3 高质量
+# 任务类型 -> 最低档位 / 预估输出 tokens / 延迟权重 (每秒延迟折合多少元, 越大越偏向快的模型)
+TASK_PROFILES: Dict[str, Dict] = {
+    "sql":       {"min_tier": 1, "output_tokens": 120,  "latency_weight": 0.01},
+    "decision":  {"min_tier": 1, "output_tokens": 200,  "latency_weight": 0.01},
+    "analysis":  {"min_tier": 2, "output_tokens": 600,  "latency_weight": 0.002},
+    "synthesis": {"min_tier": 2, "output_tokens": 1000, "latency_weight": 0.001},
+    "report":    {"min_tier": 3, "output_tokens": 2000, "latency_weight": 0.0002},
+}
+
+MIN_LATENCY_SAMPLES = 3  # 实测样本少于这个数时用注册表里的延迟先验
+
+DEFAULT_REGISTRY_PATH = os.getenv("LLM_MODEL_REGISTRY")
+DEFAULT_LOG_PATH = os.getenv("LLM_ROUTER_LOG", "week1/day4/logs/model_routing.jsonl")  # 设为空字符串关闭日志
+ROUTER_ENABLED = os.getenv("LLM_ROUTER", "on").lower() not in ("off", "0", "false")
+
+
+# ========== 候选模型 ==========
+
+class ModelSpec:
+    """注册表中的一个候选模型 (价格单位: 元 / 百万 tokens)"""
+
+    def __init__(
+        self,
+        model: str,
+        tier: int,
+        input_price: float,
+        output_price: float,
+        name: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_key_env: Optional[str] = None,
+        base_url_env: Optional[str] = None,
+        context_limit: Optional[int] = None,
+        ttft: float = 1.0,
+        tokens_per_sec: float = 30.0
+    ):
+        self.name = name or model
+        self.model = model
+        self.tier = tier
+        self.input_price = input_price
+        self.output_price = output_price
+        self.default_base_url = base_url    # None: 与调用方同一个提供方
+        self.base_url_env = base_url_env
+        self.api_key_env = api_key_env
+        self.context_limit = context_limit or get_context_limit(model)
+        self.ttft = ttft                    # 延迟先验: 首 token 时间
+        self.tokens_per_sec = tokens_per_sec  # 延迟先验: 生成速度
+
+    @property
+    def base_url(self) -> Optional[str]:
+        if self.base_url_env:
+            return os.getenv(self.base_url_env) or self.default_base_url
+        return self.default_base_url
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.getenv(self.api_key_env) if self.api_key_env else None
+
+    def estimate_cost(self, prompt_tokens: int, output_tokens: int) -> float:
+        return (prompt_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+
+# 价格按 DeepSeek 官网的未命中缓存价格填写, 以提供方价格页为准
+# 地址在路由时读 DEEPSEEK_BASE_URL (mock 服务 / 代理), 没设置时才用官方地址
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEEPSEEK_PROVIDER = dict(base_url=DEEPSEEK_BASE_URL, base_url_env="DEEPSEEK_BASE_URL", api_key_env="DEEPSEEK_API_KEY")
+DEFAULT_MODELS = [
+    ModelSpec("deepseek-chat", tier=2, input_price=2.0, output_price=8.0, ttft=1.0, tokens_per_sec=30.0,
+              **DEEPSEEK_PROVIDER),
+    ModelSpec("deepseek-reasoner", tier=3, input_price=4.0, output_price=16.0, ttft=8.0, tokens_per_sec=25.0,
+              **DEEPSEEK_PROVIDER),
+]
+
+
+def same_provider(a: Optional[str], b: Optional[str]) -> bool:
+    """两个 base_url 是否同一个提供方 (忽略结尾的 "/")"""
+    return a is not None and b is not None and str(a).rstrip("/") == str(b).rstrip("/")
+
+
+def load_registry(path: str) -> List[ModelSpec]:
+    """从 JSON 文件加载候选模型列表"""
+    with open(path, encoding="utf-8") as f:
+        return [ModelSpec(**item) for item in json.load(f)]
+
+
+class RouteDecision:
+    """一次路由结果; routed 为 False 时调用方保持原来的模型"""
+
+    def __init__(self, task_type: str, spec: Optional[ModelSpec] = None, reason: str = "",
+                 est_cost: float = 0.0, est_latency: float = 0.0):
+        self.task_type = task_type
+        self.spec = spec
+        self.reason = reason
+        self.est_cost = est_cost
+        self.est_latency = est_latency
+
+    @property
+    def routed(self) -> bool:
+        return self.spec is not None
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.spec.model if self.spec else None
+
+    @property
+    def base_url(self) -> Optional[str]:
+        return self.spec.base_url if self.spec else None
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return self.spec.api_key if self.spec else None
+
+
+# ========== 路由器 ==========
+
+class ModelRouter:
+    """按任务类型、价格和实测延迟选模型"""
+
+    def __init__(
+        self,
+        models: Optional[List[ModelSpec]] = None,
+        log_path: Optional[str] = DEFAULT_LOG_PATH,
+        enabled: bool = ROUTER_ENABLED
+    ):
+        if models is None:
+            models = load_registry(DEFAULT_REGISTRY_PATH) if DEFAULT_REGISTRY_PATH else list(DEFAULT_MODELS)
+        self.models = models
+        self.log_path = log_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # (task_type, 模型名) -> 次数 / 预估成本
+        self.decisions = defaultdict(int)
+        self.est_costs = defaultdict(float)
+
+    def estimate_latency(self, spec: ModelSpec, output_tokens: int):
+        """
+        预估耗时, 返回 (秒, 来源)
+        有足够实测样本时按该模型每个输出 token 的平均耗时折算, 否则用先验 ttft + 输出 / 速度
+        """
+        totals = TELEMETRY.engine_totals(spec.model)
+        if totals["calls"] >= MIN_LATENCY_SAMPLES and totals["completion_tokens"]:
+            return totals["seconds"] / totals["completion_tokens"] * output_tokens, "measured"
+        return spec.ttft + output_tokens / spec.tokens_per_sec, "prior"
+
+    def route(
+        self,
+        task_type: str,
+        messages: list,
+        base_url: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        agent: Optional[str] = None
+    ) -> RouteDecision:
+        """
+        为一次请求选模型
+
+        Args:
+            task_type: TASK_PROFILES 中的任务类型, 未登记的类型不路由
+            base_url: 调用方当前的提供方; 没有 base_url 的候选视为在这个提供方上,
+                      在别的提供方上的候选需要自己的 Key (api_key_env), 否则淘汰
+            max_tokens: 调用方限制的输出长度, 用于估算成本和检查上下文
+        """
+        profile = TASK_PROFILES.get(task_type)
+        if not self.enabled or profile is None or not self.models:
+            return RouteDecision(task_type, reason="未路由")
+
+        prompt_tokens = count_message_tokens(messages)
+        output_tokens = min(max_tokens, profile["output_tokens"]) if max_tokens else profile["output_tokens"]
+
+        candidates = []
+        for spec in self.models:
+            row = {"name": spec.name, "model": spec.model, "tier": spec.tier}
+            spec_url = spec.base_url or base_url
+            if prompt_tokens + output_tokens > spec.context_limit:
+                row["skip"] = "上下文不足"
+            elif spec.base_url and not same_provider(spec.base_url, base_url) and not spec.api_key:
+                row["skip"] = "别的提供方, 没有配置 Key"
+            elif spec_url and not get_breaker(breaker_key(spec.model, spec_url)).is_available():
+                row["skip"] = "熔断中"
+            else:
+                latency, source = self.estimate_latency(spec, output_tokens)
+                cost = spec.estimate_cost(prompt_tokens, output_tokens)
+                row.update({
+                    "est_cost": round(cost, 6),
+                    "est_latency": round(latency, 3),
+                    "latency_source": source,
+                    "score": round(cost + profile["latency_weight"] * latency, 6)
+                })
+            candidates.append((spec, row))
+
+        eligible = [(spec, row) for spec, row in candidates if "skip" not in row]
+        if not eligible:
+            decision = RouteDecision(task_type, reason="没有可用的候选模型, 保持原模型")
+        else:
+            qualified = [(spec, row) for spec, row in eligible if spec.tier >= profile["min_tier"]]
+            reason = f"档位 >= {profile['min_tier']} 中得分最低"
+            if not qualified:
+                top = max(spec.tier for spec, _ in eligible)
+                qualified = [(spec, row) for spec, row in eligible if spec.tier == top]
+                reason = f"没有档位 >= {profile['min_tier']} 的可用模型, 退到最高档 {top}"
+            spec, row = min(qualified, key=lambda item: item[1]["score"])
+            decision = RouteDecision(task_type, spec, reason, row["est_cost"], row["est_latency"])
+            with self._lock:
+                self.decisions[(task_type, spec.name)] += 1
+                self.est_costs[(task_type, spec.name)] += row["est_cost"]
+
+        self._log({
+            "task_type": task_type,
+            "agent": agent or current_agent(),
+            "chosen": decision.spec.name if decision.routed else None,
+            "reason": decision.reason,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "min_tier": profile["min_tier"],
+            "candidates": [row for _, row in candidates]
+        })
+        return decision
+
+    def _log(self, event: Dict):
+        if not self.log_path:
+            return
+        event = {"ts": datetime.now().isoformat(timespec="milliseconds"), **event}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def get_stats(self) -> Dict[str, Dict[str, Dict]]:
+        """{task_type: {模型名: {"calls", "est_cost"}}}"""
+        stats: Dict[str, Dict[str, Dict]] = {}
+        with self._lock:
+            for (task_type, name), count in self.decisions.items():
+                stats.setdefault(task_type, {})[name] = {
+                    "calls": count,
+                    "est_cost": self.est_costs[(task_type, name)]
+                }
+        return stats
+
+    def print_summary(self):
+        """打印各任务类型被路由到哪些模型"""
+        for task_type, models in sorted(self.get_stats().items()):
+            parts = " | ".join(
+                f"{name} × {row['calls']} (预估 ¥{row['est_cost']:.4f})" for name, row in sorted(models.items())
+            )
+            print(f"🧭 {task_type:10} → {parts}")
+
+
+# 全进程共享
+ROUTER = ModelRouter()
@@ -5,58 +5,341 @@
 2. 实现自动降级和重试
 3. 成本追踪和优化
 4. 为不同任务选择最佳模型
+5. 异步并发调用 (共享 keep-alive 连接池)
+6. 响应缓存 (相同请求不重复调用)
+7. 自适应限流 (令牌桶 + AIMD 并发窗口)
+8. 流式输出 (TTFT 和生成速度统计)
+9. 相同的并发请求合并 (single-flight)
+10. 对冲请求 (主引擎慢时同时请求备用引擎, 先到先用)
+11. 熔断 + 健康评分 (引擎故障时立即绕行到健康引擎)
+12. Token 预算 (发送前本地估算, 超出时裁剪低优先级上下文)
+13. 遥测 (按引擎/Agent 统计延迟直方图、tokens、重试和缓存)
+14. 批量推理 (JSONL 批文件 + 有界 worker 池, 崩溃后可续跑)
+15. 模型路由 (按任务类型、价格和实测延迟为每个请求选模型, 决策写入审计日志)
+16. 语义缓存 (低温度调用中, 换了说法的近似请求复用结果, 抽样审计误命中)
+17. 重试策略 (错误分类 + full jitter 退避 + Retry-After + 全局重试预算, 4xx 不重试)
+18. 全局并发调度 (按资源分池, 多个作业之间加权公平排队, 记录排队深度和等待时间)
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
-from typing import Dict, Optional, Literal
+import asyncio
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Literal, Union
 import time
+from collections import deque
 from datetime import datetime
+from llm_cache import ResponseCache
+from semantic_cache import SemanticCache
+from client_registry import lazy_client, get_async_client, load_env
+from llm_stream import ChatStream, STREAM_STATS, print_chunk
+from singleflight import SINGLE_FLIGHT, ASYNC_SINGLE_FLIGHT, request_key, get_singleflight_stats
+from rate_limiter import get_limiter, all_limiters, estimate_request_tokens
+from circuit_breaker import CircuitOpenError, breaker_key, get_breaker
+from token_budget import fit_messages, fit_blocks, prompt_budget, count_tokens, BUDGET_STATS
+from telemetry import TELEMETRY, agent_context, carry_context
+from model_router import ROUTER, same_provider
+from retry_policy import LLM_RETRY, print_retry_summary
+from governor import GOVERNOR, llm_pool
+from batch_jobs import (
+    BatchJob, DEFAULT_BATCH_DIR, batch_paths, write_batch_file, count_requests,
+    completed_ids, load_results, new_batch_id, run_batch, summarize
+)
 
-load_dotenv()
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# ========== 后台事件循环 ==========
+
+# 同步包装器使用的后台事件循环 (长期存活, 连接池跨调用保持)
+_BACKGROUND_LOOP = None
+_BACKGROUND_LOCK = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """懒启动后台事件循环线程"""
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND_LOOP is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-async-loop", daemon=True)
+            thread.start()
+            _BACKGROUND_LOOP = loop
+    return _BACKGROUND_LOOP
+
+
+def run_sync(coro):
+    """
+    在后台事件循环中运行协程并等待结果
+    供同步脚本使用; 已在事件循环中时请直接 await
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run_coroutine_threadsafe(carry_context(coro), _get_background_loop()).result()
+    coro.close()
+    raise RuntimeError("当前已在事件循环中, 请直接 await 对应的异步方法")
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    """计算分位数 (最近邻), 没有数据返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
 
 # ========== LLM 客户端封装 ==========
 
 class LLMClient:
     """LLM 客户端基类"""
     
-    def __init__(self, name: str, api_key: str, base_url: str, model: str):
+    def __init__(
+        self,
+        name: str,
+        api_key: str,
+        base_url: str,
+        model: str,
+        cache: Optional[ResponseCache] = None
+    ):
         self.name = name
         self.model = model
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = lazy_client(api_key, base_url)  # 相同提供方共享客户端和连接池, 第一次调用时才创建
+        self.cache = cache
+        self.semantic_cache: Optional[SemanticCache] = None  # 由管理器设置, 精确缓存未命中时再查
+        self.limiter = get_limiter(base_url, api_key)  # 同一提供方的引擎共享
+        self.pool = llm_pool(base_url)  # 全局调度器的资源池, 同一 base_url 的引擎共享
+        # 按 (模型, 提供方) 共享熔断器, 模型路由检查的也是它; 同一模型同一提供方的引擎一起熔断
+        self.breaker = get_breaker(breaker_key(model, base_url))
         self.call_count = 0
         self.total_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies = deque(maxlen=200)  # 最近的上游调用耗时, 用于对冲判断
+    
+    def latency_p95(self, min_samples: int = 5) -> Optional[float]:
+        """最近调用的 p95 耗时, 样本不足返回 None"""
+        if len(self.latencies) < min_samples:
+            return None
+        return percentile(self.latencies, 95)
+    
+    def _check_breaker(self):
+        """熔断中直接失败, 不占用限流名额也不等待超时"""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"[{self.name}] 熔断中, 请求未发出")
+    
+    def _cache_lookup(self, messages: list, temperature: float, use_cache: bool):
+        """查询缓存, 返回 (key, 命中的响应)"""
+        if self.cache is None or not use_cache:
+            return None, None
+        key = self.cache.make_key(self.model, self.base_url, messages, temperature)
+        cached = self.cache.get(key)
+        if cached is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        TELEMETRY.record_cache(self.name, hit=cached is not None)
+        return key, cached
+    
+    def _semantic_key(self, messages: list):
+        """
+        语义缓存的 (文本, 分区)
+        系统提示 (角色和固定要求) 连同模型一起决定分区, 只比较后面多变的内容
+        """
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        text = "\n".join(m["content"] for m in messages if m["role"] != "system")
+        namespace = hashlib.sha256(
+            "\n".join([self.model, self.base_url, *system]).encode("utf-8")
+        ).hexdigest()[:16]
+        return text, namespace
         
-    def chat(self, messages: list, temperature: float = 0.7, max_retries: int = 3):
-        """调用 LLM"""
-        for attempt in range(max_retries):
+    def chat(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        max_retries: int = 3,
+        use_cache: bool = True
+    ):
+        """
+        调用 LLM
+        
+        Args:
+            use_cache: 为 False 时跳过缓存 (既不读也不写)
+        """
+        messages = fit_messages(messages, self.model)
+        key, cached = self._cache_lookup(messages, temperature, use_cache)
+        if cached is not None:
+            return cached  # 缓存命中不计入调用次数和 tokens
+        
+        # 相同请求正在进行时, 等它的结果而不是再发一次
+        flight_key = key or request_key(self.base_url, model=self.model, messages=messages, temperature=temperature)
+        upstream = lambda: SINGLE_FLIGHT.do(
+            flight_key,
+            lambda: self._chat_upstream(messages, temperature, max_retries, key)
+        )
+        if self.semantic_cache is None or not use_cache:
+            return upstream()
+        text, namespace = self._semantic_key(messages)
+        return self.semantic_cache.get_or_compute(text, upstream, namespace, temperature)
+    
+    def _chat_upstream(self, messages: list, temperature: float, max_retries: int, key: Optional[str]):
+        """真正向上游发请求 (含限流和重试)"""
+        estimated = estimate_request_tokens(messages)
+        retry = LLM_RETRY.start(max_attempts=max_retries, paced_throttle=True)
+        while True:
+            self._check_breaker()
+            try:
+                start = time.perf_counter()
+                with GOVERNOR.slot(self.pool), self.limiter.slot(estimated) as slot:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature
+                    )
+                    if hasattr(response, 'usage'):
+                        slot.actual_tokens = response.usage.total_tokens
+                
+                # 统计
+                latency = time.perf_counter() - start
+                self.latencies.append(latency)
+                self.breaker.record_success(latency)
+                TELEMETRY.record_call(self.name, latency, getattr(response, 'usage', None))
+                self.call_count += 1
+                if hasattr(response, 'usage'):
+                    self.total_tokens += response.usage.total_tokens
+                
+                content = response.choices[0].message.content
+                if key is not None:
+                    self.cache.set(key, content, self.model)
+                return content
+                
+            except Exception as e:
+                self.breaker.record_failure(e)
+                TELEMETRY.record_call(self.name, time.perf_counter() - start, error=e)
+                print(f"❌ [{self.name}] 调用失败 (尝试 {retry.attempt + 1}/{retry.max_attempts}): {str(e)}")
+                # 4xx 不重试; 熔断器已打开时交给管理器绕行; 其余按重试策略退避 (遵守 Retry-After 和全局重试预算)
+                delay = retry.next_delay(e)
+                if delay is None or not self.breaker.is_available():
+                    raise
+                TELEMETRY.record_retry(self.name)
+                if delay:
+                    time.sleep(delay)
+    
+    def stream(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        agent: Optional[str] = None
+    ) -> ChatStream:
+        """
+        流式调用 LLM, 返回可迭代的 ChatStream
+        迭代结束后统计 tokens, 并把完整文本写入缓存
+        """
+        messages = fit_messages(messages, self.model)
+        key, cached = self._cache_lookup(messages, temperature, use_cache)
+        if cached is None:
+            self._check_breaker()
+        
+        def on_finish(stream: ChatStream):
+            self.call_count += 1
+            if stream.usage is not None:
+                self.total_tokens += stream.usage.total_tokens
+            if key is not None:
+                self.cache.set(key, stream.text, self.model)
+        
+        return ChatStream(
+            self.client, self.model, messages, temperature,
+            name=self.name,
+            limiter=self.limiter,
+            on_finish=on_finish,
+            cached=cached,
+            engine=self.name,
+            agent=agent,
+            breaker=self.breaker  # 流读完记成功, 中途出错记失败
+        )
+    
+    def _get_async_client(self) -> "AsyncOpenAI":
+        """获取绑定当前事件循环的共享异步客户端"""
+        return get_async_client(self.api_key, self.base_url)
+    
+    async def achat(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        max_retries: int = 3,
+        use_cache: bool = True
+    ):
+        """异步调用 LLM (与 chat 行为一致, 可并发)"""
+        messages = fit_messages(messages, self.model)
+        key, cached = self._cache_lookup(messages, temperature, use_cache)
+        if cached is not None:
+            return cached
+        
+        flight_key = key or request_key(self.base_url, model=self.model, messages=messages, temperature=temperature)
+        upstream = lambda: ASYNC_SINGLE_FLIGHT.do(
+            flight_key,
+            lambda: self._achat_upstream(messages, temperature, max_retries, key)
+        )
+        if self.semantic_cache is None or not use_cache:
+            return await upstream()
+        text, namespace = self._semantic_key(messages)
+        return await self.semantic_cache.aget_or_compute(text, upstream, namespace, temperature)
+    
+    async def _achat_upstream(self, messages: list, temperature: float, max_retries: int, key: Optional[str]):
+        """真正向上游发请求 (含限流和重试)"""
+        estimated = estimate_request_tokens(messages)
+        retry = LLM_RETRY.start(max_attempts=max_retries, paced_throttle=True)
+        while True:
+            self._check_breaker()
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature
-                )
+                start = time.perf_counter()
+                async with GOVERNOR.aslot(self.pool), self.limiter.aslot(estimated) as slot:
+                    response = await self._get_async_client().chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature
+                    )
+                    if hasattr(response, 'usage'):
+                        slot.actual_tokens = response.usage.total_tokens
                 
                 # 统计
+                latency = time.perf_counter() - start
+                self.latencies.append(latency)
+                self.breaker.record_success(latency)
+                TELEMETRY.record_call(self.name, latency, getattr(response, 'usage', None))
                 self.call_count += 1
                 if hasattr(response, 'usage'):
                     self.total_tokens += response.usage.total_tokens
                 
-                return response.choices[0].message.content
+                content = response.choices[0].message.content
+                if key is not None:
+                    self.cache.set(key, content, self.model)
+                return content
                 
             except Exception as e:
-                print(f"❌ [{self.name}] 调用失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-                if attempt == max_retries - 1:
+                self.breaker.record_failure(e)
+                TELEMETRY.record_call(self.name, time.perf_counter() - start, error=e)
+                print(f"❌ [{self.name}] 调用失败 (尝试 {retry.attempt + 1}/{retry.max_attempts}): {str(e)}")
+                delay = retry.next_delay(e)
+                if delay is None or not self.breaker.is_available():
                     raise
-                time.sleep(2 ** attempt)  # 指数退避
+                TELEMETRY.record_retry(self.name)
+                if delay:
+                    await asyncio.sleep(delay)
         
     def get_stats(self):
         """获取统计信息"""
         return {
             "name": self.name,
             "calls": self.call_count,
-            "tokens": self.total_tokens
+            "tokens": self.total_tokens,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "breaker": self.breaker.state,
+            "health": round(self.breaker.health_score(), 3)
         }
 
 # ========== 专业化 LLM 客户端 ==========
@@ -126,8 +409,37 @@ class MultiLLMManager:
     模拟 BettaFish 的多模型架构
     """
     
-    def __init__(self):
+    # 对冲请求的备用引擎: 主引擎超过 p95 仍未返回时, 把同一任务发给备用引擎
+    HEDGE_FALLBACKS = {
+        'query': 'insight',
+        'insight': 'query',
+        'media': 'query',
+        'report': 'forum',
+        'forum': 'report'
+    }
+    HEDGE_DEFAULT_DELAY = 10.0  # 主引擎样本不足时的对冲等待秒数
+    
+    # 所有引擎共用的系统提示, 放在最前面: 各引擎的请求共享同一段前缀, 提供方的前缀缓存才能命中
+    SHARED_SYSTEM_PROMPT = """你是 BettaFish 舆情分析系统中的一个专业引擎, 与数据分析、媒体内容、信息检索、报告生成和论坛主持引擎协作完成分析。
+请只从你负责的专业角度回答; 有依据的结论优先, 不确定的地方明确说明; 提供了背景信息时以背景信息为准, 不要编造。"""
+    
+    # 语义缓存比较的是整段多变内容 (背景 + 任务), 阈值比搜索词严格
+    SEMANTIC_THRESHOLD = 0.95
+    
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        enable_cache: bool = True,
+        semantic_cache: Optional[SemanticCache] = None
+    ):
+        """
+        Args:
+            cache: 共享响应缓存, 不传则使用默认路径的 SQLite 缓存
+            enable_cache: 为 False 时完全关闭缓存 (含语义缓存)
+            semantic_cache: 共享语义缓存, 不传则使用默认路径, 阈值为 SEMANTIC_THRESHOLD
+        """
         print("🚀 初始化多 LLM 管理器...")
+        load_env()  # 各引擎在构造时读取 *_API_KEY / *_BASE_URL
         
         # 初始化所有 LLM
         self.llms = {
@@ -137,17 +449,120 @@ class MultiLLMManager:
             'report': ReportLLM(),
             'forum': ForumLLM()
         }
+        self.last_parallel_timing = None  # 最近一次并行分析的耗时
+        
+        # 对冲统计
+        self.hedge_stats = {"calls": 0, "hedged": 0, "backup_wins": 0, "saved_seconds": 0.0}
+        self.hedge_latencies = deque(maxlen=500)
+        
+        # 熔断绕行统计
+        self.route_stats = {"rerouted": 0, "failovers": 0}
+        
+        # 模型路由: 选中的模型与角色引擎的默认模型不同时, 按 (模型, 提供方) 复用一个客户端
+        self.router = ROUTER
+        self.model_clients: Dict[tuple, LLMClient] = {}
+        
+        # 所有引擎共享一个响应缓存
+        self.cache = (cache or ResponseCache()) if enable_cache else None
+        self.semantic_cache = (
+            semantic_cache or SemanticCache("llm", threshold=self.SEMANTIC_THRESHOLD)
+        ) if enable_cache else None
+        for llm in self.llms.values():
+            llm.cache = self.cache
+            llm.semantic_cache = self.semantic_cache
         
         print("✅ 5 个专业 LLM 已就绪\n")
         for name, llm in self.llms.items():
             print(f"   📌 {llm.name}: {llm.specialty}")
     
+    def _build_messages(self, llm: LLMClient, task: str, context: str = "") -> list:
+        """
+        构建专业化提示
+        顺序从稳定到多变: 共享系统提示 → 引擎角色 (每个引擎固定) → 背景信息 → 任务
+        """
+        messages = [
+            {"role": "system", "content": self.SHARED_SYSTEM_PROMPT},
+            {"role": "system", "content": f"你是 {llm.name}。\n你的专长: {llm.specialty}"}
+        ]
+        
+        if context:
+            messages.append({"role": "user", "content": f"背景信息:\n{context}"})
+        
+        messages.append({"role": "user", "content": f"任务:\n{task}"})
+        
+        return messages
+    
+    def _route(self, agent_type: str, exclude=()) -> Optional[str]:
+        """
+        健康路由
+        指定引擎可用时直接使用; 熔断中则选健康分最高的可用引擎 (同分优先对冲备用引擎),
+        没有可用引擎返回 None
+        """
+        llm = self.llms[agent_type]
+        if agent_type not in exclude and llm.breaker.is_available():
+            return agent_type
+        
+        preferred = self.HEDGE_FALLBACKS.get(agent_type)
+        candidates = [
+            t for t, other in self.llms.items()
+            if t != agent_type and t not in exclude and other.breaker.is_available()
+        ]
+        if not candidates:
+            return None
+        best = max(candidates, key=lambda t: (round(self.llms[t].breaker.health_score(), 2), t == preferred))
+        print(f"   🔀 [{llm.name}] 熔断中, 改用 [{self.llms[best].name}]")
+        return best
+    
+    def _failover(self, agent_type: str, failed: str) -> Optional[str]:
+        """调用失败后: 只有失败的引擎因此熔断时才换一个引擎重试"""
+        if self.llms[failed].breaker.is_available():
+            return None
+        fallback = self._route(agent_type, exclude={failed})
+        if fallback is not None:
+            self.route_stats["failovers"] += 1
+        return fallback
+    
+    def _routed(self, agent_type: str) -> str:
+        """路由并计数; 全部熔断时仍返回原引擎 (调用会立即抛出 CircuitOpenError)"""
+        routed = self._route(agent_type) or agent_type
+        if routed != agent_type:
+            self.route_stats["rerouted"] += 1
+        return routed
+    
+    def _model_client(self, llm: LLMClient, task_type: Optional[str], messages: list) -> LLMClient:
+        """
+        模型路由
+        提示词仍按角色引擎构建, 执行请求的客户端换成路由选中的模型; 没有 task_type 或选中的就是默认模型时返回原引擎
+        """
+        if not task_type:
+            return llm
+        decision = self.router.route(task_type, messages, base_url=llm.base_url)
+        if not decision.routed:
+            return llm
+        base_url = decision.base_url or llm.base_url
+        if decision.model == llm.model and same_provider(base_url, llm.base_url):
+            return llm
+        # 同一提供方可以沿用引擎的 Key; 别的提供方的候选一定带自己的 Key (否则路由时已淘汰)
+        api_key = decision.api_key or (llm.api_key if same_provider(base_url, llm.base_url) else None)
+        key = (decision.model, base_url)
+        client = self.model_clients.get(key)
+        if client is None:
+            # 引擎名用模型名, 遥测按模型统计的实测延迟会反馈给路由
+            client = LLMClient(decision.model, api_key, base_url, decision.model, cache=self.cache)
+            client.specialty = llm.specialty
+            client.semantic_cache = self.semantic_cache
+            self.model_clients[key] = client
+        return client
+    
     def call_agent(
         self, 
         agent_type: Literal['insight', 'media', 'query', 'report', 'forum'],
         task: str,
         context: str = "",
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        hedge: bool = False,
+        task_type: Optional[str] = None
     ) -> str:
         """
         调用指定 Agent 的 LLM
@@ -157,65 +572,225 @@ class MultiLLMManager:
             task: 任务描述
             context: 上下文信息
             temperature: 温度参数
+            use_cache: 是否使用响应缓存
+            hedge: 是否启用对冲 (主引擎超过 p95 未返回时请求备用引擎)
+            task_type: 任务类型 (sql / decision / analysis / synthesis / report), 传了才做模型路由;
+                       对冲调用固定使用角色引擎, 不做模型路由
         """
-        llm = self.llms[agent_type]
+        if hedge:
+            return run_sync(self.acall_agent(agent_type, task, context, temperature, use_cache, hedge=True))
         
-        # 构建专业化提示
-        system_prompt = f"""你是 BettaFish 系统的 {llm.name}。
-
-你的专长: {llm.specialty}
-
-请根据你的专业能力完成任务。"""
+        with agent_context(agent_type):
+            routed = self._routed(agent_type)
+            llm = self.llms[routed]
+            messages = self._build_messages(llm, task, context)
+            runner = self._model_client(llm, task_type, messages)
+            
+            print(f"\n🤖 调用 [{llm.name}]" + (f" → {runner.model}" if runner is not llm else ""))
+            print(f"   任务: {task[:50]}...")
+            
+            try:
+                result = runner.chat(messages, temperature, use_cache=use_cache)
+            except Exception:
+                fallback = self._failover(agent_type, routed)
+                if fallback is None:
+                    raise
+                llm = self.llms[fallback]
+                result = llm.chat(self._build_messages(llm, task, context), temperature, use_cache=use_cache)
         
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
+        print(f"   ✅ 完成")
         
-        if context:
-            messages.append({"role": "user", "content": f"背景信息:\n{context}"})
+        return result
+    
+    def stream_agent(
+        self, 
+        agent_type: Literal['insight', 'media', 'query', 'report', 'forum'],
+        task: str,
+        context: str = "",
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        task_type: Optional[str] = None
+    ) -> ChatStream:
+        """call_agent 的流式版本, 调用方迭代得到文本块"""
+        llm = self.llms[self._routed(agent_type)]
+        messages = self._build_messages(llm, task, context)
         
-        messages.append({"role": "user", "content": f"任务:\n{task}"})
+        with agent_context(agent_type):
+            runner = self._model_client(llm, task_type, messages)
+            print(f"\n🤖 调用 [{llm.name}]" + (f" → {runner.model}" if runner is not llm else "") + " (流式)")
+            print(f"   任务: {task[:50]}...")
+            return runner.stream(messages, temperature, use_cache=use_cache, agent=agent_type)
+    
+    async def acall_agent(
+        self, 
+        agent_type: Literal['insight', 'media', 'query', 'report', 'forum'],
+        task: str,
+        context: str = "",
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        hedge: bool = False,
+        task_type: Optional[str] = None
+    ) -> str:
+        """call_agent 的异步版本, 用于并发扇出"""
+        with agent_context(agent_type):
+            return await self._acall_agent(agent_type, task, context, temperature, use_cache, hedge, task_type=task_type)
+    
+    async def _acall_agent(
+        self,
+        agent_type: str,
+        task: str,
+        context: str,
+        temperature: float,
+        use_cache: bool,
+        hedge: bool,
+        quiet: bool = False,
+        task_type: Optional[str] = None
+    ) -> str:
+        routed = self._routed(agent_type)
+        llm = self.llms[routed]
+        messages = self._build_messages(llm, task, context)
+        runner = llm if hedge else self._model_client(llm, task_type, messages)
         
-        print(f"\n🤖 调用 [{llm.name}]")
-        print(f"   任务: {task[:50]}...")
+        if not quiet:
+            print(f"\n🤖 调用 [{llm.name}]" + (f" → {runner.model}" if runner is not llm else "") + " (异步)")
+            print(f"   任务: {task[:50]}...")
         
-        result = llm.chat(messages, temperature)
+        try:
+            if hedge:
+                result = await self._ahedged_chat(routed, task, context, temperature, use_cache)
+            else:
+                result = await runner.achat(messages, temperature, use_cache=use_cache)
+        except Exception:
+            fallback = self._failover(agent_type, routed)
+            if fallback is None:
+                raise
+            llm = self.llms[fallback]
+            result = await llm.achat(self._build_messages(llm, task, context), temperature, use_cache=use_cache)
         
-        print(f"   ✅ 完成")
+        if not quiet:
+            print(f"   ✅ [{llm.name}] 完成")
         
         return result
     
-    def parallel_analysis(self, topic: str) -> Dict[str, str]:
+    async def _ahedged_chat(
+        self,
+        agent_type: str,
+        task: str,
+        context: str,
+        temperature: float,
+        use_cache: bool
+    ) -> str:
+        """
+        对冲调用
+        主引擎超过其 p95 耗时仍未返回时, 把同一任务发给备用引擎,
+        先成功的结果胜出, 另一个请求被取消
+        """
+        primary_llm = self.llms[agent_type]
+        primary = asyncio.ensure_future(primary_llm.achat(
+            self._build_messages(primary_llm, task, context), temperature, use_cache=use_cache
+        ))
+        
+        fallback_type = self.HEDGE_FALLBACKS.get(agent_type)
+        if fallback_type is None or not self.llms[fallback_type].breaker.is_available():
+            return await primary
+        
+        self.hedge_stats["calls"] += 1
+        start = time.perf_counter()
+        delay = primary_llm.latency_p95() or self.HEDGE_DEFAULT_DELAY
+        
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            result = primary.result()
+            self.hedge_latencies.append(time.perf_counter() - start)
+            return result
+        
+        # 主引擎已经超过 p95, 发出对冲请求
+        fallback_llm = self.llms[fallback_type]
+        self.hedge_stats["hedged"] += 1
+        print(f"   ⏳ [{primary_llm.name}] 超过 p95 ({delay:.1f}s), 对冲到 [{fallback_llm.name}]")
+        backup = asyncio.ensure_future(fallback_llm.achat(
+            self._build_messages(fallback_llm, task, context), temperature, use_cache=use_cache
+        ))
+        
+        winner = None
+        pending = {primary, backup}
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None:
+                    winner = finished
+                    break
+        
+        for loser in pending:
+            loser.cancel()
+        
+        if winner is None:
+            return primary.result()  # 两个都失败, 抛出主引擎的异常
+        
+        elapsed = time.perf_counter() - start
+        if winner is backup:
+            # 主引擎被取消, 无法得知它本来要多久; 用它历史上慢请求 (>= p95) 的平均耗时估算
+            tail = [x for x in primary_llm.latencies if x >= delay]
+            expected = sum(tail) / len(tail) if tail else delay
+            self.hedge_stats["backup_wins"] += 1
+            self.hedge_stats["saved_seconds"] += max(0.0, expected - elapsed)
+            print(f"   🏁 备用引擎 [{fallback_llm.name}] 先返回")
+        self.hedge_latencies.append(elapsed)
+        return winner.result()
+    
+    def parallel_analysis(self, topic: str, hedge: bool = False) -> Dict[str, str]:
         """
         并行分析 - 多个 Agent 同时工作
-        模拟 BettaFish 的并行架构
+        模拟 BettaFish 的并行架构 (同步包装, 内部并发执行)
+        """
+        return run_sync(self.aparallel_analysis(topic, hedge=hedge))
+    
+    async def aparallel_analysis(self, topic: str, hedge: bool = False) -> Dict[str, str]:
+        """
+        并行分析的异步实现
+        三个引擎并发调用, 总耗时取决于最慢的那个
         """
         print(f"\n{'='*60}")
         print(f"🔄 并行分析主题: {topic}")
         print(f"{'='*60}")
         
-        results = {}
+        jobs = {
+            # Agent 1: Insight - 数据视角
+            'insight': (f"从数据分析角度,分析主题: {topic}", 0.3),
+            # Agent 2: Query - 搜索视角
+            'query': (f"从信息检索角度,需要搜索什么来了解: {topic}", 0.5),
+            # Agent 3: Media - 内容视角
+            'media': (f"从内容分析角度,这个主题的关键要素: {topic}", 0.7),
+        }
         
-        # Agent 1: Insight - 数据视角
-        results['insight'] = self.call_agent(
-            'insight',
-            f"从数据分析角度,分析主题: {topic}",
-            temperature=0.3
-        )
+        async def timed_call(agent_type, task, temperature):
+            start = time.perf_counter()
+            result = await self.acall_agent(agent_type, task, temperature=temperature, hedge=hedge, task_type="analysis")
+            return result, time.perf_counter() - start
         
-        # Agent 2: Query - 搜索视角
-        results['query'] = self.call_agent(
-            'query',
-            f"从信息检索角度,需要搜索什么来了解: {topic}",
-            temperature=0.5
-        )
+        wall_start = time.perf_counter()
+        outputs = await asyncio.gather(*[
+            timed_call(agent_type, task, temperature)
+            for agent_type, (task, temperature) in jobs.items()
+        ])
+        wall_time = time.perf_counter() - wall_start
         
-        # Agent 3: Media - 内容视角
-        results['media'] = self.call_agent(
-            'media',
-            f"从内容分析角度,这个主题的关键要素: {topic}",
-            temperature=0.7
-        )
+        results = {}
+        latencies = {}
+        for agent_type, (result, latency) in zip(jobs, outputs):
+            results[agent_type] = result
+            latencies[agent_type] = latency
+        
+        summed = sum(latencies.values())
+        self.last_parallel_timing = {
+            "wall_time": wall_time,
+            "summed_latency": summed,
+            "latencies": latencies
+        }
+        
+        print(f"\n⏱️  并行耗时: {wall_time:.2f}s | 各调用累计: {summed:.2f}s | 加速比: {summed / wall_time if wall_time else 0:.2f}x")
+        for agent_type, latency in latencies.items():
+            print(f"   {agent_type:8} {latency:.2f}s")
         
         return results
     
@@ -224,41 +799,158 @@ class MultiLLMManager:
         Forum 综合 - 整合多个 Agent 的结果
         模拟 BettaFish 的 Forum Host
         """
+        return self.call_agent(
+            'forum',
+            self._synthesis_prompt(agent_results),
+            temperature=0.5,
+            task_type="synthesis"
+        )
+    
+    async def aforum_synthesis(self, agent_results: Dict[str, str]) -> str:
+        """Forum 综合的异步版本 (多主题并发时使用)"""
+        return await self.acall_agent(
+            'forum',
+            self._synthesis_prompt(agent_results),
+            temperature=0.5,
+            task_type="synthesis"
+        )
+    
+    def _synthesis_prompt(self, agent_results: Dict[str, str]) -> str:
         print(f"\n{'='*60}")
         print(f"🎯 Forum Host 综合分析")
         print(f"{'='*60}")
         
         # 构建综合提示
-        synthesis_prompt = "请综合以下三个专业 Agent 的分析,给出完整结论:\n\n"
+        header = "请综合以下三个专业 Agent 的分析,给出完整结论:\n\n"
+        footer = "请整合以上观点,识别共识和差异,给出综合结论。"
         
-        for agent_name, result in agent_results.items():
-            synthesis_prompt += f"【{agent_name.upper()} Agent 分析】:\n{result}\n\n"
-        
-        synthesis_prompt += "请整合以上观点,识别共识和差异,给出综合结论。"
-        
-        final_result = self.call_agent(
-            'forum',
-            synthesis_prompt,
-            temperature=0.5
-        )
+        # 各 Agent 结果同等重要: 超出预算时按比例截短最长的那几份
+        blocks = [
+            f"【{agent_name.upper()} Agent 分析】:\n{result}\n\n"
+            for agent_name, result in agent_results.items()
+        ]
+        budget = prompt_budget(self.llms['forum'].model) - count_tokens(header + footer) - 200  # 200: system 提示
+        blocks = fit_blocks(blocks, budget, priorities=[0] * len(blocks))
         
-        return final_result
+        return header + "".join(blocks) + footer
     
-    def generate_report(self, synthesis: str, topic: str) -> str:
+    def generate_report(self, synthesis: str, topic: str, stream: bool = False) -> str:
         """
         生成报告 - Report Engine
+        
+        Args:
+            stream: 为 True 时边生成边打印, 返回值不变
         """
+        task = self._report_task(synthesis, topic)
+        
+        if stream:
+            chat_stream = self.stream_agent('report', task, temperature=0.6, task_type="report")
+            print()
+            report = chat_stream.consume(print_chunk)
+            print(f"\n   ✅ 完成 (TTFT: {chat_stream.ttft:.2f}s)")
+            return report
+        
+        report = self.call_agent('report', task, temperature=0.6, task_type="report")
+        
+        return report
+    
+    async def agenerate_report(self, synthesis: str, topic: str) -> str:
+        """生成报告的异步版本 (不支持流式)"""
+        return await self.acall_agent('report', self._report_task(synthesis, topic), temperature=0.6, task_type="report")
+    
+    def _report_task(self, synthesis: str, topic: str) -> str:
         print(f"\n{'='*60}")
         print(f"📝 生成最终报告")
         print(f"{'='*60}")
         
-        report = self.call_agent(
-            'report',
-            f"基于以下综合分析,撰写一份关于'{topic}'的简短报告:\n\n{synthesis}",
-            temperature=0.6
+        return f"基于以下综合分析,撰写一份关于'{topic}'的简短报告:\n\n{synthesis}"
+    
+    def submit_batch(
+        self,
+        requests: Optional[List[Dict]] = None,
+        batch_id: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        use_cache: bool = True,
+        batch_dir: str = DEFAULT_BATCH_DIR
+    ) -> BatchJob:
+        """
+        提交批量任务, 立即返回, 请求在后台事件循环中并发执行
+        
+        Args:
+            requests: [{"custom_id", "agent_type", "task", "context"?, "temperature"?, "task_type"?}];
+                      为 None 时续跑 batch_id 已有的请求文件
+            batch_id: 批次名, 对应 <batch_dir>/<batch_id>.jsonl 和 .results.jsonl;
+                      崩溃后用同一个 batch_id 重新提交, 已成功的 custom_id 会跳过;
+                      已有批次只能用相同的 requests 或 None 续跑, 换了请求会报 FileExistsError
+            concurrency: worker 数, 默认等于相关提供方并发窗口上限之和 (吞吐量交给限流器决定)
+            use_cache: 是否使用响应缓存
+        """
+        batch_id = batch_id or new_batch_id()
+        input_path, output_path = batch_paths(batch_id, batch_dir)
+        
+        if requests is not None:
+            unknown = {r.get("agent_type") for r in requests} - set(self.llms)
+            if unknown:
+                raise ValueError(f"未知的 agent_type: {unknown}")
+            write_batch_file(input_path, requests)
+        elif not os.path.exists(input_path):
+            raise FileNotFoundError(f"批次 {batch_id} 没有请求文件: {input_path}")
+        
+        total = count_requests(input_path)
+        job = BatchJob(batch_id, input_path, output_path, total, skipped=len(completed_ids(output_path)))
+        concurrency = concurrency or self._batch_concurrency()
+        
+        print(f"📦 提交批次 {batch_id}: {total} 个请求 | 已完成 {job.skipped} 个 | worker: {concurrency}")
+        job.future = asyncio.run_coroutine_threadsafe(
+            carry_context(run_batch(job, lambda r: self._abatch_call(r, use_cache), concurrency)),
+            _get_background_loop()
         )
+        return job
+    
+    def collect_batch(
+        self,
+        job: Union[BatchJob, str],
+        wait: bool = True,
+        timeout: Optional[float] = None,
+        batch_dir: str = DEFAULT_BATCH_DIR
+    ) -> Dict[str, Dict]:
+        """
+        读取批次结果 {custom_id: {"status", "result" | "error", "latency", ...}}
         
-        return report
+        Args:
+            job: submit_batch 返回的 BatchJob, 或 batch_id (读取已落盘的结果, 不等待)
+            wait: 为 True 时等批次跑完再读
+        """
+        if isinstance(job, BatchJob):
+            if wait:
+                job.wait(timeout)
+            output_path = job.output_path
+        else:
+            output_path = batch_paths(job, batch_dir)[1]
+        
+        results = load_results(output_path)
+        summary = summarize(results)
+        print(f"📦 批次结果: 成功 {summary['succeeded']} | 失败 {len(summary['failed'])} | 文件: {output_path}")
+        return results
+    
+    def _batch_concurrency(self) -> int:
+        """各提供方并发窗口上限之和; 实际并发仍由限流器的 AIMD 窗口控制"""
+        limiters = {id(llm.limiter): llm.limiter for llm in self.llms.values()}
+        return sum(limiter.max_concurrency for limiter in limiters.values())
+    
+    async def _abatch_call(self, request: Dict, use_cache: bool) -> str:
+        agent_type = request["agent_type"]
+        with agent_context(agent_type):
+            return await self._acall_agent(
+                agent_type,
+                request["task"],
+                request.get("context", ""),
+                request.get("temperature", 0.7),
+                use_cache,
+                hedge=False,
+                quiet=True,
+                task_type=request.get("task_type")
+            )
     
     def print_statistics(self):
         """打印统计信息"""
@@ -266,17 +958,58 @@ class MultiLLMManager:
         print("📊 LLM 使用统计")
         print(f"{'='*60}")
         
-        total_calls = 0
-        total_tokens = 0
+        # 按引擎 (含 Agent 直接调用的模型)
+        by_engine = TELEMETRY.summary("engine")
+        TELEMETRY.print_summary("engine")
+        
+        total_calls = sum(row['calls'] for row in by_engine.values())
+        total_prompt = sum(row['prompt_tokens'] for row in by_engine.values())
+        total_completion = sum(row['completion_tokens'] for row in by_engine.values())
+        total_hits = sum(row['cache_hits'] for row in by_engine.values())
+        total_misses = sum(row['cache_misses'] for row in by_engine.values())
+        total_retries = sum(row['retries'] for row in by_engine.values())
         
+        print(f"{'-'*60}")
+        print(f"{'总计':20} | 调用: {total_calls:3} 次 | Tokens: {total_prompt}+{total_completion} | "
+              f"重试: {total_retries} | 缓存命中/未命中: {total_hits}/{total_misses}")
+        if total_hits + total_misses:
+            print(f"{'缓存命中率':20} | {total_hits / (total_hits + total_misses):.1%}")
+        if self.semantic_cache is not None:
+            self.semantic_cache.print_summary()
+        
+        # 按 Agent
+        print(f"{'-'*60}")
+        TELEMETRY.print_summary("agent")
+        TELEMETRY.print_prompt_cache("agent")
+        TELEMETRY.print_stages()
+        
+        print(f"{'-'*60}")
         for name, llm in self.llms.items():
-            stats = llm.get_stats()
-            total_calls += stats['calls']
-            total_tokens += stats['tokens']
-            print(f"{stats['name']:20} | 调用: {stats['calls']:3} 次 | Tokens: {stats['tokens']:6}")
+            stats = llm.breaker.get_stats()
+            print(f"🩺 {llm.name:20} | 熔断器: {stats['state']:9} | 健康分: {stats['health']:.2f} | "
+                  f"熔断 {stats['trips']} 次 | 快速失败 {stats['rejected']} 次")
+        if self.route_stats["rerouted"] or self.route_stats["failovers"]:
+            print(f"🔀 绕行: 调用前改道 {self.route_stats['rerouted']} 次 | 失败后换引擎 {self.route_stats['failovers']} 次")
+        self.router.print_summary()
         
         print(f"{'-'*60}")
-        print(f"{'总计':20} | 调用: {total_calls:3} 次 | Tokens: {total_tokens:6}")
+        for limiter in all_limiters():
+            stats = limiter.get_stats()
+            print(f"🚦 {stats['name']} | 并发窗口: {stats['window']} | 限流次数: {stats['throttled']} | 排队: {stats['total_wait']}s")
+        print_retry_summary()
+        GOVERNOR.print_summary()
+        STREAM_STATS.print_summary()
+        if self.hedge_stats["calls"]:
+            hedge_rate = self.hedge_stats["hedged"] / self.hedge_stats["calls"]
+            hedged_p95 = percentile(self.hedge_latencies, 95) or 0.0
+            print(f"🛡️ 对冲: {self.hedge_stats['calls']} 次调用 | 触发 {self.hedge_stats['hedged']} 次 ({hedge_rate:.1%}) | "
+                  f"备用胜出 {self.hedge_stats['backup_wins']} 次 | 额外请求 {self.hedge_stats['hedged']} 次")
+            print(f"   对冲调用 p95: {hedged_p95:.2f}s | 估算节省 (保守): {self.hedge_stats['saved_seconds']:.2f}s")
+        budget = BUDGET_STATS.get_stats()
+        if budget["trimmed"]:
+            print(f"✂️ 预算裁剪: {budget['trimmed']} 次 (检查 {budget['checked']} 次请求) | 裁掉约 {budget['tokens_removed']} tokens")
+        flights = get_singleflight_stats()
+        print(f"🔗 请求合并: 实际发送 {flights['executed']} 次 | 合并节省 {flights['saved']} 次")
         print(f"{'='*60}")
 
 # ========== 测试示例 ==========
@@ -291,14 +1024,17 @@ def demo_bettafish_workflow():
     # 分析主题
     topic = "2024年诺贝尔物理学奖的意义"
     
-    # 阶段1: 并行分析
-    agent_results = manager.parallel_analysis(topic)
+    # 阶段1: 并行分析 (开启对冲, 单个慢引擎不拖住整个流程)
+    with TELEMETRY.stage("1_parallel_analysis"):
+        agent_results = manager.parallel_analysis(topic, hedge=True)
     
     # 阶段2: Forum 综合
-    synthesis = manager.forum_synthesis(agent_results)
+    with TELEMETRY.stage("2_forum_synthesis"):
+        synthesis = manager.forum_synthesis(agent_results)
     
-    # 阶段3: 生成报告
-    report = manager.generate_report(synthesis, topic)
+    # 阶段3: 生成报告 (流式输出, 不用等整篇写完)
+    with TELEMETRY.stage("3_generate_report"):
+        report = manager.generate_report(synthesis, topic, stream=True)
     
     # 展示结果
     print(f"\n{'='*60}")
@@ -0,0 +1,249 @@
+"""
+自适应限流 - 令牌桶 + AIMD 并发窗口
+学习目标:
+1. 令牌桶: 按 请求数/分钟 和 tokens/分钟 平滑发送
+2. AIMD: 成功时并发窗口加性增长, 遇到 429/5xx 乘性收缩
+3. 同一个 base_url + api_key 的所有引擎共享一个限流器
+4. 等待都不轮询: 速率不够时按 缺口 / 补充速率 睡眠; 窗口满时挂起, 有请求归还许可时才唤醒
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, List, Optional
+from token_budget import count_message_tokens
+
+DEFAULT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "60"))
+DEFAULT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "200000"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """429 和 5xx 说明服务端已过载, 需要收缩窗口"""
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def estimate_request_tokens(messages: list, completion_reserve: int = 500) -> int:
+    """估算请求 tokens: 本地估算的提示 tokens + 回复预留"""
+    return count_message_tokens(messages) + completion_reserve
+
+
+class TokenBucket:
+    """
+    令牌桶 (预留式)
+    reserve() 立即扣减并返回需要等待的时间, 调用方睡眠后发送,
+    这样多个调用方按速率排队, 不会同时醒来形成突发
+    """
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity or rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预留 amount 个令牌, 返回需要等待的秒数"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def adjust(self, delta: float):
+        """按实际用量修正 (delta > 0 表示多用了)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def drain(self):
+        """清空令牌, 之后的请求严格按速率排队"""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+class RequestSlot:
+    """一次请求占用的限流资源"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None  # 调用方拿到 usage 后填写
+
+
+class ProviderLimiter:
+    """
+    单个提供方 (base_url + api_key) 的限流器
+    所有引擎共享, 保证整体不超过提供方的上限
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = DEFAULT_RPM,
+        tpm: int = DEFAULT_TPM,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        min_concurrency: int = 1
+    ):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.window = max(float(min_concurrency), max_concurrency / 2)  # 从一半开始探测
+        self.in_flight = 0
+
+        self.throttled = 0     # 收到 429/5xx 的次数
+        self.total_wait = 0.0  # 排队等待的总秒数
+
+        self._cond = threading.Condition()
+        # 等窗口的协程: (事件循环, future), release() 时跨线程唤醒
+        self._async_waiters: List[tuple] = []
+
+    def _has_room(self) -> bool:
+        return self.in_flight < max(self.min_concurrency, int(self.window))
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        """进入窗口后预留速率配额, 返回需要等待的秒数"""
+        self.in_flight += 1
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        self.total_wait += wait
+        return wait
+
+    def acquire(self, estimated_tokens: int) -> RequestSlot:
+        """同步获取发送许可 (阻塞)"""
+        with self._cond:
+            while not self._has_room():
+                self._cond.wait()
+            wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return RequestSlot(estimated_tokens)
+
+    async def aacquire(self, estimated_tokens: int) -> RequestSlot:
+        """异步获取发送许可 (窗口满时挂起, 不占事件循环)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._has_room():
+                    wait = self._reserve(estimated_tokens)
+                    break
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+        slot = RequestSlot(estimated_tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 已经计入 in_flight, 调用方拿不到 slot 也就不会归还, 这里归还 (对冲落败 / 超时都会走到这里)
+                self.release(slot, cancelled=True)
+                raise
+        return slot
+
+    def release(self, slot: RequestSlot, error: Optional[Exception] = None, cancelled: bool = False):
+        """归还许可, 并根据结果调整窗口 (被取消的请求不影响窗口)"""
+        with self._cond:
+            self.in_flight -= 1
+            if slot.actual_tokens is not None:
+                self.tokens.adjust(slot.actual_tokens - slot.estimated_tokens)
+
+            if cancelled:
+                pass
+            elif error is None:
+                # 加性增长: 约每一个窗口的成功请求 +1
+                self.window = min(self.max_concurrency, self.window + 1.0 / self.window)
+            elif is_throttle_error(error):
+                # 乘性收缩, 并清空请求桶让后续请求按速率排队
+                self.throttled += 1
+                self.window = max(self.min_concurrency, self.window / 2)
+                self.requests.drain()
+
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        # 和 notify_all 一样全部唤醒, 各自重新检查窗口
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    @contextmanager
+    def slot(self, estimated_tokens: int):
+        """with limiter.slot(n) as slot: ... 同步用法"""
+        request_slot = self.acquire(estimated_tokens)
+        error = None
+        finished = False
+        try:
+            yield request_slot
+            finished = True
+        except Exception as e:
+            error = e
+            finished = True
+            raise
+        finally:
+            # 流式读取被中途放弃 / 协程被取消时也要归还许可
+            self.release(request_slot, error, cancelled=not finished)
+
+    @asynccontextmanager
+    async def aslot(self, estimated_tokens: int):
+        """async with limiter.aslot(n) as slot: ... 异步用法"""
+        request_slot = await self.aacquire(estimated_tokens)
+        error = None
+        finished = False
+        try:
+            yield request_slot
+            finished = True
+        except Exception as e:
+            error = e
+            finished = True
+            raise
+        finally:
+            self.release(request_slot, error, cancelled=not finished)
+
+    def get_stats(self):
+        """获取统计信息"""
+        return {
+            "name": self.name,
+            "window": round(self.window, 2),
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "total_wait": round(self.total_wait, 2)
+        }
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# ========== 全局注册表 ==========
+
+_LIMITERS: Dict[tuple, ProviderLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(base_url: str, api_key: Optional[str]) -> ProviderLimiter:
+    """按 (base_url, api_key) 获取共享限流器"""
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+    key = (base_url, key_hash)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = ProviderLimiter(f"{base_url} ({key_hash})")
+            _LIMITERS[key] = limiter
+        return limiter
+
+
+def all_limiters():
+    """所有已创建的限流器"""
+    with _LIMITERS_LOCK:
+        return list(_LIMITERS.values())
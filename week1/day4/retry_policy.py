@@ -0,0 +1,321 @@
+"""
+重试策略 - 所有 LLM 调用和工具调用共用
+学习目标:
+1. 错误分类: 400/401/403/404/422 这类调用方的问题重试也没用, 直接抛出;
+   429、5xx、连接错误、超时可以重试; 熔断中 (CircuitOpenError) 不重试, 交给路由绕行
+2. Full jitter 退避: 等待 random(0, min(上限, 基数 × 2^第几次)), 大量客户端不会在同一时刻一起重试
+3. 服务端给了 Retry-After (秒数 / HTTP 日期 / retry-after-ms) 就按它等, 超过单次请求剩余时间时直接放弃
+4. 单次请求的重试预算: 最多尝试几次、从第一次发送起最多花多少秒
+5. 全局重试速率上限 (retry budget): 每个新请求存入 ratio 个重试令牌, 每次重试取 1 个, 另有每秒保底;
+   提供方整体故障时重试最多占正常请求量的 ratio, 不会层层叠加成重试风暴
+
+用法:
+    from retry_policy import LLM_RETRY, TOOL_RETRY
+
+    result = TOOL_RETRY.call(lambda: client.search(query=query))      # 简单调用点
+    result = await LLM_RETRY.acall(lambda: client.chat.completions.create(...))
+
+    retry = LLM_RETRY.start()                                         # 需要自己控制每次尝试时
+    while True:
+        try:
+            return send()
+        except Exception as e:
+            delay = retry.next_delay(e)   # None: 不再重试
+            if delay is None:
+                raise
+            time.sleep(delay)
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telemetry import TELEMETRY
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+DEFAULT_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+DEFAULT_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+DEFAULT_MAX_ELAPSED = float(os.getenv("LLM_RETRY_MAX_ELAPSED", "120"))   # 单次请求 (含所有重试) 最多花多少秒
+DEFAULT_RETRY_RATIO = float(os.getenv("LLM_RETRY_RATIO", "0.2"))        # 重试最多占新请求的比例
+DEFAULT_RETRY_MIN_PER_SEC = float(os.getenv("LLM_RETRY_MIN_PER_SEC", "1"))  # 请求很少时每秒保底的重试数
+
+# 错误类别
+RETRYABLE = "retryable"   # 5xx、连接错误、超时
+THROTTLED = "throttled"   # 429
+FATAL = "fatal"           # 4xx、熔断、代码错误
+
+# 没有状态码时, 类名 (含父类) 里带这些字样的异常算网络问题, 可以重试
+_TRANSIENT_NAMES = ("Timeout", "Connection", "Connect", "RemoteProtocol", "ReadError", "WriteError")
+
+
+# ========== 错误分类 ==========
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP 状态码: openai 异常带 status_code, requests / httpx 的异常挂在 response 上"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: Exception) -> str:
+    """返回 RETRYABLE / THROTTLED / FATAL"""
+    if type(error).__name__ == "CircuitOpenError":
+        return FATAL
+    status = error_status(error)
+    if status is not None:
+        if status == 429:
+            return THROTTLED
+        if status >= 500 or status == 408:
+            return RETRYABLE
+        return FATAL
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return RETRYABLE
+    names = [cls.__name__ for cls in type(error).__mro__]
+    if any(marker in name for name in names for marker in _TRANSIENT_NAMES):
+        return RETRYABLE
+    return FATAL
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从响应头读出服务端要求的等待秒数, 没有返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ========== 全局重试预算 ==========
+
+class RetryBudget:
+    """
+    全进程共享的重试令牌桶
+    每个新请求存入 ratio 个令牌 (上限 capacity), 每秒另补 min_per_sec 个; 每次重试取 1 个, 取不到就不重试
+    """
+
+    def __init__(
+        self,
+        ratio: float = DEFAULT_RETRY_RATIO,
+        min_per_sec: float = DEFAULT_RETRY_MIN_PER_SEC,
+        capacity: Optional[float] = None
+    ):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.capacity = capacity or max(10.0, min_per_sec * 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.min_per_sec)
+        self.updated = now
+
+    def deposit(self):
+        """一个新请求 (第一次尝试)"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """申请一次重试"""
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+RETRY_BUDGET = RetryBudget()
+
+
+# ========== 单次请求的重试状态 ==========
+
+class RetryState:
+    """一次逻辑请求 (含所有重试) 的进度, 由 RetryPolicy.start() 创建"""
+
+    def __init__(self, policy: "RetryPolicy", max_attempts: int, max_elapsed: float, paced_throttle: bool):
+        self.policy = policy
+        self.max_attempts = max_attempts
+        self.max_elapsed = max_elapsed
+        self.paced_throttle = paced_throttle
+        self.attempt = 0                  # 已失败的次数
+        self.started = time.monotonic()
+        policy.budget.deposit()
+        policy._count("requests")
+
+    def next_delay(self, error: Exception) -> Optional[float]:
+        """
+        记录一次失败, 返回重试前应等待的秒数; 返回 None 表示不应再重试 (调用方把异常抛出去)
+        """
+        self.attempt += 1
+        policy = self.policy
+        category = classify_error(error)
+        if category == FATAL:
+            policy._count("not_retryable")
+            return None
+        if self.attempt >= self.max_attempts:
+            policy._count("gave_up_attempts")
+            return None
+
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # 按服务端要求等, 加一点抖动错开同时收到 429 的请求
+            delay = retry_after + random.uniform(0, policy.base_delay)
+        elif category == THROTTLED and self.paced_throttle:
+            delay = 0.0
+        else:
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (self.attempt - 1)))
+
+        if time.monotonic() - self.started + delay > self.max_elapsed:
+            policy._count("gave_up_deadline")
+            return None
+        if not policy.budget.try_withdraw():
+            policy._count("gave_up_budget")
+            return None
+
+        policy._count("retries")
+        if retry_after is not None:
+            policy._count("retry_after")
+        policy.total_delay += delay
+        return delay
+
+
+# ========== 策略 ==========
+
+class RetryPolicy:
+    """一类调用 (LLM / 工具) 的重试参数和统计"""
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_elapsed: float = DEFAULT_MAX_ELAPSED,
+        budget: RetryBudget = RETRY_BUDGET
+    ):
+        """
+        Args:
+            budget: 全局重试预算, 默认所有策略共享一个
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.budget = budget
+        self.stats = defaultdict(int)
+        self.total_delay = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def start(
+        self,
+        max_attempts: Optional[int] = None,
+        max_elapsed: Optional[float] = None,
+        paced_throttle: bool = False
+    ) -> RetryState:
+        """
+        开始一次逻辑请求
+
+        Args:
+            paced_throttle: 调用方经过自适应限流器时设为 True, 没有 Retry-After 的 429 不再额外退避
+                            (限流器已收缩窗口并按速率排队)
+        """
+        return RetryState(self, max_attempts or self.max_attempts, max_elapsed or self.max_elapsed, paced_throttle)
+
+    def call(self, fn: Callable[[], Any], engine: Optional[str] = None, agent: Optional[str] = None,
+             max_attempts: Optional[int] = None, paced_throttle: bool = False) -> Any:
+        """
+        按策略执行 fn, 失败时退避重试
+
+        Args:
+            engine: 遥测里记录重试次数的引擎名, 不传则不记
+            paced_throttle: 同 start()
+        """
+        retry = self.start(max_attempts, paced_throttle=paced_throttle)
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                delay = retry.next_delay(e)
+                if delay is None:
+                    raise
+                self._log_retry(e, retry, delay, engine, agent)
+                if delay:
+                    time.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], engine: Optional[str] = None,
+                    agent: Optional[str] = None, max_attempts: Optional[int] = None) -> Any:
+        """call 的异步版本, fn 每次调用返回一个新的协程"""
+        retry = self.start(max_attempts)
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                delay = retry.next_delay(e)
+                if delay is None:
+                    raise
+                self._log_retry(e, retry, delay, engine, agent)
+                if delay:
+                    await asyncio.sleep(delay)
+
+    def _log_retry(self, error: Exception, retry: RetryState, delay: float,
+                   engine: Optional[str], agent: Optional[str]):
+        if engine:
+            TELEMETRY.record_retry(engine, agent)
+        print(f"   🔁 [{engine or self.name}] {type(error).__name__}, "
+              f"{delay:.1f}s 后重试 ({retry.attempt}/{retry.max_attempts - 1})")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["total_delay"] = round(self.total_delay, 3)
+        return stats
+
+    def print_summary(self):
+        stats = self.get_stats()
+        if not stats.get("requests"):
+            return
+        gave_up = {
+            "不可重试": stats.get("not_retryable", 0),
+            "次数用尽": stats.get("gave_up_attempts", 0),
+            "超时": stats.get("gave_up_deadline", 0),
+            "全局预算": stats.get("gave_up_budget", 0),
+        }
+        gave_up_text = ", ".join(f"{label} {count}" for label, count in gave_up.items() if count) or "无"
+        print(f"🔁 重试 [{self.name}]: 请求 {stats['requests']} | 重试 {stats.get('retries', 0)} "
+              f"(Retry-After {stats.get('retry_after', 0)}) | 累计等待 {stats['total_delay']:.1f}s | 放弃: {gave_up_text}")
+
+
+# LLM 调用 (非流式调用和 ChatStream 都经过自适应限流器) 和外部工具调用 (搜索、天气等) 各一份, 共享全局重试预算
+LLM_RETRY = RetryPolicy("llm")
+TOOL_RETRY = RetryPolicy("tool", max_attempts=3, base_delay=0.5, max_delay=5.0, max_elapsed=30.0)
+
+
+def print_retry_summary():
+    """打印所有策略的重试统计"""
+    LLM_RETRY.print_summary()
+    TOOL_RETRY.print_summary()
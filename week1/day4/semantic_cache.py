@@ -0,0 +1,456 @@
+"""
+语义缓存 - 近似重复的提示词 / 搜索词直接复用结果
+学习目标:
+1. 精确缓存只认一字不差的请求; 规划器换个说法 ("2024年诺贝尔物理学奖得主" / "2024诺贝尔物理奖获得者") 就会错过
+2. 本地向量化: 字符 1-gram、2-gram 和跳字 2-gram 哈希到固定维度 (只依赖 NumPy, 不需要模型和网络), 用余弦相似度比较
+3. 近似最近邻: 随机超平面 LSH 多表分桶, 只对同桶的候选算精确相似度
+4. 安全: 只用于低温度 (确定性) 调用; 数字不同 (2023 / 2024) 一律不算命中;
+   两边各有一段对方没有的内容 ("物理学奖" / "化学奖" 这类替换) 也不算命中;
+   按比例抽样审计命中 (照常请求一次, 比较新旧结果), 统计误命中率
+
+注意: 字面相似度分不开替换和改写 ("化学奖得主" 对 "物理学奖得主" 有 0.83, 比上面那组改写还高),
+阈值只能压住增删, 替换要靠替换检查; 默认阈值 0.9, 改写靠同义词归一 (SYNONYMS) 补回来
+"""
+
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+from retry_policy import TOOL_RETRY
+from governor import GOVERNOR
+from telemetry import TELEMETRY
+
+if TYPE_CHECKING:
+    import numpy as np  # 运行时在用到的函数里再导入, import 本模块不加载 NumPy
+
+DEFAULT_SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "week1/day4/semantic_cache.db")
+DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+DEFAULT_MAX_TEMPERATURE = float(os.getenv("SEMANTIC_CACHE_MAX_TEMPERATURE", "0.3"))
+DEFAULT_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.05"))
+DEFAULT_AUDIT_LOG = os.getenv("SEMANTIC_CACHE_AUDIT_LOG")  # 设置后每次语义命中和审计结果追加一行 JSON
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "on").lower() not in ("off", "0", "false")
+
+VECTOR_DIM = 2048
+EXACT_SEARCH_LIMIT = 256   # 分区内条目不超过这个数时直接全量比较, 不走 LSH
+AGREEMENT_THRESHOLD = 0.5  # 审计时新旧结果相似度低于它记为误命中
+
+# 去掉后不改变查询意图的虚词
+STOP_CHARS = set("的了是谁吗呢吧啊呀年个和与及")
+# 常见改写归一到同一种说法 (长的在前, 按顺序替换)
+SYNONYMS = [
+    ("获得者", "得主"), ("获奖者", "得主"), ("获奖人", "得主"),
+    ("物理学", "物理"), ("经济学奖", "经济奖"),
+    ("有哪些", "列表"), ("有什么", "列表"),
+]
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+# ========== 向量化 ==========
+
+def normalize_text(text: str) -> str:
+    """全角转半角、小写, 去掉空白标点, 同义词归一, 再去掉虚词"""
+    text = _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+    for phrase, canonical in SYNONYMS:
+        text = text.replace(phrase, canonical)
+    return "".join(c for c in text if c not in STOP_CHARS)
+
+
+def extract_numbers(text: str) -> tuple:
+    """文本中出现的数字 (年份、数量等); 两个文本的数字不同时不能互相命中"""
+    return tuple(sorted(set(_NUMBER.findall(unicodedata.normalize("NFKC", text)))))
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _uncovered(text: str, shared: set) -> str:
+    """不在任何共有 2-gram 里的字 (对方没有的那部分内容)"""
+    return "".join(
+        c for i, c in enumerate(text)
+        if text[max(i - 1, 0):i + 1] not in shared and text[i:i + 2] not in shared
+    )
+
+
+def substitution(a: str, b: str) -> Optional[tuple]:
+    """
+    两个文本是否是 "替换" 关系: 各自都有对方没有的内容, 如 "化学" / "物理"
+    只有一边多出内容 (增删, 如 "物理学奖" / "物理奖") 不算; 是替换时返回 (a 独有, b 独有), 否则 None
+    """
+    a, b = normalize_text(a), normalize_text(b)
+    shared = _bigrams(a) & _bigrams(b)
+    only_a, only_b = _uncovered(a, shared), _uncovered(b, shared)
+    return (only_a, only_b) if only_a and only_b else None
+
+
+@lru_cache(maxsize=65536)
+def _hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _features(text: str):
+    """(特征, 权重): 单字、相邻两字、隔一个字的两字 (容忍 "物理学奖" / "物理奖" 这种增删)"""
+    for c in text:
+        yield c, 1.0
+    for i in range(len(text) - 1):
+        yield text[i:i + 2], 1.0
+    for i in range(len(text) - 2):
+        yield text[i] + text[i + 2], 0.5
+
+
+def embed(text: str, dim: int = VECTOR_DIM) -> "np.ndarray":
+    """特征哈希到 dim 维 (带符号, 减少碰撞偏差), L2 归一化后点积即余弦相似度"""
+    import numpy as np
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in _features(normalize_text(text)):
+        h = _hash(feature)
+        vector[h % dim] += weight if h >> 63 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _as_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+# ========== 近似最近邻 ==========
+
+class LSHIndex:
+    """
+    随机超平面 LSH
+    每张表用 n_bits 个超平面把空间切成 2^n_bits 个桶, 夹角越小的两个向量越可能同桶;
+    默认 16 张表 x 8 位: 相似度 0.75 的向量至少在一张表同桶的概率约 88%, 0.9 的约 99.6%
+    """
+
+    def __init__(self, dim: int = VECTOR_DIM, n_tables: int = 16, n_bits: int = 8, seed: int = 42):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, n_bits, dim)).astype(np.float32)
+        self.weights = 1 << np.arange(n_bits)
+        self.tables: List[Dict[int, set]] = [{} for _ in range(n_tables)]
+
+    def _keys(self, vector: "np.ndarray") -> List[int]:
+        bits = (self.planes @ vector) > 0  # (n_tables, n_bits)
+        return (bits * self.weights).sum(axis=1).tolist()
+
+    def add(self, item_id: int, vector: "np.ndarray"):
+        for table, key in zip(self.tables, self._keys(vector)):
+            table.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: int, vector: "np.ndarray"):
+        for table, key in zip(self.tables, self._keys(vector)):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del table[key]
+
+    def candidates(self, vector: "np.ndarray") -> set:
+        found = set()
+        for table, key in zip(self.tables, self._keys(vector)):
+            found |= table.get(key, set())
+        return found
+
+
+# ========== 语义缓存 ==========
+
+class SemanticCache:
+    """
+    语义缓存: SQLite 持久化 (跨运行复用) + 内存 LSH 索引
+
+    - name: 缓存名, 同一个数据库文件里不同用途的缓存互不干扰 (如 "llm" / "search")
+    - threshold: 余弦相似度阈值, 达到才算命中
+    - max_temperature: 温度高于它的调用 (创作类) 不走语义缓存
+    - audit_rate: 命中后按这个比例照常请求一次, 比较新旧结果, 统计误命中
+    - ttl / max_entries: 条目存活秒数 / 条目上限 (超出时淘汰最早写入的)
+
+    namespace 用来分区: 只有同一分区 (同模型 + 同系统提示, 或同搜索参数) 的条目才会互相命中
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str = DEFAULT_SEMANTIC_CACHE_PATH,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_temperature: float = DEFAULT_MAX_TEMPERATURE,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        audit_log: Optional[str] = DEFAULT_AUDIT_LOG,
+        enabled: bool = SEMANTIC_CACHE_ENABLED
+    ):
+        self.name = name
+        self.path = path
+        self.threshold = threshold
+        self.max_temperature = max_temperature
+        self.audit_rate = audit_rate
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.audit_log = audit_log
+        self.enabled = enabled
+
+        self.stats = {
+            "lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0, "skipped": 0,
+            "number_mismatch": 0, "substitution": 0, "audited": 0, "false_hits": 0
+        }
+        self.recent_hits = deque(maxlen=100)  # 最近的语义命中 (查询 / 命中的条目 / 相似度), 供人工抽查
+
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Dict] = {}       # id -> 条目
+        self._partitions: Dict[str, set] = {}     # namespace -> 条目 id
+        self._index: Optional[LSHIndex] = None
+        self._conn = None                         # 第一次使用时才打开数据库、建索引并加载条目
+
+    # ========== 存储 ==========
+
+    def _ensure_loaded(self):
+        if self._conn is not None:
+            return
+        self._index = LSHIndex()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS semantic_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                text TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_semantic_cache_name ON semantic_cache(cache, created_at)")
+        self._conn.execute(
+            "DELETE FROM semantic_cache WHERE cache = ? AND created_at < ?", (self.name, time.time() - self.ttl)
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, namespace, text, value, created_at FROM semantic_cache WHERE cache = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (self.name, self.max_entries)
+        ).fetchall()
+        for item_id, namespace, text, value, created_at in reversed(rows):
+            self._remember(item_id, namespace, text, json.loads(value), created_at)
+
+    def _remember(self, item_id: int, namespace: str, text: str, value: Any, created_at: float):
+        vector = embed(text)
+        self._entries[item_id] = {
+            "namespace": namespace, "text": text, "value": value, "created_at": created_at,
+            "numbers": extract_numbers(text), "vector": vector
+        }
+        self._partitions.setdefault(namespace, set()).add(item_id)
+        self._index.add(item_id, vector)
+
+    def _forget(self, item_id: int):
+        entry = self._entries.pop(item_id)
+        self._partitions[entry["namespace"]].discard(item_id)
+        self._index.remove(item_id, entry["vector"])
+        self._conn.execute("DELETE FROM semantic_cache WHERE id = ?", (item_id,))
+
+    def add(self, text: str, value: Any, namespace: str = ""):
+        """写入一条结果 (value 需可 JSON 序列化)"""
+        with self._lock:
+            self._ensure_loaded()
+            now = time.time()
+            cursor = self._conn.execute(
+                "INSERT INTO semantic_cache (cache, namespace, text, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, namespace, text, json.dumps(value, ensure_ascii=False), now)
+            )
+            self._remember(cursor.lastrowid, namespace, text, value, now)
+            while len(self._entries) > self.max_entries:
+                self._forget(min(self._entries))  # id 自增, 最小的就是最早写入的
+            self._conn.commit()
+
+    # ========== 查询 ==========
+
+    def lookup(self, text: str, namespace: str = "") -> Optional[Dict]:
+        """
+        查找同分区内最相似且达到阈值的条目
+        返回 {"id", "text", "value", "similarity"}, 没有命中返回 None
+        """
+        vector = embed(text)
+        numbers = extract_numbers(text)
+        with self._lock:
+            self._ensure_loaded()
+            self.stats["lookups"] += 1
+            partition = self._partitions.get(namespace, set())
+            ids = partition if len(partition) <= EXACT_SEARCH_LIMIT else self._index.candidates(vector) & partition
+            now = time.time()
+            ids = [i for i in ids if now - self._entries[i]["created_at"] <= self.ttl]
+            best = None
+            if ids:
+                import numpy as np
+                similarities = np.stack([self._entries[i]["vector"] for i in ids]) @ vector
+                for rank in np.argsort(-similarities):
+                    similarity = float(similarities[rank])
+                    if similarity < self.threshold:
+                        break
+                    entry = self._entries[ids[rank]]
+                    if entry["numbers"] != numbers:
+                        self.stats["number_mismatch"] += 1
+                        continue
+                    if entry["text"] != text and substitution(text, entry["text"]):
+                        self.stats["substitution"] += 1
+                        continue
+                    best = {"id": ids[rank], "text": entry["text"], "value": entry["value"], "similarity": similarity}
+                    break
+            if best is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+                if best["text"] == text:
+                    self.stats["exact_hits"] += 1
+                else:
+                    self.recent_hits.append({"query": text, "matched": best["text"], "similarity": round(best["similarity"], 4)})
+        # 和精确缓存一起出现在 llm_cache_requests_total 里, engine 标签区分 "semantic:<缓存名>"
+        TELEMETRY.record_cache(f"semantic:{self.name}", hit=best is not None)
+        if best is None:
+            return None
+        if best["text"] != text:
+            self._write_audit({"event": "hit", "query": text, "matched": best["text"], "similarity": round(best["similarity"], 4)})
+        return best
+
+    def eligible(self, temperature: Optional[float] = None) -> bool:
+        """创作类 (高温度) 调用每次都应该不同, 不走语义缓存"""
+        return self.enabled and (temperature is None or temperature <= self.max_temperature)
+
+    def _plan(self, text: str, namespace: str, temperature: Optional[float]):
+        """返回 (是否参与缓存, 命中的条目, 是否抽中审计)"""
+        if not self.eligible(temperature):
+            with self._lock:
+                self.stats["skipped"] += 1
+            return False, None, False
+        match = self.lookup(text, namespace)
+        audit = match is not None and match["text"] != text and random.random() < self.audit_rate
+        return True, match, audit
+
+    def _settle(self, text: str, namespace: str, match: Optional[Dict], value: Any):
+        """计算出新结果后: 未命中时写入; 审计时比较新旧结果"""
+        if match is None:
+            self.add(text, value, namespace)
+            return
+        agreement = float(embed(_as_text(match["value"])) @ embed(_as_text(value)))
+        false_hit = agreement < AGREEMENT_THRESHOLD
+        with self._lock:
+            self.stats["audited"] += 1
+            if false_hit:
+                self.stats["false_hits"] += 1
+        self._write_audit({
+            "event": "audit", "query": text, "matched": match["text"],
+            "similarity": round(match["similarity"], 4), "agreement": round(agreement, 4), "false_hit": false_hit
+        })
+
+    def get_or_compute(
+        self,
+        text: str,
+        compute: Callable[[], Any],
+        namespace: str = "",
+        temperature: Optional[float] = None
+    ) -> Any:
+        """
+        命中时直接返回缓存结果; 未命中时调用 compute() 并写入
+        抽中审计时照常调用 compute() 并返回新结果; compute() 抛出的异常原样抛出, 不会写入缓存
+        """
+        cacheable, match, audit = self._plan(text, namespace, temperature)
+        if match is not None and not audit:
+            return match["value"]
+        value = compute()
+        if cacheable:
+            self._settle(text, namespace, match, value)
+        return value
+
+    async def aget_or_compute(
+        self,
+        text: str,
+        compute: Callable[[], Awaitable[Any]],
+        namespace: str = "",
+        temperature: Optional[float] = None
+    ) -> Any:
+        """get_or_compute 的异步版本"""
+        cacheable, match, audit = self._plan(text, namespace, temperature)
+        if match is not None and not audit:
+            return match["value"]
+        value = await compute()
+        if cacheable:
+            self._settle(text, namespace, match, value)
+        return value
+
+    # ========== 统计 / 审计 ==========
+
+    def _write_audit(self, event: Dict):
+        if not self.audit_log:
+            return
+        event = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "cache": self.name, **event}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.audit_log)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.audit_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        checked = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / checked if checked else 0.0
+        stats["false_hit_rate"] = stats["false_hits"] / stats["audited"] if stats["audited"] else None
+        return stats
+
+    def print_summary(self):
+        """打印命中率和审计结果"""
+        stats = self.get_stats()
+        if not stats["lookups"] and not stats["skipped"]:
+            return
+        audit = f"审计 {stats['audited']} 次, 误命中 {stats['false_hits']} 次"
+        if stats["false_hit_rate"] is not None:
+            audit += f" ({stats['false_hit_rate']:.0%})"
+        print(f"🧲 语义缓存[{self.name}] | 命中: {stats['hits']}/{stats['hits'] + stats['misses']} ({stats['hit_rate']:.1%}), "
+              f"其中近似命中 {stats['hits'] - stats['exact_hits']} | 数字不符拒绝: {stats['number_mismatch']} | "
+              f"替换拒绝: {stats['substitution']} | "
+              f"高温度跳过: {stats['skipped']} | {audit}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._entries.clear()
+                self._partitions.clear()
+                self._index = None
+
+
+# 搜索结果按搜索参数分区, 结果一天后过期
+SEARCH_CACHE = SemanticCache("search", ttl=24 * 3600)
+
+
+def _governed_search(client, query: str, **kwargs) -> Dict:
+    """每次尝试都向全局调度器申请 tavily 名额, 退避等待期间不占名额"""
+    with GOVERNOR.slot("tavily"):
+        return client.search(query=query, **kwargs)
+
+
+def cached_search(client, query: str, **kwargs) -> Dict:
+    """
+    带语义缓存的 Tavily 搜索: 近似的搜索词直接复用上次的结果
+    网络错误、429、5xx 按工具重试策略退避重试; 最终仍失败时异常原样抛出, 不会写入缓存
+    """
+    namespace = json.dumps(kwargs, sort_keys=True)
+    return SEARCH_CACHE.get_or_compute(
+        query,
+        lambda: TOOL_RETRY.call(lambda: _governed_search(client, query, **kwargs)),
+        namespace
+    )
@@ -0,0 +1,133 @@
+"""
+Single-flight 请求合并
+学习目标:
+1. 多个调用方同时发出完全相同的请求时, 只向上游发一次
+2. 其余调用方等待并共享同一个结果 (或同一个异常)
+3. 统计节省了多少次调用
+"""
+
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+def request_key(base_url: str, **params) -> str:
+    """根据请求参数生成合并 key (参数顺序无关)"""
+    payload = json.dumps(
+        {"base_url": base_url, **params},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str  # 消息里可能有 SDK 对象 (如 tool_calls 回复)
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """一次进行中的同步调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """线程版: 相同 key 的并发调用只执行一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0  # 真正执行的次数
+        self.saved = 0     # 被合并掉的次数
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+class _Flight:
+    """一次进行中的异步调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    协程版
+    上游调用在独立 Task 中执行, 某个等待方被取消不影响其他等待方;
+    所有等待方都取消时才取消上游调用
+    """
+
+    def __init__(self):
+        self._flights: Dict[tuple, _Flight] = {}
+        self.executed = 0
+        self.saved = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        flight = self._flights.get(flight_key)
+
+        if flight is None:
+            flight = _Flight(loop.create_task(factory()))
+            self._flights[flight_key] = flight
+            self.executed += 1
+
+            def cleanup(_task, flight=flight):
+                if self._flights.get(flight_key) is flight:
+                    del self._flights[flight_key]
+
+            flight.task.add_done_callback(cleanup)
+        else:
+            self.saved += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+# 全进程共享
+SINGLE_FLIGHT = SingleFlight()
+ASYNC_SINGLE_FLIGHT = AsyncSingleFlight()
+
+
+def get_singleflight_stats():
+    """获取统计信息"""
+    return {
+        "executed": SINGLE_FLIGHT.executed + ASYNC_SINGLE_FLIGHT.executed,
+        "saved": SINGLE_FLIGHT.saved + ASYNC_SINGLE_FLIGHT.saved
+    }
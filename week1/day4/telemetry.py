@@ -0,0 +1,463 @@
+"""
+LLM 调用遥测 - 延迟 / tokens / 重试 / 缓存
+学习目标:
+1. 所有 LLM 调用点都上报到同一个 TELEMETRY, 按引擎和 Agent 两个维度汇总
+2. 延迟用直方图记录 (和 Prometheus 一样的累计桶), 可估算 p50/p95
+3. 导出为 Prometheus 文本 (文件或 /metrics 端点) 和 JSONL 明细
+4. 按阶段计时, 找出流水线里最耗时的一段
+5. 记录提供方前缀缓存命中的输入 tokens, 按 Agent 看命中率
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 延迟直方图的桶 (秒)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# DeepSeek 前缀缓存命中的输入 tokens 按未命中价格的 1/10 计费
+CACHE_HIT_PRICE_RATIO = 0.1
+
+# 设置后每次调用追加一行 JSON 明细
+DEFAULT_JSONL_PATH = os.getenv("LLM_TELEMETRY_JSONL")
+
+# 当前 Agent / 阶段标签 (跨线程池和 asyncio Task 时随上下文复制)
+_current_agent = contextvars.ContextVar("llm_agent", default=None)
+_current_stage = contextvars.ContextVar("llm_stage", default=None)
+
+
+def _default_agent() -> str:
+    """没有显式标签时, 用入口脚本名作为 Agent 名 (如 11_react_agent)"""
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else ""
+    return os.path.splitext(script)[0] or "unknown"
+
+
+def current_agent() -> str:
+    return _current_agent.get() or _default_agent()
+
+
+def current_stage() -> str:
+    return _current_stage.get() or ""
+
+
+@contextmanager
+def agent_context(name: str):
+    """在 with 块内的 LLM 调用都记到这个 Agent 名下"""
+    token = _current_agent.set(name)
+    try:
+        yield
+    finally:
+        _current_agent.reset(token)
+
+
+def carry_context(coro):
+    """
+    把当前的 contextvars (Agent / 阶段标签, 调度器的作业等) 带进另一个线程的事件循环
+    (run_coroutine_threadsafe 创建的 Task 不会继承调用线程的 contextvars)
+    """
+    context = contextvars.copy_context()
+
+    async def runner():
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    return runner()
+
+
+def prompt_cache_tokens(usage):
+    """
+    从 usage 取 (命中, 未命中) 的输入 tokens
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens,
+    OpenAI 兼容接口返回 prompt_tokens_details.cached_tokens; 都没有时返回 (None, None)
+    """
+    if usage is None:
+        return None, None
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is not None:
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+        return hit, miss if miss is not None else max(0, (usage.prompt_tokens or 0) - hit)
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if cached is not None:
+        return cached, max(0, (usage.prompt_tokens or 0) - cached)
+    return None, None
+
+
+class Histogram:
+    """累计桶直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶线性插值估算分位数 (与 Prometheus histogram_quantile 相同)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+            lower = self.buckets[i] if i < len(self.buckets) else lower
+        return self.buckets[-1]
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def prometheus_labels(**kv) -> str:
+    parts = []
+    for k, v in kv.items():
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        parts.append(f'{k}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def histogram_lines(metric: str, histogram: Histogram, **kv) -> List[str]:
+    """直方图的 Prometheus 文本行 (_bucket / _sum / _count)"""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+        cumulative += count
+        lines.append(f"{metric}_bucket{prometheus_labels(**kv, le=bound)} {cumulative}")
+    lines.append(f"{metric}_sum{prometheus_labels(**kv)} {histogram.sum:.6f}")
+    lines.append(f"{metric}_count{prometheus_labels(**kv)} {histogram.count}")
+    return lines
+
+
+class Telemetry:
+    """全进程共享的遥测收集器"""
+
+    def __init__(self, jsonl_path: Optional[str] = DEFAULT_JSONL_PATH):
+        self._lock = threading.Lock()
+        self.jsonl_path = jsonl_path
+        # (engine, agent) -> 计数
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.prompt_tokens = defaultdict(int)
+        self.completion_tokens = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.prompt_cache_hit = defaultdict(int)   # 提供方前缀缓存命中的输入 tokens
+        self.prompt_cache_miss = defaultdict(int)
+        self.latency = defaultdict(Histogram)
+        self.ttft = defaultdict(Histogram)
+        # stage -> 阶段统计
+        self.stage_latency = defaultdict(Histogram)
+        self.stage_llm = defaultdict(lambda: {"calls": 0, "llm_seconds": 0.0, "tokens": 0})
+        self.stage_order: List[str] = []
+        # 其他模块 (如并发调度器) 的指标, 导出 Prometheus 时一并输出
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def add_collector(self, collect: Callable[[], List[str]]):
+        """注册额外的指标来源, collect() 返回 Prometheus 文本行"""
+        with self._lock:
+            self.collectors.append(collect)
+
+    # ========== 上报 ==========
+
+    def record_call(
+        self,
+        engine: str,
+        latency: float,
+        usage=None,
+        agent: Optional[str] = None,
+        error: Optional[Exception] = None,
+        ttft: Optional[float] = None
+    ):
+        """记录一次上游调用 (成功或失败)"""
+        agent = agent or current_agent()
+        stage = current_stage()
+        key = (engine, agent)
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        cache_hit, cache_miss = prompt_cache_tokens(usage)
+        with self._lock:
+            self.requests[key] += 1
+            self.latency[key].observe(latency)
+            if error is not None:
+                self.errors[key] += 1
+            self.prompt_tokens[key] += prompt
+            self.completion_tokens[key] += completion
+            if cache_hit is not None:
+                self.prompt_cache_hit[key] += cache_hit
+                self.prompt_cache_miss[key] += cache_miss
+            if ttft is not None:
+                self.ttft[key].observe(ttft)
+            if stage:
+                stats = self.stage_llm[stage]
+                stats["calls"] += 1
+                stats["llm_seconds"] += latency
+                stats["tokens"] += prompt + completion
+        self._write_event({
+            "type": "call",
+            "engine": engine,
+            "agent": agent,
+            "stage": stage,
+            "latency": round(latency, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "prompt_cache_hit_tokens": cache_hit,
+            "status": "error" if error is not None else "ok",
+            "error": type(error).__name__ if error is not None else None
+        })
+
+    def record_retry(self, engine: str, agent: Optional[str] = None):
+        with self._lock:
+            self.retries[(engine, agent or current_agent())] += 1
+
+    def record_cache(self, engine: str, hit: bool, agent: Optional[str] = None):
+        key = (engine, agent or current_agent())
+        with self._lock:
+            if hit:
+                self.cache_hits[key] += 1
+            else:
+                self.cache_misses[key] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """阶段计时; with 块内的 LLM 调用同时记到该阶段下"""
+        token = _current_stage.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_stage.reset(token)
+            with self._lock:
+                self.stage_latency[name].observe(elapsed)
+                if name not in self.stage_order:
+                    self.stage_order.append(name)
+            self._write_event({"type": "stage", "stage": name, "latency": round(elapsed, 4)})
+
+    def _write_event(self, event: Dict):
+        if not self.jsonl_path:
+            return
+        event = {"ts": datetime.now().isoformat(timespec="milliseconds"), **event}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # ========== 汇总 ==========
+
+    def summary(self, by: str = "engine") -> Dict[str, Dict]:
+        """按 engine 或 agent 汇总"""
+        index = 0 if by == "engine" else 1
+        result = {}
+        with self._lock:
+            keys = set(self.requests) | set(self.cache_hits) | set(self.cache_misses) | set(self.retries)
+            for key in keys:
+                row = result.setdefault(key[index], {
+                    "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                    "retries": 0, "cache_hits": 0, "cache_misses": 0,
+                    "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": 0, "latency": Histogram()
+                })
+                row["calls"] += self.requests.get(key, 0)
+                row["errors"] += self.errors.get(key, 0)
+                row["prompt_tokens"] += self.prompt_tokens.get(key, 0)
+                row["completion_tokens"] += self.completion_tokens.get(key, 0)
+                row["retries"] += self.retries.get(key, 0)
+                row["cache_hits"] += self.cache_hits.get(key, 0)
+                row["cache_misses"] += self.cache_misses.get(key, 0)
+                row["prompt_cache_hit_tokens"] += self.prompt_cache_hit.get(key, 0)
+                row["prompt_cache_miss_tokens"] += self.prompt_cache_miss.get(key, 0)
+                if key in self.latency:
+                    row["latency"].merge(self.latency[key])
+        for row in result.values():
+            histogram = row.pop("latency")
+            row["p50"] = histogram.quantile(0.5)
+            row["p95"] = histogram.quantile(0.95)
+            row["mean"] = histogram.mean
+            reported = row["prompt_cache_hit_tokens"] + row["prompt_cache_miss_tokens"]
+            row["prompt_cache_hit_ratio"] = row["prompt_cache_hit_tokens"] / reported if reported else None
+        return result
+
+    def engine_totals(self, engine: str) -> Dict:
+        """单个引擎 (所有 Agent 合计) 的成功调用数、耗时总和和输出 tokens, 供模型路由估算延迟"""
+        calls = seconds = completion = 0
+        with self._lock:
+            for key, histogram in self.latency.items():
+                if key[0] != engine:
+                    continue
+                calls += histogram.count - self.errors.get(key, 0)
+                seconds += histogram.sum
+                completion += self.completion_tokens.get(key, 0)
+        return {"calls": calls, "seconds": seconds, "completion_tokens": completion}
+
+    def stage_summary(self) -> List[Dict]:
+        """各阶段耗时, 按执行顺序"""
+        with self._lock:
+            return [
+                {
+                    "stage": name,
+                    "runs": self.stage_latency[name].count,
+                    "seconds": self.stage_latency[name].sum,
+                    **self.stage_llm.get(name, {"calls": 0, "llm_seconds": 0.0, "tokens": 0})
+                }
+                for name in self.stage_order
+            ]
+
+    def print_summary(self, by: str = "engine"):
+        """打印汇总表"""
+        for name, row in sorted(self.summary(by).items()):
+            p50 = f"{row['p50']:.2f}s" if row["p50"] is not None else "-"
+            p95 = f"{row['p95']:.2f}s" if row["p95"] is not None else "-"
+            print(f"{name:20} | 调用: {row['calls']:3} 次 | Tokens: {row['prompt_tokens']:6}+{row['completion_tokens']:<6} | "
+                  f"p50/p95: {p50}/{p95} | 重试: {row['retries']} | 缓存命中/未命中: {row['cache_hits']}/{row['cache_misses']}")
+
+    def print_prompt_cache(self, by: str = "agent"):
+        """打印提供方前缀缓存命中率, 以及按命中价格折算的输入成本节省"""
+        rows = {name: row for name, row in self.summary(by).items() if row["prompt_cache_hit_ratio"] is not None}
+        if not rows:
+            return
+        total_hit = total_reported = 0
+        for name, row in sorted(rows.items()):
+            hit = row["prompt_cache_hit_tokens"]
+            reported = hit + row["prompt_cache_miss_tokens"]
+            total_hit += hit
+            total_reported += reported
+            print(f"🧊 {name:20} | 前缀缓存命中: {hit:6}/{reported:<6} tokens ({row['prompt_cache_hit_ratio']:.1%}) | "
+                  f"输入成本节省: {hit * (1 - CACHE_HIT_PRICE_RATIO) / reported:.1%}")
+        if len(rows) > 1 and total_reported:
+            print(f"🧊 {'总计':20} | 前缀缓存命中: {total_hit:6}/{total_reported:<6} tokens ({total_hit / total_reported:.1%}) | "
+                  f"输入成本节省: {total_hit * (1 - CACHE_HIT_PRICE_RATIO) / total_reported:.1%}")
+
+    def print_stages(self):
+        """打印阶段耗时, 标出最慢的阶段"""
+        stages = self.stage_summary()
+        if not stages:
+            return
+        total = sum(s["seconds"] for s in stages) or 1.0
+        slowest = max(stages, key=lambda s: s["seconds"])
+        for s in stages:
+            flag = " ⬅️ 最慢" if s is slowest else ""
+            print(f"⏱️  {s['stage']:20} | {s['seconds']:7.2f}s ({s['seconds'] / total:.0%}) | "
+                  f"LLM 调用: {s['calls']:3} 次, {s['llm_seconds']:.2f}s | Tokens: {s['tokens']}{flag}")
+
+    # ========== 导出 ==========
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+
+        labels = prometheus_labels
+        out = []
+        with self._lock:
+            counters = [
+                ("llm_requests_total", "LLM 上游请求数", self.requests, {}),
+                ("llm_request_errors_total", "失败的 LLM 请求数", self.errors, {}),
+                ("llm_tokens_total", "LLM tokens (type 区分 prompt/completion)", self.prompt_tokens, {"type": "prompt"}),
+                ("llm_tokens_total", "", self.completion_tokens, {"type": "completion"}),
+                ("llm_retries_total", "重试次数", self.retries, {}),
+                ("llm_cache_requests_total", "响应缓存查询 (result 区分 hit/miss)", self.cache_hits, {"result": "hit"}),
+                ("llm_cache_requests_total", "", self.cache_misses, {"result": "miss"}),
+                ("llm_prompt_cache_tokens_total", "提供方前缀缓存的输入 tokens (result 区分 hit/miss)",
+                 self.prompt_cache_hit, {"result": "hit"}),
+                ("llm_prompt_cache_tokens_total", "", self.prompt_cache_miss, {"result": "miss"}),
+            ]
+            declared = set()
+            for metric, help_text, values, extra in counters:
+                if metric not in declared:
+                    out.append(f"# HELP {metric} {help_text}")
+                    out.append(f"# TYPE {metric} counter")
+                    declared.add(metric)
+                for (engine, agent), value in sorted(values.items()):
+                    out.append(f"{metric}{labels(engine=engine, agent=agent, **extra)} {value}")
+
+            out.append("# HELP llm_request_duration_seconds LLM 请求耗时")
+            out.append("# TYPE llm_request_duration_seconds histogram")
+            for (engine, agent), histogram in sorted(self.latency.items()):
+                out.extend(histogram_lines("llm_request_duration_seconds", histogram, engine=engine, agent=agent))
+
+            out.append("# HELP llm_time_to_first_token_seconds 流式首 token 耗时")
+            out.append("# TYPE llm_time_to_first_token_seconds histogram")
+            for (engine, agent), histogram in sorted(self.ttft.items()):
+                out.extend(histogram_lines("llm_time_to_first_token_seconds", histogram, engine=engine, agent=agent))
+
+            out.append("# HELP pipeline_stage_duration_seconds 流水线阶段耗时")
+            out.append("# TYPE pipeline_stage_duration_seconds histogram")
+            for stage in self.stage_order:
+                out.extend(histogram_lines("pipeline_stage_duration_seconds", self.stage_latency[stage], stage=stage))
+            collectors = list(self.collectors)
+        for collect in collectors:
+            out.extend(collect())
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: str) -> str:
+        """写入 Prometheus 文本文件 (可配合 node_exporter textfile collector)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)  # 原子替换, 采集方不会读到半个文件
+        return path
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """在后台线程启动 /metrics 端点"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # 不打印访问日志
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"📈 指标端点: http://{host}:{port}/metrics")
+        return server
+
+
+TELEMETRY = Telemetry()
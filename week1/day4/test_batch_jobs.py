@@ -0,0 +1,74 @@
+"""
+批量推理: batch_id 不撞名, 崩溃后续跑只补未完成的请求
+
+运行: python -m pytest week1/day4/test_batch_jobs.py -q
+"""
+
+import asyncio
+
+import pytest
+
+from batch_jobs import (
+    BatchJob, batch_paths, completed_ids, count_requests, load_results, new_batch_id, run_batch, write_batch_file
+)
+
+REQUESTS = [{"custom_id": f"r{i}", "agent_type": "insight", "task": f"任务 {i}"} for i in range(5)]
+
+
+def make_job(tmp_path, batch_id="b1") -> BatchJob:
+    input_path, output_path = batch_paths(batch_id, str(tmp_path))
+    total = write_batch_file(input_path, REQUESTS)
+    return BatchJob(batch_id, input_path, output_path, total, skipped=len(completed_ids(output_path)))
+
+
+def test_batch_ids_are_unique_within_the_same_second():
+    ids = {new_batch_id() for _ in range(1000)}
+    assert len(ids) == 1000
+
+
+def test_rewriting_a_batch_with_other_requests_is_refused(tmp_path):
+    path = batch_paths("b1", str(tmp_path))[0]
+    assert write_batch_file(path, REQUESTS) == 5
+    assert write_batch_file(path, REQUESTS) == 5  # 相同请求: 续跑
+    with pytest.raises(FileExistsError):
+        write_batch_file(path, REQUESTS[:2])
+    assert count_requests(path) == 5
+
+
+def test_missing_or_duplicate_custom_id_is_rejected(tmp_path):
+    path = batch_paths("b1", str(tmp_path))[0]
+    with pytest.raises(ValueError):
+        write_batch_file(path, [{"task": "没有 id"}])
+    with pytest.raises(ValueError):
+        write_batch_file(path, [REQUESTS[0], REQUESTS[0]])
+
+
+def test_resume_skips_completed_and_retries_failed(tmp_path):
+    calls = []
+
+    async def flaky(request):
+        calls.append(request["custom_id"])
+        if request["custom_id"] == "r3":
+            raise ConnectionError("down")
+        return f"结果 {request['custom_id']}"
+
+    asyncio.run(run_batch(make_job(tmp_path), flaky, concurrency=2))
+    assert completed_ids(batch_paths("b1", str(tmp_path))[1]) == {"r0", "r1", "r2", "r4"}
+
+    # 模拟崩溃时写了一半的行
+    with open(batch_paths("b1", str(tmp_path))[1], "a", encoding="utf-8") as f:
+        f.write('{"custom_id": "r3", "sta')
+
+    calls.clear()
+
+    async def ok(request):
+        calls.append(request["custom_id"])
+        return "补上了"
+
+    job = make_job(tmp_path)
+    assert job.skipped == 4
+    asyncio.run(run_batch(job, ok, concurrency=2))
+    assert calls == ["r3"]
+    results = load_results(job.output_path)
+    assert {k: r["status"] for k, r in results.items()} == {f"r{i}": "ok" for i in range(5)}
+    assert results["r3"]["result"] == "补上了"
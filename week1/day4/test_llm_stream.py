@@ -0,0 +1,115 @@
+"""
+流式输出: 熔断器和遥测按整个流记结果 (ChatStream 和 chat_completion(stream=True) 一致)
+
+运行: python -m pytest week1/day4/test_llm_stream.py -q
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import llm_calls
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError, breaker_key, get_breaker
+from llm_calls import chat_completion
+from llm_stream import ChatStream
+from telemetry import Telemetry
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def chunk(content):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    """create(stream=True) 返回 pieces 组成的流; fail_after 块之后抛连接错误"""
+
+    base_url = "https://stream-test.example.com/v1/"
+
+    def __init__(self, pieces, fail_after=None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        def response():
+            for i, piece in enumerate(self.pieces):
+                if i == self.fail_after:
+                    raise ConnectionError("连接中途断开")
+                yield chunk(piece)
+        return response()
+
+
+def test_mid_stream_error_records_failure():
+    breaker = CircuitBreaker("stream-test", failure_threshold=2)
+    for _ in range(2):
+        stream = ChatStream(FakeClient(["一", "二", "三"], fail_after=1), "m", MESSAGES, breaker=breaker)
+        with pytest.raises(ConnectionError):
+            stream.consume()
+        assert not stream.finished
+    assert breaker.state == OPEN
+
+
+def test_finished_stream_records_success():
+    breaker = CircuitBreaker("stream-test", failure_threshold=3)
+    breaker.record_failure(ConnectionError("down"))
+    stream = ChatStream(FakeClient(["一", "二"]), "m", MESSAGES, breaker=breaker)
+    assert stream.consume() == "一二"
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+
+def test_default_breaker_is_shared_with_engine_key():
+    client = FakeClient(["一"], fail_after=0)
+    stream = ChatStream(client, "stream-test-model", MESSAGES)
+    assert stream.breaker is get_breaker(breaker_key("stream-test-model", client.base_url))
+    with pytest.raises(ConnectionError):
+        stream.consume()
+    assert stream.breaker.consecutive_failures == 1
+
+
+def test_cached_stream_does_not_touch_breaker():
+    breaker = CircuitBreaker("stream-test")
+    stream = ChatStream(FakeClient([]), "m", MESSAGES, cached="缓存结果", breaker=breaker)
+    assert stream.consume() == "缓存结果"
+    assert breaker.error_rate == 0.0 and breaker.latency is None
+
+
+def test_direct_stream_checks_open_breaker():
+    client = FakeClient(["一"])
+    breaker = get_breaker(breaker_key("stream-test-open", client.base_url))
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ConnectionError("down"))
+    with pytest.raises(CircuitOpenError):
+        ChatStream(client, "stream-test-open", MESSAGES)
+    # 缓存命中不发请求, 熔断中也能返回
+    assert ChatStream(client, "stream-test-open", MESSAGES, cached="缓存").consume() == "缓存"
+
+
+@pytest.fixture
+def telemetry(monkeypatch):
+    telemetry = Telemetry(jsonl_path=None)
+    monkeypatch.setattr(llm_calls, "TELEMETRY", telemetry)
+    return telemetry
+
+
+def test_chat_completion_stream_records_mid_stream_failure(telemetry):
+    client = FakeClient(["一", "二", "三"], fail_after=2)
+    response = chat_completion(client, model="stream-test-raw-fail", messages=MESSAGES, stream=True)
+    breaker = get_breaker(breaker_key("stream-test-raw-fail", client.base_url))
+    assert breaker.consecutive_failures == 0  # 连接建立不算成功也不算失败
+    with pytest.raises(ConnectionError):
+        for _ in response:
+            pass
+    assert breaker.consecutive_failures == 1
+    row = telemetry.summary()["stream-test-raw-fail"]
+    assert (row["calls"], row["errors"]) == (1, 1)
+
+
+def test_chat_completion_stream_records_success_when_read(telemetry):
+    client = FakeClient(["一", "二"])
+    response = chat_completion(client, model="stream-test-raw-ok", messages=MESSAGES, stream=True)
+    assert [c.choices[0].delta.content for c in response] == ["一", "二"]
+    breaker = get_breaker(breaker_key("stream-test-raw-ok", client.base_url))
+    assert breaker.latency is not None
+    row = telemetry.summary()["stream-test-raw-ok"]
+    assert (row["calls"], row["errors"]) == (1, 0)
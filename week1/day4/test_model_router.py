@@ -0,0 +1,104 @@
+"""
+模型路由: 候选模型的提供方、熔断器 key
+
+运行: python -m pytest week1/day4/test_model_router.py -q
+"""
+
+from types import SimpleNamespace
+
+from circuit_breaker import breaker_key, get_breaker
+from model_router import DEEPSEEK_BASE_URL, DEFAULT_MODELS, ModelRouter, ModelSpec
+from multi_llm_manager import InsightLLM, MultiLLMManager
+from llm_calls import route_model
+
+MOONSHOT = "https://api.moonshot.cn/v1"
+MOCK = "http://127.0.0.1:8808"
+MESSAGES = [{"role": "user", "content": "分析一下各平台的情感分布"}]
+
+
+def make_manager(router: ModelRouter) -> MultiLLMManager:
+    """只带 _model_client 需要的属性, 不加载 .env、不建缓存"""
+    manager = MultiLLMManager.__new__(MultiLLMManager)
+    manager.router = router
+    manager.model_clients = {}
+    manager.cache = None
+    manager.semantic_cache = None
+    return manager
+
+
+def moonshot_engine(monkeypatch) -> InsightLLM:
+    monkeypatch.setenv("INSIGHT_ENGINE_BASE_URL", MOONSHOT)
+    monkeypatch.setenv("INSIGHT_ENGINE_API_KEY", "sk-moonshot")
+    monkeypatch.setenv("INSIGHT_ENGINE_MODEL_NAME", "moonshot-v1-8k")
+    return InsightLLM()
+
+
+def test_default_models_declare_their_provider(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_BASE_URL", raising=False)
+    for spec in DEFAULT_MODELS:
+        assert spec.base_url == DEEPSEEK_BASE_URL
+        assert spec.api_key_env == "DEEPSEEK_API_KEY"
+
+
+def test_routed_deepseek_model_goes_to_deepseek_not_caller_endpoint(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-deepseek")
+    llm = moonshot_engine(monkeypatch)
+    manager = make_manager(ModelRouter(list(DEFAULT_MODELS), log_path=None))
+
+    for task_type, model in [("analysis", "deepseek-chat"), ("synthesis", "deepseek-chat"),
+                              ("sql", "deepseek-chat"), ("report", "deepseek-reasoner")]:
+        client = manager._model_client(llm, task_type, MESSAGES)
+        assert (client.model, client.base_url, client.api_key) == (model, DEEPSEEK_BASE_URL, "sk-deepseek")
+
+
+def test_other_provider_without_key_keeps_engine_model(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    llm = moonshot_engine(monkeypatch)
+    router = ModelRouter(list(DEFAULT_MODELS), log_path=None)
+
+    decision = router.route("analysis", MESSAGES, base_url=MOONSHOT)
+    assert not decision.routed
+    assert make_manager(router)._model_client(llm, "analysis", MESSAGES) is llm
+
+
+def test_same_provider_reuses_engine_key(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    spec = ModelSpec("deepseek-reasoner", tier=3, input_price=4, output_price=16,
+                     base_url=DEEPSEEK_BASE_URL, api_key_env="DEEPSEEK_API_KEY")
+    router = ModelRouter([spec], log_path=None)
+
+    decision = router.route("report", MESSAGES, base_url=DEEPSEEK_BASE_URL + "/")
+    assert decision.model == "deepseek-reasoner"
+
+
+def test_open_engine_breaker_steers_routing(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-deepseek")
+    cheap = ModelSpec("route-test-cheap", tier=2, input_price=1, output_price=1,
+                      base_url=DEEPSEEK_BASE_URL, api_key_env="DEEPSEEK_API_KEY")
+    pricey = ModelSpec("route-test-pricey", tier=2, input_price=50, output_price=50,
+                       base_url=DEEPSEEK_BASE_URL, api_key_env="DEEPSEEK_API_KEY")
+    router = ModelRouter([cheap, pricey], log_path=None)
+    assert router.route("analysis", MESSAGES, base_url=DEEPSEEK_BASE_URL).model == "route-test-cheap"
+
+    # 引擎客户端和路由用同一个 key: 引擎上的失败会让路由绕开这个模型
+    engine_breaker = get_breaker(breaker_key("route-test-cheap", DEEPSEEK_BASE_URL + "/"))
+    for _ in range(engine_breaker.failure_threshold):
+        engine_breaker.record_failure(ConnectionError("down"))
+    assert router.route("analysis", MESSAGES, base_url=DEEPSEEK_BASE_URL).model == "route-test-pricey"
+
+
+def test_deepseek_base_url_env_is_followed(monkeypatch):
+    """指向 mock / 代理时, 路由选中的 DeepSeek 模型也发到那里, 不会跑去官方地址"""
+    monkeypatch.setenv("DEEPSEEK_BASE_URL", MOCK)
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    router = ModelRouter(list(DEFAULT_MODELS), log_path=None)
+    assert all(spec.base_url == MOCK for spec in DEFAULT_MODELS)
+
+    decision = router.route("report", MESSAGES, base_url=MOCK + "/")
+    assert (decision.model, decision.base_url) == ("deepseek-reasoner", MOCK)
+
+    # llm_calls 的路由: 同一个提供方, 沿用调用方的客户端 (和它的 Key)
+    caller = SimpleNamespace(base_url=MOCK + "/", api_key="mock")
+    monkeypatch.setattr("llm_calls.ROUTER", router)
+    client, model = route_model(caller, "report", MESSAGES, "deepseek-chat")
+    assert (client, model) == (caller, "deepseek-reasoner")
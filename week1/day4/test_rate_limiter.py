@@ -0,0 +1,67 @@
+"""
+自适应限流: 异步等待不轮询, 归还许可时唤醒
+
+运行: python -m pytest week1/day4/test_rate_limiter.py -q
+"""
+
+import asyncio
+import threading
+
+from rate_limiter import ProviderLimiter, TokenBucket
+
+
+def test_waiter_parks_until_release():
+    limiter = ProviderLimiter("limiter-test", rpm=6000, tpm=10 ** 7, max_concurrency=1)
+    first = limiter.acquire(10)
+
+    async def main():
+        task = asyncio.ensure_future(limiter.aacquire(10))
+        await asyncio.sleep(0.05)
+        assert not task.done() and len(limiter._async_waiters) == 1
+        # 从别的线程归还许可, 事件循环里的等待者被唤醒
+        threading.Thread(target=limiter.release, args=(first,)).start()
+        slot = await asyncio.wait_for(task, timeout=1)
+        limiter.release(slot)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_waiter_is_removed():
+    limiter = ProviderLimiter("limiter-test", rpm=6000, tpm=10 ** 7, max_concurrency=1)
+    first = limiter.acquire(10)
+
+    async def main():
+        task = asyncio.ensure_future(limiter.aacquire(10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert limiter._async_waiters == []
+    limiter.release(first)
+    assert limiter.in_flight == 0
+
+
+def test_cancel_during_rate_wait_returns_the_slot():
+    limiter = ProviderLimiter("limiter-test", rpm=60, tpm=10 ** 7, max_concurrency=4)
+    limiter.requests.drain()  # 下一个请求要按速率等约 1 秒
+
+    async def main():
+        task = asyncio.ensure_future(limiter.aacquire(10))
+        await asyncio.sleep(0.05)
+        assert limiter.in_flight == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+
+    window = limiter.window
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+    assert limiter.window == window  # 取消不算成功也不算限流
+
+
+def test_bucket_wait_is_deficit_over_rate():
+    bucket = TokenBucket(rate_per_min=60, capacity=1)  # 每秒补 1 个
+    assert bucket.reserve(1) == 0.0
+    assert 0.9 < bucket.reserve(1) <= 1.0
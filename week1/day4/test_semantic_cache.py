@@ -0,0 +1,68 @@
+"""
+语义缓存: 改写要命中, 替换不能命中, 命中 / 未命中计入遥测
+
+运行: python -m pytest week1/day4/test_semantic_cache.py -q
+"""
+
+import pytest
+
+import semantic_cache
+from semantic_cache import DEFAULT_THRESHOLD, SemanticCache, normalize_text, substitution
+from telemetry import Telemetry
+
+CACHED = "2024年诺贝尔物理学奖得主"
+PARAPHRASE = "2024诺贝尔物理奖获得者"
+SUBSTITUTED = "2024年诺贝尔化学奖得主"
+
+
+def test_default_threshold_is_strict():
+    assert DEFAULT_THRESHOLD > 0.85
+
+
+def test_paraphrase_normalizes_to_same_text():
+    assert normalize_text(PARAPHRASE) == normalize_text(CACHED)
+    assert substitution(PARAPHRASE, CACHED) is None
+
+
+def test_substitution_is_detected():
+    assert substitution(SUBSTITUTED, CACHED) == ("化学", "物理")
+
+
+def test_insertion_or_reordering_is_not_substitution():
+    assert substitution("2024诺贝尔奖得主", CACHED) is None
+    assert substitution("今天北京天气", "北京 天气 今天") is None
+
+
+@pytest.fixture
+def telemetry(monkeypatch):
+    telemetry = Telemetry(jsonl_path=None)
+    monkeypatch.setattr(semantic_cache, "TELEMETRY", telemetry)
+    return telemetry
+
+
+@pytest.fixture
+def cache(tmp_path, telemetry):
+    pytest.importorskip("numpy")
+    cache = SemanticCache("search-test", path=str(tmp_path / "semantic.db"), audit_log=None, enabled=True)
+    cache.add(CACHED, {"answer": "物理学奖结果"})
+    yield cache
+    cache.close()
+
+
+def test_substituted_query_misses_even_above_threshold(cache):
+    cache.threshold = 0.5  # 相似度再高, 替换也不能命中
+    assert cache.lookup(SUBSTITUTED) is None
+    assert cache.stats["substitution"] == 1
+
+
+def test_paraphrase_hits(cache):
+    match = cache.lookup(PARAPHRASE)
+    assert match is not None and match["value"] == {"answer": "物理学奖结果"}
+    assert match["similarity"] >= DEFAULT_THRESHOLD
+
+
+def test_semantic_lookups_are_recorded_in_telemetry(cache, telemetry):
+    cache.lookup(PARAPHRASE)
+    cache.lookup(SUBSTITUTED)
+    row = telemetry.summary()["semantic:search-test"]
+    assert (row["cache_hits"], row["cache_misses"]) == (1, 1)
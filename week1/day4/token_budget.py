@@ -0,0 +1,253 @@
+"""
+Token 预算 - 发送前检查提示长度
+学习目标:
+1. 本地估算 tokens (不调用 API, 不依赖 tokenizer)
+2. 按模型登记上下文上限, 再加一个可配置的预算上限
+3. 超出预算时先截短低优先级的上下文块, 仍然超出再整块丢弃
+"""
+
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+# 提示词预算上限 (tokens), 与模型上下文上限取较小值; 限制过长提示带来的延迟
+DEFAULT_PROMPT_BUDGET = int(os.getenv("LLM_PROMPT_BUDGET", "24000"))
+DEFAULT_COMPLETION_RESERVE = 2000  # 给回复预留的 tokens
+DEFAULT_CONTEXT_LIMIT = 32000      # 未登记模型的保守上限
+MIN_BLOCK_TOKENS = 64              # 截短时每块至少保留的 tokens
+MESSAGE_OVERHEAD = 4               # 每条消息的格式开销
+
+# ========== 模型上下文上限 ==========
+
+MODEL_CONTEXT_LIMITS: Dict[str, int] = {
+    "deepseek-chat": 64000,
+    "deepseek-reasoner": 64000,
+    "moonshot-v1-8k": 8192,
+    "moonshot-v1-32k": 32768,
+    "moonshot-v1-128k": 131072,
+    "qwen-turbo": 131072,
+    "qwen-plus": 131072,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+
+
+def register_model(model: str, context_limit: int):
+    """登记 (或覆盖) 模型的上下文上限"""
+    MODEL_CONTEXT_LIMITS[model] = context_limit
+
+
+def get_context_limit(model: Optional[str]) -> int:
+    """模型的上下文上限, 未登记时返回保守默认值"""
+    return MODEL_CONTEXT_LIMITS.get(model or "", DEFAULT_CONTEXT_LIMIT)
+
+
+def prompt_budget(model: Optional[str], max_tokens: Optional[int] = None) -> int:
+    """提示词可用的 tokens: min(预算上限, 上下文上限 - 回复预留)"""
+    reserve = max_tokens or DEFAULT_COMPLETION_RESERVE
+    return min(DEFAULT_PROMPT_BUDGET, get_context_limit(model) - reserve)
+
+
+# ========== 本地估算 ==========
+
+# 中日韩文字和全角标点约 1 字 1 token, 其余 (英文/数字/代码) 约 4 字符 1 token
+_CJK = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def count_tokens(text: str) -> int:
+    """估算一段文本的 tokens"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _get(message, field: str):
+    """消息可能是 dict, 也可能是 SDK 返回的对象 (带 tool_calls 的回复)"""
+    if isinstance(message, dict):
+        return message.get(field)
+    return getattr(message, field, None)
+
+
+def count_message_tokens(messages: list) -> int:
+    """估算一组消息的 tokens (含工具调用参数)"""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD + count_tokens(str(_get(message, "content") or ""))
+        for call in _get(message, "tool_calls") or []:
+            function = _get(call, "function")
+            total += count_tokens(str(_get(function, "name") or "")) + count_tokens(str(_get(function, "arguments") or ""))
+    return total
+
+
+# ========== 截短 ==========
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """保留开头和结尾, 中间替换为省略标记"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep_chars = max(1, int(len(text) * max_tokens / tokens))
+    head = keep_chars * 2 // 3
+    tail = keep_chars - head
+    omitted = tokens - max_tokens
+    return f"{text[:head]}\n...[省略约 {omitted} tokens]...\n{text[len(text) - tail:] if tail else ''}"
+
+
+def _water_level(sizes: List[int], excess: int) -> int:
+    """二分查找截断线 L, 使 sum(max(0, size - L)) >= excess 且 L 尽量大"""
+    low, high = MIN_BLOCK_TOKENS, max(sizes)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if sum(max(0, s - mid) for s in sizes) >= excess:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def fit_blocks(blocks: List[str], budget: int, priorities: Optional[List[int]] = None) -> List[str]:
+    """
+    把多段上下文压到 budget 以内
+
+    Args:
+        blocks: 上下文块 (如每个 Agent 的发言)
+        budget: 这些块总共可用的 tokens
+        priorities: 每块的优先级, 数值小的先被截; 默认越早的块优先级越低
+
+    同一优先级内按"削峰"方式截短 (最长的先截), 全部截到最短仍超出时,
+    按优先级从低到高整块丢弃
+    """
+    if priorities is None:
+        priorities = list(range(len(blocks)))
+    blocks = list(blocks)
+    sizes = [count_tokens(b) for b in blocks]
+    total = sum(sizes)
+    if total <= budget:
+        return blocks
+
+    before = total
+    for priority in sorted(set(priorities)):
+        excess = total - budget
+        if excess <= 0:
+            break
+        group = [i for i, p in enumerate(priorities) if p == priority and sizes[i] > MIN_BLOCK_TOKENS]
+        if not group:
+            continue
+        level = _water_level([sizes[i] for i in group], excess)
+        for i in group:
+            if sizes[i] > level:
+                blocks[i] = truncate_text(blocks[i], level)
+                total -= sizes[i] - level
+                sizes[i] = level
+
+    dropped = set()
+    for i in sorted(range(len(blocks)), key=lambda i: (priorities[i], i)):
+        if total <= budget:
+            break
+        dropped.add(i)
+        total -= sizes[i]
+
+    BUDGET_STATS.record(before, total)
+    return [b for i, b in enumerate(blocks) if i not in dropped]
+
+
+def fit_messages(
+    messages: list,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    budget: Optional[int] = None
+) -> list:
+    """
+    发送前的预算检查, 返回新的消息列表 (不修改传入的列表)
+
+    system 消息和最后一条消息受保护; 中间的历史消息 (如 ReAct 的 Observation)
+    越早优先级越低: 先截短内容, 仍超出再从最早开始整段丢弃.
+    带 tool_calls 的 assistant 消息和随后的 tool 消息作为一段, 一起保留或丢弃
+    """
+    if budget is None:
+        budget = prompt_budget(model, max_tokens)
+    total = count_message_tokens(messages)
+    BUDGET_STATS.record_check()
+    if total <= budget or len(messages) < 2:
+        return messages
+
+    # 划分段落: 受保护的消息单独成段, 工具调用和它的结果合成一段
+    units = []
+    for index, message in enumerate(messages):
+        role = _get(message, "role")
+        protected = role == "system" or index == len(messages) - 1
+        if role == "tool" and units and not units[-1]["protected"]:
+            units[-1]["messages"].append(message)
+        else:
+            units.append({"messages": [message], "protected": protected})
+
+    # 1. 从最早的历史消息开始截短内容 (只截 dict 消息, SDK 对象原样保留)
+    history = [u for u in units if not u["protected"]]
+    current = total
+    for unit in history:
+        for j, message in enumerate(unit["messages"]):
+            excess = current - budget
+            if excess <= 0 or not isinstance(message, dict) or not message.get("content"):
+                continue
+            content = str(message["content"])
+            size = count_tokens(content)
+            target = max(MIN_BLOCK_TOKENS, size - excess)
+            if target < size:
+                trimmed = truncate_text(content, target)
+                unit["messages"][j] = {**message, "content": trimmed}
+                current -= size - count_tokens(trimmed)
+
+    # 2. 仍然超出: 从最早的历史段开始整段丢弃
+    for unit in history:
+        if current <= budget:
+            break
+        units.remove(unit)
+        current -= count_message_tokens(unit["messages"])
+
+    # 3. 受保护消息本身过长: 截短其中最长的 dict 消息
+    result = [m for unit in units for m in unit["messages"]]
+    excess = count_message_tokens(result) - budget
+    if excess > 0:
+        candidates = [i for i, m in enumerate(result) if isinstance(m, dict) and m.get("content")]
+        if candidates:
+            i = max(candidates, key=lambda i: count_tokens(str(result[i]["content"])))
+            content = str(result[i]["content"])
+            target = max(MIN_BLOCK_TOKENS, count_tokens(content) - excess)
+            result[i] = {**result[i], "content": truncate_text(content, target)}
+
+    after = count_message_tokens(result)
+    BUDGET_STATS.record(total, after)
+    print(f"✂️ 提示超出预算 ({total} > {budget} tokens), 已裁剪到 {after} tokens")
+    return result
+
+
+# ========== 统计 ==========
+
+class BudgetStats:
+    """裁剪统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0         # 检查过的请求数
+        self.trimmed = 0         # 被裁剪的次数
+        self.tokens_removed = 0  # 裁掉的 tokens
+
+    def record_check(self):
+        with self._lock:
+            self.checked += 1
+
+    def record(self, before: int, after: int):
+        with self._lock:
+            self.trimmed += 1
+            self.tokens_removed += max(0, before - after)
+
+    def get_stats(self):
+        """获取统计信息"""
+        return {"checked": self.checked, "trimmed": self.trimmed, "tokens_removed": self.tokens_removed}
+
+
+BUDGET_STATS = BudgetStats()
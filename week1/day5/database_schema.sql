@@ -5,7 +5,7 @@
 CREATE TABLE IF NOT EXISTS posts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     platform VARCHAR(50) NOT NULL,           -- 平台: 微博/抖音/小红书等
-    post_id VARCHAR(100) UNIQUE NOT NULL,    -- 平台原始ID
+    post_id VARCHAR(100) NOT NULL,           -- 平台原始ID, 同一平台内唯一
     content TEXT NOT NULL,                   -- 帖子内容
     author VARCHAR(100),                     -- 作者
     author_followers INTEGER DEFAULT 0,      -- 粉丝数
@@ -15,11 +15,17 @@ CREATE TABLE IF NOT EXISTS posts (
     shares INTEGER DEFAULT 0,                -- 转发数
     url TEXT,                                -- 原帖链接
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_platform (platform),
-    INDEX idx_publish_time (publish_time),
-    INDEX idx_author (author)
+    UNIQUE(platform, post_id)
 );
 
+-- SQLite 不支持表内 INDEX 写法, 索引单独创建
+-- 覆盖索引: 平台计数、平台内按点赞 / 时间排序只读索引, 不回表
+CREATE INDEX IF NOT EXISTS idx_posts_platform_likes ON posts (platform, likes);
+CREATE INDEX IF NOT EXISTS idx_posts_platform_time ON posts (platform, publish_time);
+CREATE INDEX IF NOT EXISTS idx_posts_publish_time ON posts (publish_time);
+CREATE INDEX IF NOT EXISTS idx_posts_likes ON posts (likes);            -- 按点赞取前 N, 不用排序
+CREATE INDEX IF NOT EXISTS idx_posts_author ON posts (author);
+
 -- ========== 2. 评论表 ==========
 CREATE TABLE IF NOT EXISTS comments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,23 +37,26 @@ CREATE TABLE IF NOT EXISTS comments (
     likes INTEGER DEFAULT 0,                 -- 点赞数
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (post_id) REFERENCES posts(id),
-    INDEX idx_post_id (post_id)
+    UNIQUE(post_id, comment_id)              -- 同一帖子下评论ID唯一 (批量导入去重)
 );
 
+CREATE INDEX IF NOT EXISTS idx_comments_post_likes ON comments (post_id, likes);   -- 帖子下的热门评论
+
 -- ========== 3. 情感分析表 ==========
 CREATE TABLE IF NOT EXISTS sentiment (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    post_id INTEGER NOT NULL,                -- 关联帖子
+    post_id INTEGER NOT NULL UNIQUE,         -- 关联帖子 (每个帖子一条分析)
     sentiment_score FLOAT,                   -- 情感分数 (-1到1)
     sentiment_label VARCHAR(20),             -- 标签: positive/negative/neutral
     confidence FLOAT,                        -- 置信度
     keywords TEXT,                           -- 关键词(JSON)
     analyzed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (post_id) REFERENCES posts(id),
-    INDEX idx_post_id (post_id),
-    INDEX idx_sentiment_label (sentiment_label)
+    FOREIGN KEY (post_id) REFERENCES posts(id)
 );
 
+-- 覆盖索引: 按标签计数 / 平均分只读索引; 按 post_id 关联走 UNIQUE 约束自带的索引
+CREATE INDEX IF NOT EXISTS idx_sentiment_label_score ON sentiment (sentiment_label, sentiment_score);
+
 -- ========== 4. 话题表 ==========
 CREATE TABLE IF NOT EXISTS topics (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -58,11 +67,12 @@ CREATE TABLE IF NOT EXISTS topics (
     first_seen DATETIME,                     -- 首次出现
     last_updated DATETIME,                   -- 最后更新
     status VARCHAR(20) DEFAULT 'active',     -- 状态: active/archived
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_topic_name (topic_name),
-    INDEX idx_hot_score (hot_score)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_topics_name ON topics (topic_name);
+CREATE INDEX IF NOT EXISTS idx_topics_hot_score ON topics (hot_score);
+
 -- ========== 5. 话题-帖子关联表 ==========
 CREATE TABLE IF NOT EXISTS topic_posts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -73,4 +83,6 @@ CREATE TABLE IF NOT EXISTS topic_posts (
     FOREIGN KEY (topic_id) REFERENCES topics(id),
     FOREIGN KEY (post_id) REFERENCES posts(id),
     UNIQUE(topic_id, post_id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS idx_topic_posts_post ON topic_posts (post_id);
\ No newline at end of file
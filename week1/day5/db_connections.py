@@ -0,0 +1,181 @@
+"""
+SQLite 连接管理 - TextToSQLAgent / InsightAgent 共用
+学习目标:
+1. 连接复用: 每个线程一个长期存活的只读连接, 页缓存和预编译语句缓存跨查询保留,
+   不再每条查询 connect / close 一次
+2. WAL 日志模式: 读不阻塞写、写不阻塞读, 多个 Agent 并发查询不会在文件锁上排队
+3. 只读连接用 URI mode=ro 打开并开启 query_only, LLM 生成的 SQL 即使绕过关键字检查也写不进库
+4. 写操作 (建表、导入数据) 只走一个写连接, 由锁串行化, 不会出现 "database is locked"
+5. 调优 PRAGMA: cache_size (页缓存)、mmap_size (内存映射读)、synchronous=NORMAL (WAL 下安全且更快)
+
+用法:
+    db = get_connection_manager("week1/day5/sentiment.db")
+    columns, rows = db.query("SELECT platform, COUNT(*) FROM posts GROUP BY platform")
+    with db.writer() as conn:           # 正常退出时提交, 出错时回滚
+        conn.executemany("INSERT INTO posts ...", rows)
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+from urllib.parse import quote
+
+DEFAULT_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))       # 每个连接的页缓存 (64MB)
+DEFAULT_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 内存映射读 (256MB)
+DEFAULT_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE_SIZE = 256  # 每个连接缓存的预编译语句数 (sqlite3 默认 128)
+
+
+class ConnectionManager:
+    """
+    单个数据库文件的连接管理器
+
+    - reader(): 当前线程的只读连接 (第一次调用时创建)
+    - writer(): 唯一的写连接, 持锁使用
+    线程退出后它的只读连接不会自动关闭, 由 close() 统一关闭 (线程池里的线程是复用的, 连接数有上限)
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+        mmap_size: int = DEFAULT_MMAP_SIZE,
+        busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS
+    ):
+        self.db_path = os.path.abspath(db_path)
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self.reads = 0
+        self.writes = 0
+        self.read_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+        # 写连接负责建库和切换到 WAL (journal_mode 会写进数据库文件, 之后的连接都沿用)
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._writer = sqlite3.connect(
+            self.db_path,
+            timeout=busy_timeout_ms / 1000,
+            check_same_thread=False,  # 由 _write_lock 保证同一时刻只有一个线程使用
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        self.journal_mode = self._writer.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._tune(self._writer)
+
+    def _tune(self, conn: sqlite3.Connection):
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")  # 负数表示 KB
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+    def _open_reader(self) -> sqlite3.Connection:
+        uri = f"file:{quote(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,  # 只在所属线程里用; 关闭时 close() 在别的线程统一关闭
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        self._tune(conn)
+        conn.execute("PRAGMA query_only=ON")
+        with self._readers_lock:
+            self._readers.append(conn)
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_reader()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """with db.writer() as conn: ... 独占写连接, 正常退出时提交, 出错时回滚"""
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                with self._stats_lock:
+                    self.writes += 1
+
+    def query(self, sql: str, params: Sequence = ()) -> Tuple[List[str], List[tuple]]:
+        """在只读连接上执行查询, 返回 (列名, 行)"""
+        start = time.perf_counter()
+        cursor = self.reader().execute(sql, params)
+        try:
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        finally:
+            cursor.close()
+            with self._stats_lock:
+                self.reads += 1
+                self.read_seconds += time.perf_counter() - start
+        return columns, rows
+
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        with self._readers_lock:
+            readers = len(self._readers)
+        with self._stats_lock:
+            return {
+                "db_path": self.db_path,
+                "journal_mode": self.journal_mode,
+                "readers": readers,
+                "reads": self.reads,
+                "writes": self.writes,
+                "avg_read_ms": round(self.read_seconds / self.reads * 1000, 3) if self.reads else None,
+            }
+
+    def close(self):
+        """关闭所有连接"""
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        self._local = threading.local()
+        with self._write_lock:
+            self._writer.close()
+
+
+# ========== 全局注册表 ==========
+
+_MANAGERS: Dict[str, ConnectionManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+def get_connection_manager(db_path: str) -> ConnectionManager:
+    """按数据库文件 (绝对路径) 获取共享的连接管理器"""
+    key = os.path.abspath(db_path)
+    with _MANAGERS_LOCK:
+        manager = _MANAGERS.get(key)
+        if manager is None:
+            manager = ConnectionManager(key)
+            _MANAGERS[key] = manager
+        return manager
+
+
+def close_all():
+    """关闭所有连接管理器 (测试或进程退出前调用)"""
+    with _MANAGERS_LOCK:
+        managers = list(_MANAGERS.values())
+        _MANAGERS.clear()
+    for manager in managers:
+        manager.close()
@@ -0,0 +1,602 @@
+"""
+帖子 / 评论 / 情感分析的流式批量导入
+学习目标:
+1. 生成器流水线: 读取 → 校验 → 去重分批 → 写入, 每一步一次只拿一行, 内存占用只和批大小有关, 和文件大小无关
+2. 按 (platform, post_id) 去重: 批内用字典, 跨批 / 跨文件 / 和库里已有数据的重复由唯一约束 (ON CONFLICT) 处理
+3. executemany 分批写入, 多个批次合成一个大事务提交, 不为每一行付一次事务开销
+4. 大批量导入前删掉二级索引, 导完一次性重建 (比逐行维护 B 树快); 唯一索引保留 (去重靠它们)
+   删掉的索引定义先写进 ingest_dropped_indexes, 导入中途崩溃时下次启动会补建
+5. 实时打印吞吐量 (行/秒) 和内存峰值, 不合格的行连同原因写进 rejects 文件, 不中断导入
+
+输入格式 (按扩展名识别, 支持 .gz; 标准输入用 - 并指定 --format):
+    JSONL: 每行一个帖子
+        {"platform": "微博", "post_id": "wb001", "content": "...", "author": "...", "publish_time": "2024-01-15 10:00:00",
+         "likes": 1520, "comments_count": 86, "shares": 234, "author_followers": 0, "url": "...",
+         "sentiment": {"score": 0.85, "label": "positive", "confidence": 0.92, "keywords": ["AI", "Agent"]},
+         "comments": [{"comment_id": "c1", "content": "...", "author": "...", "publish_time": "...", "likes": 3}]}
+    CSV: 表头为帖子字段, 情感分析用 sentiment_score / sentiment_label / sentiment_confidence / sentiment_keywords 列
+    publish_time 支持 "YYYY-MM-DD HH:MM:SS"、ISO 8601 (带时区时转为本地时间) 和秒 / 毫秒时间戳
+
+用法:
+    python week1/day5/ingest.py posts.jsonl
+    python week1/day5/ingest.py posts_2024*.csv.gz --db week1/day5/sentiment.db --batch-size 5000
+    python week1/day5/ingest.py posts.jsonl --on-conflict update --rejects rejects.jsonl
+    python week1/day5/ingest.py big.jsonl --drop-indexes always
+    cat posts.jsonl | python week1/day5/ingest.py - --format jsonl
+"""
+
+import io
+import os
+import re
+import sys
+import csv
+import gzip
+import json
+import time
+import sqlite3
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from db_connections import ConnectionManager, get_connection_manager
+from migrations import migrate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "2000"))       # 每次 executemany 的帖子数
+DEFAULT_COMMIT_EVERY = int(os.getenv("INGEST_COMMIT_EVERY", "50000"))  # 每个事务的帖子数
+# --drop-indexes auto: 输入文件超过这个大小才删索引 (小文件重建索引反而更慢)
+DROP_INDEXES_MIN_BYTES = int(os.getenv("INGEST_DROP_INDEXES_MIN_BYTES", str(64 * 1024 * 1024)))
+
+INGEST_TABLES = ("posts", "comments", "sentiment")
+SENTIMENT_LABELS = ("positive", "negative", "neutral")
+_CANONICAL_TIME = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+class PostRow(NamedTuple):
+    platform: str
+    post_id: str
+    content: str
+    author: Optional[str]
+    author_followers: int
+    publish_time: str
+    likes: int
+    comments_count: int
+    shares: int
+    url: Optional[str]
+
+
+class Record(NamedTuple):
+    """校验通过的一条输入: 帖子 + 可选的情感分析 + 评论"""
+    post: PostRow
+    sentiment: Optional[Tuple[float, str, Optional[float], Optional[str]]]  # (score, label, confidence, keywords)
+    comments: List[Tuple[str, str, Optional[str], Optional[str], int]]      # (comment_id, content, author, publish_time, likes)
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.post.platform, self.post.post_id
+
+
+class IngestStats:
+    """导入过程中的计数"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.rejected = 0
+        self.reject_reasons: Counter = Counter()
+        self.duplicates_in_input = 0  # 同一批里重复的 (platform, post_id)
+        self.posts_inserted = 0
+        self.posts_existing = 0       # 库里已有 (ignore: 跳过; update: 更新)
+        self.sentiment_written = 0
+        self.comments_written = 0
+        self.transactions = 0
+        self.indexes_rebuilt: List[str] = []
+        self.index_rebuild_seconds = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict:
+        elapsed = self.elapsed
+        return {
+            "read": self.read,
+            "rejected": self.rejected,
+            "reject_reasons": dict(self.reject_reasons),
+            "duplicates_in_input": self.duplicates_in_input,
+            "posts_inserted": self.posts_inserted,
+            "posts_existing": self.posts_existing,
+            "sentiment_written": self.sentiment_written,
+            "comments_written": self.comments_written,
+            "transactions": self.transactions,
+            "indexes_rebuilt": self.indexes_rebuilt,
+            "index_rebuild_seconds": round(self.index_rebuild_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.read / elapsed, 1) if elapsed else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def print_summary(self, on_conflict: str):
+        stats = self.as_dict()
+        existing = "已存在跳过" if on_conflict == "ignore" else "已存在更新"
+        print(f"📥 读取 {stats['read']} 行, {stats['elapsed_seconds']:.1f}s, "
+              f"{stats['rows_per_second']:.0f} 行/秒, 内存峰值 {stats['peak_rss_mb']} MB")
+        print(f"   帖子: 新增 {stats['posts_inserted']} | {existing} {stats['posts_existing']} | "
+              f"输入内重复 {stats['duplicates_in_input']} | 不合格 {stats['rejected']}")
+        print(f"   情感分析: {stats['sentiment_written']} | 评论: {stats['comments_written']} | "
+              f"事务: {stats['transactions']}")
+        if stats["indexes_rebuilt"]:
+            print(f"   重建索引 {len(stats['indexes_rebuilt'])} 个, {stats['index_rebuild_seconds']:.1f}s")
+        for reason, count in self.reject_reasons.most_common(5):
+            print(f"   ⚠️  {reason}: {count}")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程内存峰值 (MB); 没有 resource 模块时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB, macOS 是字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ========== 1. 读取 ==========
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    raise ValueError(f"无法从文件名识别格式: {path} (用 --format jsonl/csv 指定)")
+
+
+def _open_text(path: str):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def read_rows(path: str, fmt: str) -> Iterator[Tuple[int, Union[str, Dict]]]:
+    """逐行产出 (行号, 原始行): JSONL 为字符串 (在校验阶段解析), CSV 为字典"""
+    with _open_text(path) as f:
+        if fmt == "csv":
+            for line_no, row in enumerate(csv.DictReader(f), start=2):  # 第 1 行是表头
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_no, line
+
+
+# ========== 2. 校验 ==========
+
+def _text(value, field: str, required: bool = False, max_length: Optional[int] = None) -> Optional[str]:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError(f"缺少 {field}")
+        return None
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"{field} 不是文本")
+    text = str(value).strip()
+    if max_length is not None and len(text) > max_length:
+        raise ValueError(f"{field} 超过 {max_length} 字符")
+    return text
+
+
+def _count(value, field: str) -> int:
+    """计数字段: 空值为 0, 必须是非负整数 (允许 "1,234" 和 "12.0")"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        raise ValueError(f"{field} 不是非负整数")
+    try:
+        number = float(str(value).replace(",", "")) if not isinstance(value, int) else value
+    except ValueError:
+        raise ValueError(f"{field} 不是非负整数") from None
+    if number < 0 or number != int(number):
+        raise ValueError(f"{field} 不是非负整数")
+    return int(number)
+
+
+def _float(value, field: str, low: float, high: float, required: bool = False) -> Optional[float]:
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"缺少 {field}")
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} 不是数字") from None
+    if not low <= number <= high:
+        raise ValueError(f"{field} 超出 [{low}, {high}]")
+    return number
+
+
+def parse_time(value, field: str = "publish_time", required: bool = True) -> Optional[str]:
+    """时间统一为本地时间 "YYYY-MM-DD HH:MM:SS" (和库里已有数据一致, 按字符串比较即按时间比较)"""
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"缺少 {field}")
+        return None
+    if isinstance(value, str) and _CANONICAL_TIME.fullmatch(value):  # 已是目标格式 (最常见), 只校验不转换
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{field} 无法解析") from None
+        return value
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool) or str(value).strip().isdigit():
+            seconds = float(value)
+            if seconds > 1e11:  # 毫秒时间戳
+                seconds /= 1000
+            moment = datetime.fromtimestamp(seconds)
+        else:
+            text = str(value).strip()
+            if text.endswith("Z"):
+                text = text[:-1] + "+00:00"
+            moment = datetime.fromisoformat(text)
+            if moment.tzinfo is not None:
+                moment = moment.astimezone().replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError(f"{field} 无法解析") from None
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _keywords(value) -> Optional[str]:
+    """关键词存为 JSON 数组文本; CSV 里可以是 JSON 数组或逗号分隔"""
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("["):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError:
+                raise ValueError("sentiment.keywords 不是合法的 JSON 数组") from None
+        else:
+            value = [word.strip() for word in text.replace("，", ",").split(",") if word.strip()]
+    if not isinstance(value, list) or not all(isinstance(word, str) for word in value):
+        raise ValueError("sentiment.keywords 不是字符串列表")
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _sentiment(raw: Dict) -> Optional[Tuple[float, str, Optional[float], Optional[str]]]:
+    if "sentiment" in raw and raw["sentiment"] is not None:
+        data = raw["sentiment"]
+        if not isinstance(data, dict):
+            raise ValueError("sentiment 不是对象")
+    else:
+        data = {
+            "score": raw.get("sentiment_score"),
+            "label": raw.get("sentiment_label"),
+            "confidence": raw.get("sentiment_confidence"),
+            "keywords": raw.get("sentiment_keywords"),
+        }
+    if all(data.get(k) in (None, "") for k in ("score", "label")):
+        return None
+    score = _float(data.get("score"), "sentiment.score", -1.0, 1.0, required=True)
+    label = _text(data.get("label"), "sentiment.label", required=True).lower()
+    if label not in SENTIMENT_LABELS:
+        raise ValueError("sentiment.label 不是 positive/negative/neutral")
+    confidence = _float(data.get("confidence"), "sentiment.confidence", 0.0, 1.0)
+    return score, label, confidence, _keywords(data.get("keywords"))
+
+
+def _comments(raw: Dict) -> List[Tuple[str, str, Optional[str], Optional[str], int]]:
+    items = raw.get("comments")
+    if items is None or items == "":
+        return []
+    if not isinstance(items, list):
+        raise ValueError("comments 不是数组")
+    comments = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("comments 里有非对象元素")
+        comments.append((
+            # 没有评论ID就无法去重, 重复导入会重复插入
+            _text(item.get("comment_id"), "comments.comment_id", required=True, max_length=100),
+            _text(item.get("content"), "comments.content", required=True),
+            _text(item.get("author"), "comments.author", max_length=100),
+            parse_time(item.get("publish_time"), "comments.publish_time", required=False),
+            _count(item.get("likes"), "comments.likes"),
+        ))
+    return comments
+
+
+def validate_record(raw: Union[str, Dict]) -> Record:
+    """原始行 → Record, 不合格时抛 ValueError (消息即拒绝原因, 不含具体值, 方便按原因计数)"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValueError("不是合法的 JSON") from None
+    if not isinstance(raw, dict):
+        raise ValueError("不是 JSON 对象")
+    post = PostRow(
+        platform=_text(raw.get("platform"), "platform", required=True, max_length=50),
+        post_id=_text(raw.get("post_id"), "post_id", required=True, max_length=100),
+        content=_text(raw.get("content"), "content", required=True),
+        author=_text(raw.get("author"), "author", max_length=100),
+        author_followers=_count(raw.get("author_followers"), "author_followers"),
+        publish_time=parse_time(raw.get("publish_time")),
+        likes=_count(raw.get("likes"), "likes"),
+        comments_count=_count(raw.get("comments_count"), "comments_count"),
+        shares=_count(raw.get("shares"), "shares"),
+        url=_text(raw.get("url"), "url"),
+    )
+    return Record(post, _sentiment(raw), _comments(raw))
+
+
+def validate(rows: Iterable[Tuple[int, Union[str, Dict]]], stats: IngestStats, rejects=None) -> Iterator[Record]:
+    """丢掉不合格的行 (计数, 可选写入 rejects 文件), 产出 Record"""
+    for line_no, raw in rows:
+        stats.read += 1
+        try:
+            yield validate_record(raw)
+        except ValueError as e:
+            stats.rejected += 1
+            stats.reject_reasons[str(e)] += 1
+            if rejects is not None:
+                rejects.write(json.dumps(
+                    {"line": line_no, "reason": str(e), "raw": raw.rstrip("\n") if isinstance(raw, str) else raw},
+                    ensure_ascii=False
+                ) + "\n")
+
+
+# ========== 3. 去重分批 ==========
+
+def dedupe_batches(records: Iterable[Record], batch_size: int, stats: IngestStats,
+                   keep: str = "first") -> Iterator[List[Record]]:
+    """
+    按 (platform, post_id) 去重并分批
+    keep="first": 同一批里保留第一次出现的 (和 ON CONFLICT DO NOTHING 一致); "last": 保留最后一次 (和 DO UPDATE 一致)
+    只在批内去重, 内存不随文件增长; 跨批的重复交给唯一约束
+    """
+    batch: Dict[Tuple[str, str], Record] = {}
+    for record in records:
+        if record.key in batch:
+            stats.duplicates_in_input += 1
+            if keep == "first":
+                continue
+            del batch[record.key]  # 重新插入, 排到批尾
+        batch[record.key] = record
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+# ========== 4. 写入 ==========
+
+_POST_COLUMNS = ", ".join(PostRow._fields)
+_POST_PLACEHOLDERS = ", ".join("?" * len(PostRow._fields))
+
+POSTS_SQL = {
+    "ignore": f"INSERT INTO posts ({_POST_COLUMNS}) VALUES ({_POST_PLACEHOLDERS}) "
+              "ON CONFLICT(platform, post_id) DO NOTHING",
+    "update": f"INSERT INTO posts ({_POST_COLUMNS}) VALUES ({_POST_PLACEHOLDERS}) "
+              "ON CONFLICT(platform, post_id) DO UPDATE SET "
+              "content = excluded.content, author = COALESCE(excluded.author, author), "
+              "author_followers = excluded.author_followers, publish_time = excluded.publish_time, "
+              "likes = excluded.likes, comments_count = excluded.comments_count, shares = excluded.shares, "
+              "url = COALESCE(excluded.url, url)",
+}
+
+# 情感分析和评论按 (platform, post_id) 找到帖子的自增 id (走唯一索引), 不需要先把 id 查回 Python
+SENTIMENT_SQL = {
+    "ignore": "INSERT INTO sentiment (post_id, sentiment_score, sentiment_label, confidence, keywords) "
+              "SELECT id, ?, ?, ?, ? FROM posts WHERE platform = ? AND post_id = ? "
+              "ON CONFLICT(post_id) DO NOTHING",
+    "update": "INSERT INTO sentiment (post_id, sentiment_score, sentiment_label, confidence, keywords) "
+              "SELECT id, ?, ?, ?, ? FROM posts WHERE platform = ? AND post_id = ? "
+              "ON CONFLICT(post_id) DO UPDATE SET "
+              "sentiment_score = excluded.sentiment_score, sentiment_label = excluded.sentiment_label, "
+              "confidence = excluded.confidence, keywords = excluded.keywords, analyzed_at = CURRENT_TIMESTAMP",
+}
+
+COMMENTS_SQL = {
+    "ignore": "INSERT INTO comments (post_id, comment_id, content, author, publish_time, likes) "
+              "SELECT id, ?, ?, ?, ?, ? FROM posts WHERE platform = ? AND post_id = ? "
+              "ON CONFLICT(post_id, comment_id) DO NOTHING",
+    "update": "INSERT INTO comments (post_id, comment_id, content, author, publish_time, likes) "
+              "SELECT id, ?, ?, ?, ?, ? FROM posts WHERE platform = ? AND post_id = ? "
+              "ON CONFLICT(post_id, comment_id) DO UPDATE SET "
+              "content = excluded.content, likes = excluded.likes",
+}
+
+
+def write_batch(conn: sqlite3.Connection, batch: List[Record], on_conflict: str, stats: IngestStats):
+    """在当前事务里写入一批"""
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM posts").fetchone()[0]
+    conn.executemany(POSTS_SQL[on_conflict], [record.post for record in batch])
+    inserted = conn.execute("SELECT COUNT(*) FROM posts WHERE id > ?", (max_id,)).fetchone()[0]
+    stats.posts_inserted += inserted
+    stats.posts_existing += len(batch) - inserted
+
+    sentiment = [
+        (*record.sentiment, *record.key)
+        for record in batch if record.sentiment is not None
+    ]
+    if sentiment:
+        stats.sentiment_written += conn.executemany(SENTIMENT_SQL[on_conflict], sentiment).rowcount
+
+    comments = [
+        (*comment, *record.key)
+        for record in batch for comment in record.comments
+    ]
+    if comments:
+        stats.comments_written += conn.executemany(COMMENTS_SQL[on_conflict], comments).rowcount
+
+
+def write_batches(db: ConnectionManager, batches: Iterable[List[Record]], on_conflict: str,
+                  commit_every: int, stats: IngestStats, progress: bool = True):
+    """
+    每 commit_every 个帖子提交一次事务
+    事务里持有写锁, 同一进程里其他写操作会等到这次提交; 读不受影响 (WAL)
+    """
+    batches = iter(batches)
+    done = False
+    while not done:
+        done = True
+        with db.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = 0
+            for batch in batches:
+                write_batch(conn, batch, on_conflict, stats)
+                rows += len(batch)
+                if rows >= commit_every:
+                    done = False
+                    break
+        if not rows:
+            break
+        stats.transactions += 1
+        if progress:
+            print(f"   ... 已读 {stats.read} 行 | 新增帖子 {stats.posts_inserted} | "
+                  f"{stats.read / stats.elapsed:.0f} 行/秒 | 内存峰值 {peak_rss_mb()} MB", flush=True)
+
+
+# ========== 5. 二级索引 ==========
+
+def secondary_indexes(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """导入涉及的表上可以暂时删掉的索引: 用户建的非唯一索引 (唯一索引和约束自带的索引去重要用)"""
+    placeholders = ", ".join("?" * len(INGEST_TABLES))
+    rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({placeholders}) ORDER BY name",
+        INGEST_TABLES
+    ).fetchall()
+    return [(name, sql) for name, sql in rows if not sql.upper().lstrip().startswith("CREATE UNIQUE")]
+
+
+def drop_secondary_indexes(db: ConnectionManager) -> List[str]:
+    """删掉二级索引, 定义先记进 ingest_dropped_indexes (同一个事务, 不会丢)"""
+    with db.writer() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        indexes = secondary_indexes(conn)
+        for name, sql in indexes:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_dropped_indexes (name, sql, dropped_at) VALUES (?, ?, ?)",
+                (name, sql, time.time())
+            )
+            conn.execute(f'DROP INDEX "{name}"')
+    return [name for name, _ in indexes]
+
+
+def restore_indexes(db: ConnectionManager) -> List[str]:
+    """重建 ingest_dropped_indexes 里记录的索引 (导入结束时, 以及上次导入中途崩溃后的下一次启动)"""
+    with db.writer() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        pending = conn.execute("SELECT name, sql FROM ingest_dropped_indexes ORDER BY name").fetchall()
+        for name, sql in pending:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+            ).fetchone()
+            if not exists:
+                conn.execute(sql)
+        conn.execute("DELETE FROM ingest_dropped_indexes")
+        if pending:
+            conn.execute("ANALYZE")  # 数据分布变了, 让查询规划器重新统计
+    return [name for name, _ in pending]
+
+
+# ========== 串起来 ==========
+
+def ingest(
+    paths: List[str],
+    db_path: str,
+    fmt: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    commit_every: int = DEFAULT_COMMIT_EVERY,
+    on_conflict: str = "ignore",
+    drop_indexes: str = "auto",
+    rejects_path: Optional[str] = None,
+    progress: bool = True
+) -> IngestStats:
+    """
+    把一个或多个文件导入 db_path, 返回统计
+    drop_indexes: "always" / "never" / "auto" (输入总大小超过 INGEST_DROP_INDEXES_MIN_BYTES 时删)
+    """
+    if on_conflict not in POSTS_SQL:
+        raise ValueError(f"on_conflict 只能是 ignore / update, 收到 {on_conflict!r}")
+    formats = [fmt or detect_format(path) for path in paths]
+
+    db = get_connection_manager(db_path)
+    migrate(db)
+    leftover = restore_indexes(db)
+    if leftover and progress:
+        print(f"🔧 补建上次导入中断时删掉的索引: {', '.join(leftover)}")
+
+    if drop_indexes == "auto":
+        sizes = [os.path.getsize(path) if path != "-" else 0 for path in paths]
+        drop_indexes = "always" if sum(sizes) >= DROP_INDEXES_MIN_BYTES else "never"
+
+    stats = IngestStats()
+    rejects = open(rejects_path, "w", encoding="utf-8") if rejects_path else None
+    dropped = drop_secondary_indexes(db) if drop_indexes == "always" else []
+    if dropped and progress:
+        print(f"🔧 导入期间删掉二级索引: {', '.join(dropped)}")
+    try:
+        for path, path_fmt in zip(paths, formats):
+            if progress:
+                print(f"📄 {path} ({path_fmt})")
+            records = validate(read_rows(path, path_fmt), stats, rejects)
+            batches = dedupe_batches(records, batch_size, stats, keep="first" if on_conflict == "ignore" else "last")
+            write_batches(db, batches, on_conflict, commit_every, stats, progress)
+    finally:
+        if rejects is not None:
+            rejects.close()
+        if dropped:
+            start = time.perf_counter()
+            stats.indexes_rebuilt = restore_indexes(db)
+            stats.index_rebuild_seconds = time.perf_counter() - start
+        # 大事务会让 WAL 文件涨到和导入量相当, 导完截断
+        with db.writer() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 JSONL / CSV 格式的帖子、评论、情感分析批量导入 sentiment.db")
+    parser.add_argument("paths", nargs="+", help="输入文件 (.jsonl / .csv, 可以是 .gz), - 表示标准输入")
+    parser.add_argument("--db", default="week1/day5/sentiment.db", help="数据库文件")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="输入格式 (默认按扩展名识别)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每次 executemany 的帖子数")
+    parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY, help="每个事务的帖子数")
+    parser.add_argument("--on-conflict", choices=["ignore", "update"], default="ignore",
+                        help="(platform, post_id) 已存在时: ignore 跳过 / update 用新数据覆盖互动数等字段")
+    parser.add_argument("--drop-indexes", choices=["auto", "always", "never"], default="auto",
+                        help="导入期间删掉二级索引、导完重建 (auto: 输入超过 64MB 时)")
+    parser.add_argument("--rejects", help="不合格的行写到这个 JSONL 文件")
+    parser.add_argument("--json", action="store_true", help="最后输出一行 JSON 格式的统计")
+    args = parser.parse_args()
+
+    if "-" in args.paths and not args.format:
+        parser.error("从标准输入读取时需要指定 --format")
+
+    stats = ingest(
+        args.paths, args.db,
+        fmt=args.format,
+        batch_size=args.batch_size,
+        commit_every=args.commit_every,
+        on_conflict=args.on_conflict,
+        drop_indexes=args.drop_indexes,
+        rejects_path=args.rejects,
+        progress=not args.json
+    )
+    if args.json:
+        print(json.dumps(stats.as_dict(), ensure_ascii=False))
+    else:
+        stats.print_summary(args.on_conflict)
+
+
+if __name__ == "__main__":
+    main()
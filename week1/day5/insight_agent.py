@@ -7,13 +7,46 @@
 """
 
 import os
-import sqlite3
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 from typing import List, Dict
 import json
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../day4'))
+from client_registry import get_client
+from llm_calls import chat_completion
+from telemetry import TELEMETRY
+from governor import GOVERNOR, sqlite_pool
+from sql_cache import SQLCache, get_sql_cache, schema_fingerprint
+from db_connections import get_connection_manager
+
+# 各步骤的固定指令放在 system 消息里, 本次的主题/问题/数据放在 user 消息里,
+# 同类请求前缀相同, 可以命中提供方的前缀缓存
+PLAN_PROMPT = """你是数据分析专家。针对用户给出的主题,生成3-5个分析步骤,每个步骤是一个具体的数据查询问题。
+
+要求:
+1. 从不同角度分析
+2. 由浅入深
+3. 每个问题具体明确
+
+只输出问题列表,每行一个,格式:
+1. 问题1
+2. 问题2
+..."""
+
+SQL_PROMPT = """你是SQL专家。生成SQL查询回答用户的问题。
+
+数据库表:
+- posts (id, platform, content, author, publish_time, likes, comments_count, shares)
+- sentiment (id, post_id, sentiment_score, sentiment_label, confidence)
+
+只返回SQL,不要解释。使用SQLite语法。"""
+
+INSIGHT_PROMPT = "你是数据分析专家。根据用户给出的问题和查询结果,用2-3句话总结关键发现。"
+
+SYNTHESIS_PROMPT = """你是数据分析专家。请综合用户给出的分析发现,给出:
+1. 核心结论 (2-3句话)
+2. 关键趋势 (1-2点)
+3. 建议行动 (1-2点)"""
 
 class InsightAgent:
     """
@@ -23,10 +56,11 @@ class InsightAgent:
     
     def __init__(self, db_path="week1/day5/sentiment.db"):
         self.db_path = db_path
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.db_pool = sqlite_pool(db_path)  # 全局调度器的资源池, 同一数据库文件的 Agent 共享
+        self.db = get_connection_manager(db_path)  # 每线程复用的只读连接 + 唯一的写连接 (WAL)
+        self.client = get_client()  # 全进程共享客户端
+        self.sql_cache = get_sql_cache()  # 问题 → SQL 缓存, 与 TextToSQLAgent 共用一个库 (按提示词区分)
+        self.sql_namespace = SQLCache.make_namespace(SQL_PROMPT)
         
         self.analysis_history = []  # 分析历史
         
@@ -34,43 +68,31 @@ class InsightAgent:
     
     def execute_sql(self, sql: str):
         """执行SQL"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            conn.close()
-            return {"columns": columns, "data": results}
-        except Exception as e:
-            conn.close()
-            print(f"❌ SQL错误: {e}")
-            return None
+        with GOVERNOR.slot(self.db_pool):
+            try:
+                columns, results = self.db.query(sql)
+                return {"columns": columns, "data": results}
+            except Exception as e:
+                print(f"❌ SQL错误: {e}")
+                return None
+    
+    def schema_fingerprint(self) -> str:
+        """当前库结构的指纹, 表结构变化后缓存的 SQL 自动失效"""
+        with GOVERNOR.slot(self.db_pool):
+            return schema_fingerprint(self.db.reader())
     
     def generate_analysis_plan(self, topic: str) -> List[str]:
         """
         生成分析计划 - 多步骤任务分解
         模拟 BettaFish 的任务规划
         """
-        prompt = f"""你是数据分析专家。针对主题: {topic}
-
-生成3-5个分析步骤,每个步骤是一个具体的数据查询问题。
-
-要求:
-1. 从不同角度分析
-2. 由浅入深
-3. 每个问题具体明确
-
-只输出问题列表,每行一个,格式:
-1. 问题1
-2. 问题2
-...
-"""
-        
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent="InsightAgent",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="analysis",  # 任务分解决定后续所有查询, 不走最便宜的档位
+            messages=[
+                {"role": "system", "content": PLAN_PROMPT},
+                {"role": "user", "content": f"分析主题: {topic}"}
+            ],
             temperature=0.7
         )
         
@@ -89,30 +111,31 @@ class InsightAgent:
     
     def analyze_question(self, question: str) -> Dict:
         """分析单个问题"""
-        # 1. 生成SQL
-        sql_prompt = f"""生成SQL查询回答: {question}
-
-数据库表:
-- posts (id, platform, content, author, publish_time, likes, comments_count, shares)
-- sentiment (id, post_id, sentiment_score, sentiment_label, confidence)
-
-只返回SQL,不要解释。使用SQLite语法。"""
-
-        sql_response = self.client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": sql_prompt}],
-            temperature=0.1
-        )
-        
-        sql = sql_response.choices[0].message.content.strip()
-        sql = sql.replace('```sql', '').replace('```', '').strip()
+        # 1. 生成SQL (同一个问题在当前库结构下执行成功过时直接复用)
+        fingerprint = self.schema_fingerprint()
+        sql = self.sql_cache.get(question, fingerprint, self.sql_namespace)
+        if sql is None:
+            sql_response = chat_completion(self.client, agent="InsightAgent",
+                model="deepseek-chat",
+                task_type="sql",
+                messages=[
+                    {"role": "system", "content": SQL_PROMPT},
+                    {"role": "user", "content": f"问题: {question}"}
+                ],
+                temperature=0.1
+            )
+            
+            sql = sql_response.choices[0].message.content.strip()
+            sql = sql.replace('```sql', '').replace('```', '').strip()
         
         # 验证安全性
         if any(kw in sql.upper() for kw in ['DROP', 'DELETE', 'UPDATE', 'INSERT']):
+            self.sql_cache.record(question, sql, fingerprint, False, self.sql_namespace)
             return {"error": "不安全的SQL"}
         
-        # 2. 执行SQL
+        # 2. 执行SQL (成功的写入缓存, 失败的从缓存删除, 不会被反复重放)
         results = self.execute_sql(sql)
+        self.sql_cache.record(question, sql, fingerprint, results is not None, self.sql_namespace)
         
         if not results or not results['data']:
             return {"question": question, "sql": sql, "data": None}
@@ -121,13 +144,15 @@ class InsightAgent:
         insight_prompt = f"""问题: {question}
 
 查询结果:
-{results['data'][:10]}
-
-用2-3句话总结关键发现。"""
+{results['data'][:10]}"""
 
-        insight_response = self.client.chat.completions.create(
+        insight_response = chat_completion(self.client, agent="InsightAgent",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": insight_prompt}],
+            task_type="analysis",
+            messages=[
+                {"role": "system", "content": INSIGHT_PROMPT},
+                {"role": "user", "content": insight_prompt}
+            ],
             temperature=0.5
         )
         
@@ -150,7 +175,8 @@ class InsightAgent:
         
         # 阶段1: 生成分析计划
         print("📋 生成分析计划...")
-        questions = self.generate_analysis_plan(topic)
+        with TELEMETRY.stage("1_plan"):
+            questions = self.generate_analysis_plan(topic)
         
         print(f"   ✅ 生成 {len(questions)} 个分析步骤:\n")
         for i, q in enumerate(questions, 1):
@@ -165,7 +191,8 @@ class InsightAgent:
         for i, question in enumerate(questions, 1):
             print(f"📍 步骤 {i}/{len(questions)}: {question}")
             
-            result = self.analyze_question(question)
+            with TELEMETRY.stage("2_analyze"):
+                result = self.analyze_question(question)
             results.append(result)
             
             if result.get('data'):
@@ -189,18 +216,18 @@ class InsightAgent:
         synthesis_prompt = f"""主题: {topic}
 
 分析过程中的发现:
-{all_insights}
-
-请综合以上发现,给出:
-1. 核心结论 (2-3句话)
-2. 关键趋势 (1-2点)
-3. 建议行动 (1-2点)"""
-
-        final_response = self.client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": synthesis_prompt}],
-            temperature=0.6
-        )
+{all_insights}"""
+
+        with TELEMETRY.stage("3_synthesis"):
+            final_response = chat_completion(self.client, agent="InsightAgent",
+                model="deepseek-chat",
+                task_type="synthesis",
+                messages=[
+                    {"role": "system", "content": SYNTHESIS_PROMPT},
+                    {"role": "user", "content": synthesis_prompt}
+                ],
+                temperature=0.6
+            )
         
         print(final_response.choices[0].message.content)
         print(f"\n{'='*70}\n")
@@ -213,4 +240,5 @@ if __name__ == "__main__":
     agent = InsightAgent()
     
     # 完整分析
-    agent.comprehensive_analysis("AI技术的舆情分析")
\ No newline at end of file
+    agent.comprehensive_analysis("AI技术的舆情分析")
+    agent.sql_cache.print_summary()
\ No newline at end of file
@@ -0,0 +1,335 @@
+"""
+sentiment.db 的版本化迁移
+学习目标:
+1. schema_version 表记录已执行的迁移; 启动时只查一次最大版本号, 已是最新就什么都不做
+2. 每个迁移在一个 BEGIN IMMEDIATE 事务里执行并写入版本号, 中途失败整体回滚, 多个进程同时启动也只会执行一次
+3. 旧库 (早期 init_database 建的表, 没有唯一约束, 每次启动都重复插入测试数据) 迁移时去重并重建为完整结构
+4. 测试数据作为一个迁移写入, 只写一次
+
+完整结构见 database_schema.sql: 帖子按 (platform, post_id) 唯一 (各平台的原始 ID 可能重复), 情感分析每个帖子一条
+
+用法:
+    python week1/day5/migrations.py                      # 迁移默认数据库并打印版本
+    python week1/day5/migrations.py path/to/other.db --status
+"""
+
+import time
+import sqlite3
+import argparse
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from db_connections import ConnectionManager, get_connection_manager
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _rebuild(conn: sqlite3.Connection, table: str, create_sql: str, select_where: str = "", defaults: Optional[dict] = None):
+    """
+    按新结构重建表: 建 <table>_new → 复制两边都有的列 → 删旧表 → 改名
+    defaults: 旧数据里可能为 NULL、新结构要求 NOT NULL 的列 → 替代值的 SQL 表达式
+    """
+    defaults = defaults or {}
+    conn.execute(create_sql.replace(f"CREATE TABLE {table} (", f"CREATE TABLE {table}_new (", 1))
+    shared = [c for c in _columns(conn, f"{table}_new") if c in _columns(conn, table)]
+    select = ", ".join(f"COALESCE({c}, {defaults[c]})" if c in defaults else c for c in shared)
+    conn.execute(f"INSERT INTO {table}_new ({', '.join(shared)}) SELECT {select} FROM {table} {select_where}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+# ========== 迁移 ==========
+
+def _v1_legacy_tables(conn: sqlite3.Connection):
+    """早期 init_database 建的两张表; 旧库里已经有了, 新库从这里开始"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            platform VARCHAR(50),
+            post_id VARCHAR(100),
+            content TEXT,
+            author VARCHAR(100),
+            publish_time DATETIME,
+            likes INTEGER DEFAULT 0,
+            comments_count INTEGER DEFAULT 0,
+            shares INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER,
+            sentiment_score FLOAT,
+            sentiment_label VARCHAR(20),
+            confidence FLOAT
+        )
+    """)
+
+
+POSTS_SQL = """
+    CREATE TABLE posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        platform VARCHAR(50) NOT NULL,
+        post_id VARCHAR(100) NOT NULL,
+        content TEXT NOT NULL,
+        author VARCHAR(100),
+        author_followers INTEGER DEFAULT 0,
+        publish_time DATETIME NOT NULL,
+        likes INTEGER DEFAULT 0,
+        comments_count INTEGER DEFAULT 0,
+        shares INTEGER DEFAULT 0,
+        url TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (platform, post_id)
+    )
+"""
+
+SENTIMENT_SQL = """
+    CREATE TABLE sentiment (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER NOT NULL UNIQUE,
+        sentiment_score FLOAT,
+        sentiment_label VARCHAR(20),
+        confidence FLOAT,
+        keywords TEXT,
+        analyzed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (post_id) REFERENCES posts(id)
+    )
+"""
+
+
+def _v2_posts_full_schema(conn: sqlite3.Connection):
+    """帖子表改为完整结构, 按 (platform, post_id) 去重 (保留最早的一条, 其 id 不变)"""
+    _rebuild(
+        conn, "posts", POSTS_SQL,
+        select_where=(
+            "WHERE id IN (SELECT MIN(id) FROM posts GROUP BY COALESCE(platform, ''), COALESCE(post_id, 'legacy-' || id))"
+        ),
+        defaults={
+            "platform": "''",
+            "post_id": "'legacy-' || id",
+            "content": "''",
+            "publish_time": "CURRENT_TIMESTAMP",
+        }
+    )
+
+
+def _v3_sentiment_full_schema(conn: sqlite3.Connection):
+    """情感表改为完整结构: 每个帖子保留最新的一条分析, 删掉指向不存在帖子的记录"""
+    _rebuild(
+        conn, "sentiment", SENTIMENT_SQL,
+        select_where=(
+            "WHERE id IN (SELECT MAX(id) FROM sentiment GROUP BY post_id) "
+            "AND post_id IN (SELECT id FROM posts)"
+        )
+    )
+
+
+def _v4_comments_and_topics(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            comment_id VARCHAR(100),
+            content TEXT NOT NULL,
+            author VARCHAR(100),
+            publish_time DATETIME,
+            likes INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (post_id) REFERENCES posts(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS topics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_name VARCHAR(200) NOT NULL,
+            platform VARCHAR(50),
+            hot_score INTEGER DEFAULT 0,
+            post_count INTEGER DEFAULT 0,
+            first_seen DATETIME,
+            last_updated DATETIME,
+            status VARCHAR(20) DEFAULT 'active',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS topic_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL,
+            post_id INTEGER NOT NULL,
+            relevance_score FLOAT DEFAULT 1.0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (topic_id) REFERENCES topics(id),
+            FOREIGN KEY (post_id) REFERENCES posts(id),
+            UNIQUE (topic_id, post_id)
+        )
+    """)
+
+
+TEST_POSTS = [
+    ('微博', 'wb001', 'AI Agent技术真的太强大了!未来可期!', '科技博主A', '2024-01-15 10:00:00', 1520, 86, 234),
+    ('微博', 'wb002', '担心AI会取代人类工作,失业率会上升', '用户B', '2024-01-15 11:30:00', 892, 156, 67),
+    ('抖音', 'dy001', 'ChatGPT帮我写代码,效率提升10倍!', '程序员C', '2024-01-15 14:20:00', 3420, 287, 456),
+    ('小红书', 'xhs001', 'AI绘画太美了,但担心画师失业', '艺术爱好者D', '2024-01-15 16:45:00', 2150, 198, 123),
+    ('微博', 'wb003', 'DeepSeek真的很强,国产AI崛起!', '数码评测E', '2024-01-16 09:15:00', 4230, 412, 678),
+]
+
+# (platform, post_id) → 情感分析; 按平台原始 ID 关联, 不依赖自增 id
+TEST_SENTIMENT = [
+    ('微博', 'wb001', 0.85, 'positive', 0.92),
+    ('微博', 'wb002', -0.45, 'negative', 0.78),
+    ('抖音', 'dy001', 0.92, 'positive', 0.95),
+    ('小红书', 'xhs001', -0.32, 'negative', 0.68),
+    ('微博', 'wb003', 0.88, 'positive', 0.91),
+]
+
+
+def _v5_seed_test_data(conn: sqlite3.Connection):
+    """测试数据; 旧库里已有的行由唯一约束跳过"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO posts (platform, post_id, content, author, publish_time, likes, comments_count, shares) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        TEST_POSTS
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO sentiment (post_id, sentiment_score, sentiment_label, confidence) "
+        "SELECT id, ?, ?, ? FROM posts WHERE platform = ? AND post_id = ?",
+        [(score, label, confidence, platform, post_id) for platform, post_id, score, label, confidence in TEST_SENTIMENT]
+    )
+
+
+def _v6_comment_dedupe_and_ingest_state(conn: sqlite3.Connection):
+    """
+    评论按 (post_id, comment_id) 唯一 (批量导入靠它去重, 先删掉重复的, 保留最早的一条);
+    ingest_dropped_indexes: 批量导入时暂时删掉的索引定义, 导入中途崩溃时下次启动据此补建
+    """
+    conn.execute("""
+        DELETE FROM comments WHERE comment_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM comments WHERE comment_id IS NOT NULL GROUP BY post_id, comment_id
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_comments_post_comment ON comments (post_id, comment_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_dropped_indexes (
+            name TEXT PRIMARY KEY,
+            sql TEXT NOT NULL,
+            dropped_at REAL NOT NULL
+        )
+    """)
+
+
+# 二级索引 (和 database_schema.sql 一致); 覆盖索引让常见的聚合只读索引、不回表:
+#   平台计数 / 平台内按点赞排序 → posts(platform, likes); 标签计数 / 平均分 → sentiment(sentiment_label, sentiment_score)
+#   按点赞取前 N → posts(likes) (按索引顺序读, 读够 N 行就停, 不用排序)
+#   帖子下的热门评论 → comments(post_id, likes)
+# 帖子 JOIN 情感按 sentiment.post_id 的唯一索引查找
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_posts_platform_likes ON posts (platform, likes)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_platform_time ON posts (platform, publish_time)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_publish_time ON posts (publish_time)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_likes ON posts (likes)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_author ON posts (author)",
+    "CREATE INDEX IF NOT EXISTS idx_sentiment_label_score ON sentiment (sentiment_label, sentiment_score)",
+    "CREATE INDEX IF NOT EXISTS idx_comments_post_likes ON comments (post_id, likes)",
+    "CREATE INDEX IF NOT EXISTS idx_topics_name ON topics (topic_name)",
+    "CREATE INDEX IF NOT EXISTS idx_topics_hot_score ON topics (hot_score)",
+    "CREATE INDEX IF NOT EXISTS idx_topic_posts_post ON topic_posts (post_id)",
+]
+
+
+def _v7_secondary_indexes(conn: sqlite3.Connection):
+    """二级索引和覆盖索引 (database_schema.sql 里原来的 MySQL 内联 INDEX 写法 SQLite 不认, 库里一直没有)"""
+    for sql in INDEXES:
+        conn.execute(sql)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "早期的 posts / sentiment 表", _v1_legacy_tables),
+    Migration(2, "posts 完整结构, (platform, post_id) 唯一", _v2_posts_full_schema),
+    Migration(3, "sentiment 完整结构, 每个帖子一条", _v3_sentiment_full_schema),
+    Migration(4, "comments / topics / topic_posts 表", _v4_comments_and_topics),
+    Migration(5, "写入测试数据", _v5_seed_test_data),
+    Migration(6, "comments (post_id, comment_id) 唯一; 批量导入的索引暂存表", _v6_comment_dedupe_and_ingest_state),
+    Migration(7, "二级索引和覆盖索引", _v7_secondary_indexes),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# ========== 执行 ==========
+
+def _read_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:  # 还没有 schema_version 表
+        return 0
+    return row[0] or 0
+
+
+def current_version(db: ConnectionManager) -> int:
+    """数据库当前的版本号 (只读连接上查一次)"""
+    return _read_version(db.reader())
+
+
+def migrate(db: ConnectionManager, target: int = LATEST_VERSION) -> Tuple[int, int]:
+    """
+    把数据库迁移到 target 版本, 返回 (迁移前版本, 迁移后版本)
+    已是最新时只有一次只读查询, 不拿写锁
+    """
+    before = current_version(db)
+    if before >= target:
+        return before, before
+
+    version = before
+    for migration in MIGRATIONS:
+        if migration.version > target:
+            break
+        with db.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at REAL NOT NULL
+                )
+            """)
+            # 拿到写锁后再查一次: 别的进程可能已经执行过这个迁移
+            if _read_version(conn) >= migration.version:
+                continue
+            migration.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.description, time.time())
+            )
+            version = migration.version
+    return before, max(version, current_version(db))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移 sentiment.db 到最新版本")
+    parser.add_argument("db_path", nargs="?", default="week1/day5/sentiment.db")
+    parser.add_argument("--status", action="store_true", help="只打印版本, 不迁移")
+    args = parser.parse_args()
+
+    db = get_connection_manager(args.db_path)
+    if args.status:
+        print(f"📦 {db.db_path}: v{current_version(db)} (最新 v{LATEST_VERSION})")
+        return
+    before, after = migrate(db)
+    if before == after:
+        print(f"✅ {db.db_path}: 已是最新 (v{after})")
+    else:
+        print(f"✅ {db.db_path}: v{before} → v{after}")
+        for migration in MIGRATIONS:
+            if before < migration.version <= after:
+                print(f"   v{migration.version}: {migration.description}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+查询计划审计 - 对一批 SQL 跑 EXPLAIN QUERY PLAN, 找出全表扫描
+学习目标:
+1. 读懂 EXPLAIN QUERY PLAN: SEARCH 是按索引定位, SCAN 是逐行读整张表 / 整个索引,
+   USING COVERING INDEX 表示只读索引不回表, USE TEMP B-TREE 表示额外排序, AUTOMATIC INDEX 表示缺索引 (SQLite 临时建了一个)
+2. SQL 来源: 内置的常见查询形状 (平台计数、标签计数、按点赞取前 N ...)、SQL 缓存里执行成功过的 LLM 生成 SQL、.sql 文件
+3. 只做 EXPLAIN, 不执行查询, 在只读连接上跑, 不迁移, 对线上库也是安全的
+4. 有全表扫描时退出码为 1 (--strict 时排序 / 临时索引也算), 可以放进 CI
+
+判定:
+    full_scan     SCAN <表> (没有用任何索引)                         ❌
+    auto_index    SQLite 为这次查询临时建索引 (说明缺索引)              ⚠️
+    temp_btree    结果需要额外排序 / 分组 (USE TEMP B-TREE)             ⚠️
+    index_scan    按索引顺序读整个索引并回表 (没有 LIMIT, 等于全表扫描再多一次回表) ⚠️
+    ordered_scan  按索引顺序读, 带 LIMIT, 读够 N 行就停 (按点赞取前 N)      ✅
+    covering_scan 只读覆盖索引 (整表聚合的最优形态)                      ✅
+    search        按索引 / 主键定位                                       ✅
+
+用法:
+    python week1/day5/query_plan_audit.py                            # 内置查询 + SQL 缓存, 默认数据库
+    python week1/day5/query_plan_audit.py generated.sql --no-builtin --no-cache
+    python week1/day5/query_plan_audit.py --db path/to/other.db --verbose --strict
+    python week1/day5/query_plan_audit.py --json > plan_audit.json
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from db_connections import get_connection_manager
+from migrations import LATEST_VERSION, current_version
+from sql_cache import DEFAULT_SQL_CACHE_PATH
+
+# LLM 针对 posts / sentiment 最常生成的查询形状
+BUILTIN_QUERIES = [
+    ("平台帖子数", "SELECT platform, COUNT(*) AS cnt FROM posts GROUP BY platform ORDER BY cnt DESC"),
+    ("平台总点赞", "SELECT platform, SUM(likes) FROM posts GROUP BY platform"),
+    ("情感标签计数", "SELECT sentiment_label, COUNT(*) FROM sentiment GROUP BY sentiment_label"),
+    ("标签平均分", "SELECT sentiment_label, AVG(sentiment_score) FROM sentiment GROUP BY sentiment_label"),
+    ("点赞前 10", "SELECT content, author, likes FROM posts ORDER BY likes DESC LIMIT 10"),
+    ("平台内点赞前 10", "SELECT content, likes FROM posts WHERE platform = '微博' ORDER BY likes DESC LIMIT 10"),
+    ("负面帖子", "SELECT p.content, s.sentiment_score FROM posts p JOIN sentiment s ON p.id = s.post_id "
+                 "WHERE s.sentiment_label = 'negative' LIMIT 10"),
+    ("最负面的帖子", "SELECT p.content, s.sentiment_score FROM sentiment s JOIN posts p ON p.id = s.post_id "
+                     "WHERE s.sentiment_label = 'negative' ORDER BY s.sentiment_score LIMIT 10"),
+    ("各平台平均情感", "SELECT p.platform, AVG(s.sentiment_score) FROM posts p JOIN sentiment s ON p.id = s.post_id "
+                       "GROUP BY p.platform"),
+    ("时间范围", "SELECT COUNT(*) FROM posts WHERE publish_time >= '2024-01-15' AND publish_time < '2024-01-16'"),
+    ("平台时间范围", "SELECT content FROM posts WHERE platform = '微博' AND publish_time >= '2024-01-15' "
+                     "ORDER BY publish_time DESC LIMIT 10"),
+    ("每日帖子数", "SELECT DATE(publish_time) AS day, COUNT(*) FROM posts GROUP BY day ORDER BY day"),
+    ("作者帖子", "SELECT content, likes FROM posts WHERE author = '科技博主A'"),
+    ("帖子的评论", "SELECT content, likes FROM comments WHERE post_id = 1 ORDER BY likes DESC LIMIT 10"),
+]
+
+# SQLite 3.36 之前的输出是 "SCAN TABLE posts" / "SEARCH TABLE posts"
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS \S+)?(.*)$")
+_SEARCH = re.compile(r"^SEARCH (?:TABLE )?(\S+)")
+_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+_LEADING_COMMENTS = re.compile(r"^(\s*--[^\n]*\n)+")
+_QUERY = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+# 严重程度: 越大越糟
+SEVERITY = {
+    "search": 0, "covering_scan": 0, "ordered_scan": 0,
+    "index_scan": 1, "temp_btree": 1, "auto_index": 1,
+    "full_scan": 2,
+}
+ICONS = {0: "✅", 1: "⚠️ ", 2: "❌"}
+
+
+class Finding(NamedTuple):
+    kind: str
+    table: Optional[str]
+    detail: str
+
+
+class Audit(NamedTuple):
+    source: str
+    sql: str
+    plan: List[str]          # 缩进后的计划行
+    findings: List[Finding]
+    error: Optional[str]
+
+    @property
+    def severity(self) -> int:
+        if self.error:
+            return 2
+        return max((SEVERITY[f.kind] for f in self.findings), default=0)
+
+
+# ========== 收集 SQL ==========
+
+def split_statements(text: str) -> Iterator[str]:
+    """按分号拆分 SQL 文件 (字符串里的分号不拆), 去掉语句前的注释行和只有注释的片段"""
+    buffer = ""
+    for line in text.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statement = _LEADING_COMMENTS.sub("", buffer.strip() + "\n").strip().rstrip(";").strip()
+            buffer = ""
+            if statement:
+                yield statement
+    statement = _LEADING_COMMENTS.sub("", buffer.strip() + "\n").strip()
+    if statement:
+        yield statement
+
+
+def is_query(sql: str) -> bool:
+    """只审计查询语句 (SELECT / WITH); LLM 偶尔生成的写语句本来就会被 Agent 拦下"""
+    return bool(_QUERY.match(sql))
+
+
+def cached_queries(path: str = DEFAULT_SQL_CACHE_PATH) -> List[Tuple[str, str]]:
+    """SQL 缓存里执行成功过的 LLM 生成 SQL (按成功次数降序); 缓存文件不存在时为空"""
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT question, sql FROM sql_cache GROUP BY sql ORDER BY MAX(success_count) DESC"
+        ).fetchall()
+    except sqlite3.OperationalError:  # 还没建表
+        rows = []
+    finally:
+        conn.close()
+    return [(f"缓存: {question}", sql) for question, sql in rows]
+
+
+def file_queries(path: str) -> List[Tuple[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        statements = list(split_statements(f.read()))
+    return [(f"{os.path.basename(path)}#{i}", sql) for i, sql in enumerate(statements, start=1)]
+
+
+# ========== 审计 ==========
+
+def classify(detail: str, sql: str, tables: set) -> Optional[Finding]:
+    """一行计划 → 发现; 子查询 / CTE 上的扫描不算 (它们不是表)"""
+    if "AUTOMATIC" in detail:
+        match = _SEARCH.match(detail) or _SCAN.match(detail)
+        return Finding("auto_index", match.group(1) if match else None, detail)
+    match = _SEARCH.match(detail)
+    if match:
+        return Finding("search", match.group(1), detail)
+    if detail.startswith("USE TEMP B-TREE"):
+        return Finding("temp_btree", None, detail)
+    match = _SCAN.match(detail)
+    if not match:
+        return None
+    table, rest = match.group(1), match.group(2)
+    if table.lower() not in tables:
+        return None
+    if "COVERING INDEX" in rest:
+        return Finding("covering_scan", table, detail)
+    if "USING INDEX" in rest:
+        # 按索引顺序读: 带 LIMIT 时读够就停 (按点赞取前 N), 否则等于全表扫描再多一次回表
+        return Finding("ordered_scan" if _LIMIT.search(sql) else "index_scan", table, detail)
+    return Finding("full_scan", table, detail)
+
+
+def explain(conn: sqlite3.Connection, source: str, sql: str, tables: set) -> Audit:
+    """对一条 SQL 跑 EXPLAIN QUERY PLAN; 语法错误、表 / 列不存在记为 error"""
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except sqlite3.Error as e:
+        return Audit(source, sql, [], [], str(e))
+
+    depth: Dict[int, int] = {0: -1}
+    plan, findings = [], []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+        finding = classify(detail, sql, tables)
+        if finding is not None:
+            findings.append(finding)
+    return Audit(source, sql, plan, findings, None)
+
+
+def audit(db_path: str, queries: List[Tuple[str, str]]) -> List[Audit]:
+    db = get_connection_manager(db_path)
+    version = current_version(db)
+    if version < LATEST_VERSION:
+        print(f"⚠️  {db.db_path} 是 v{version} (最新 v{LATEST_VERSION}), 索引可能不全, "
+              f"先运行 python week1/day5/migrations.py", file=sys.stderr)
+    conn = db.reader()
+    tables = {name.lower() for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [explain(conn, source, sql, tables) for source, sql in queries]
+
+
+def problems(results: List[Audit], strict: bool = False) -> List[Audit]:
+    threshold = 1 if strict else 2
+    return [result for result in results if result.severity >= threshold]
+
+
+def print_report(results: List[Audit], verbose: bool = False):
+    kinds = Counter()
+    for result in results:
+        kinds.update({f.kind for f in result.findings})
+        icon = ICONS[result.severity]
+        print(f"{icon} {result.source}")
+        if result.severity or verbose:
+            print(f"     {' '.join(result.sql.split())}")
+            if result.error:
+                print(f"     错误: {result.error}")
+            for line in result.plan:
+                print(f"     │ {line}")
+
+    print(f"\n📊 {len(results)} 条 SQL | "
+          f"全表扫描 {sum(1 for r in results if any(f.kind == 'full_scan' for f in r.findings))} | "
+          f"临时排序 {kinds['temp_btree']} | 临时索引 {kinds['auto_index']} | "
+          f"整索引扫描 {kinds['index_scan']} | 错误 {sum(1 for r in results if r.error)}")
+    scanned = Counter(f.table for r in results for f in r.findings if f.kind == "full_scan")
+    if scanned:
+        print(f"   全表扫描的表: {', '.join(f'{table} ×{count}' for table, count in scanned.most_common())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对一批 SQL 跑 EXPLAIN QUERY PLAN, 找出全表扫描")
+    parser.add_argument("files", nargs="*", help=".sql 文件 (分号分隔的多条 SQL)")
+    parser.add_argument("--db", default="week1/day5/sentiment.db", help="数据库文件")
+    parser.add_argument("--no-builtin", action="store_true", help="不审计内置的常见查询")
+    parser.add_argument("--no-cache", action="store_true", help="不审计 SQL 缓存里的 SQL")
+    parser.add_argument("--cache-path", default=DEFAULT_SQL_CACHE_PATH, help="SQL 缓存文件")
+    parser.add_argument("--strict", action="store_true", help="临时排序 / 临时索引 / 整索引扫描也算问题")
+    parser.add_argument("--verbose", "-v", action="store_true", help="打印所有查询的计划")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    queries = [] if args.no_builtin else list(BUILTIN_QUERIES)
+    if not args.no_cache:
+        queries += cached_queries(args.cache_path)
+    for path in args.files:
+        queries += file_queries(path)
+    if not os.path.exists(args.db):
+        parser.error(f"数据库不存在: {args.db}")
+    skipped = sum(1 for _, sql in queries if not is_query(sql))
+    queries = [(source, sql) for source, sql in queries if is_query(sql)]
+    if not queries:
+        parser.error("没有要审计的 SQL")
+
+    results = audit(args.db, queries)
+    failed = problems(results, args.strict)
+    if args.json:
+        print(json.dumps([
+            {
+                "source": r.source, "sql": r.sql, "plan": r.plan, "error": r.error,
+                "findings": [f._asdict() for f in r.findings], "severity": r.severity,
+            }
+            for r in results
+        ], ensure_ascii=False, indent=2))
+    else:
+        print_report(results, args.verbose)
+        if skipped:
+            print(f"   跳过 {skipped} 条非查询语句")
+        if failed:
+            print(f"\n❌ {len(failed)} 条 SQL 有问题" + (" (--strict)" if args.strict else ""))
+        else:
+            print("\n✅ 没有全表扫描")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
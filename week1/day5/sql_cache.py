@@ -0,0 +1,191 @@
+"""
+NL-to-SQL 翻译缓存 - 问题 → SQL, SQLite 持久化
+学习目标:
+1. 问题规范化: 全角转半角、小写、去掉空白和标点, "哪个平台的帖子最多?" 和 "哪个平台的帖子最多 ？" 是同一个 key
+2. 库结构指纹: 对 sqlite_master 里的建表 / 建视图语句取哈希, 表结构一变, 旧的 SQL 自动失效;
+   索引不影响 SQL 写法也不影响结果, 不计入 (批量导入删建索引、迁移加索引都不会让缓存失效)
+3. 只缓存执行成功过的 SQL, 记录成功次数; 命中的 SQL 执行失败时立即删除, 不会被反复重放
+
+和 LLM 响应缓存的区别: 响应缓存按完整请求 (含温度) 精确匹配, 这里按 "同一个问题" 匹配,
+并且 SQL 的正确性由执行结果验证
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, Optional
+
+DEFAULT_SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", "week1/day5/sql_cache.db")
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE", "on").lower() not in ("off", "0", "false")
+
+# 数字里的小数点、百分号会改变问题含义, 规范化时保留
+_DECIMAL_POINT = re.compile(r"(?<=\d)\.(?=\d)")
+_KEEP_PUNCT = {"%"}
+# 迁移 / 批量导入的记账表, 生成的 SQL 不会查它们
+BOOKKEEPING_TABLES = ("schema_version", "ingest_dropped_indexes")
+
+
+def normalize_question(question: str) -> str:
+    """全角转半角、小写, 去掉空白和标点 (保留数字中的小数点和百分号)"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = _DECIMAL_POINT.sub("\0", text)
+    text = "".join(
+        c for c in text
+        if not c.isspace() and (c in _KEEP_PUNCT or not unicodedata.category(c).startswith("P"))
+    )
+    return text.replace("\0", ".")
+
+
+def schema_fingerprint(conn: sqlite3.Connection) -> str:
+    """库结构指纹: 所有表、视图的定义语句 (不含索引、SQLite 内部表和记账表) 的哈希"""
+    rows = conn.execute(
+        "SELECT type, name, COALESCE(sql, '') FROM sqlite_master "
+        "WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' "
+        f"AND name NOT IN ({', '.join('?' * len(BOOKKEEPING_TABLES))}) ORDER BY type, name",
+        BOOKKEEPING_TABLES
+    ).fetchall()
+    payload = "\n".join("|".join(row) for row in rows)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SQLCache:
+    """
+    问题 → SQL 缓存
+
+    - namespace: 区分生成 SQL 的提示词 (不同 Agent 的表说明和要求不同, 生成的 SQL 不通用)
+    - 条目带生成时的库结构指纹, 查询时指纹不同即视为失效并删除
+    """
+
+    def __init__(self, path: str = DEFAULT_SQL_CACHE_PATH, enabled: bool = SQL_CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0  # 库结构变化导致失效
+        self.evicted = 0      # 执行失败被删除
+
+        self._lock = threading.Lock()
+        self.conn = None
+        if not enabled:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                schema_fingerprint TEXT NOT NULL,
+                success_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_success REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(question: str, namespace: str = "") -> str:
+        payload = f"{namespace}\n{normalize_question(question)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_namespace(prompt: str) -> str:
+        """生成 SQL 用的系统提示 → namespace"""
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, question: str, fingerprint: str, namespace: str = "") -> Optional[str]:
+        """查询缓存, 未命中或库结构已变化返回 None"""
+        if not self.enabled:
+            return None
+        key = self.make_key(question, namespace)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sql, schema_fingerprint FROM sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            sql, cached_fingerprint = row
+            if cached_fingerprint != fingerprint:
+                self.conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                self.invalidated += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return sql
+
+    def record(self, question: str, sql: str, fingerprint: str, success: bool, namespace: str = ""):
+        """
+        记录一次执行结果
+        成功: 写入 (或累加成功次数); 失败: 删除这个问题的缓存, 下次重新生成
+        """
+        if not self.enabled:
+            return
+        key = self.make_key(question, namespace)
+        now = time.time()
+        with self._lock:
+            if not success:
+                cursor = self.conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                self.evicted += cursor.rowcount
+                self.conn.commit()
+                return
+            self.conn.execute(
+                "INSERT INTO sql_cache (key, namespace, question, sql, schema_fingerprint, success_count, created_at, last_success) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "  success_count = CASE WHEN sql = excluded.sql AND schema_fingerprint = excluded.schema_fingerprint "
+                "                       THEN success_count + 1 ELSE 1 END, "
+                "  sql = excluded.sql, schema_fingerprint = excluded.schema_fingerprint, "
+                "  last_success = excluded.last_success",
+                (key, namespace, question, sql, fingerprint, now, now)
+            )
+            self.conn.commit()
+
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        total = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidated": self.invalidated,
+            "evicted": self.evicted,
+            "entries": 0,
+        }
+        if self.enabled:
+            with self._lock:
+                stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        return stats
+
+    def print_summary(self):
+        stats = self.get_stats()
+        print(f"🗃️  SQL 缓存: 命中 {stats['hits']}/{stats['hits'] + stats['misses']} ({stats['hit_rate']:.1%}) | "
+              f"条目: {stats['entries']} | 结构变化失效: {stats['invalidated']} | 执行失败删除: {stats['evicted']}")
+
+    def close(self):
+        if self.conn is not None:
+            with self._lock:
+                self.conn.close()
+
+
+_SHARED: Optional[SQLCache] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_sql_cache() -> SQLCache:
+    """全进程共享的 SQL 缓存, 第一次用到时打开"""
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = SQLCache()
+        return _SHARED
@@ -0,0 +1,113 @@
+"""
+sentiment.db 迁移: 新库 / 旧库都能迁到最新, 重复执行不做任何事, 测试数据只写一次
+
+运行: python -m pytest week1/day5/test_migrations.py -q
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from db_connections import ConnectionManager
+from migrations import INDEXES, LATEST_VERSION, MIGRATIONS, TEST_POSTS, current_version, migrate
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ConnectionManager(str(tmp_path / "sentiment.db"))
+    yield db
+    db.close()
+
+
+def count(db: ConnectionManager, table: str) -> int:
+    return db.reader().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def make_legacy(path: str, startups: int = 3):
+    """模拟早期 init_database: 没有版本表和唯一约束, 每次启动都再插一遍测试数据"""
+    conn = sqlite3.connect(path)
+    MIGRATIONS[0].apply(conn)
+    for _ in range(startups):
+        for post in TEST_POSTS:
+            cursor = conn.execute(
+                "INSERT INTO posts (platform, post_id, content, author, publish_time, likes, comments_count, shares) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", post
+            )
+            conn.execute(
+                "INSERT INTO sentiment (post_id, sentiment_score, sentiment_label, confidence) VALUES (?, 0.1, 'neutral', 0.5)",
+                (cursor.lastrowid,)
+            )
+    conn.execute("INSERT INTO sentiment (post_id, sentiment_score) VALUES (9999, 0.0)")  # 指向不存在的帖子
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_reaches_latest(db):
+    assert migrate(db) == (0, LATEST_VERSION)
+    assert current_version(db) == LATEST_VERSION
+    assert count(db, "posts") == len(TEST_POSTS)
+    assert count(db, "sentiment") == len(TEST_POSTS)
+    indexes = {row[0] for row in db.reader().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {sql.split()[5] for sql in INDEXES} <= indexes
+
+
+def test_rerun_is_a_noop(db):
+    migrate(db)
+    writes = db.writes
+    assert migrate(db) == (LATEST_VERSION, LATEST_VERSION)
+    assert db.writes == writes  # 已是最新时不拿写锁
+    assert count(db, "schema_version") == LATEST_VERSION
+    assert count(db, "posts") == len(TEST_POSTS)
+
+
+def test_stepwise_migration_matches_one_shot(db, tmp_path):
+    for target in range(1, LATEST_VERSION + 1):
+        assert migrate(db, target)[1] == target
+    other = ConnectionManager(str(tmp_path / "one_shot.db"))
+    try:
+        migrate(other)
+        schema = "SELECT type, name, sql FROM sqlite_master ORDER BY type, name"
+        assert db.reader().execute(schema).fetchall() == other.reader().execute(schema).fetchall()
+    finally:
+        other.close()
+
+
+def test_legacy_database_is_deduplicated(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    make_legacy(path)
+    db = ConnectionManager(path)
+    try:
+        assert migrate(db) == (0, LATEST_VERSION)
+        rows = db.reader().execute("SELECT platform, post_id FROM posts ORDER BY id").fetchall()
+        assert rows == [(p[0], p[1]) for p in TEST_POSTS]
+        assert count(db, "sentiment") == len(TEST_POSTS)
+        orphans = db.reader().execute(
+            "SELECT COUNT(*) FROM sentiment WHERE post_id NOT IN (SELECT id FROM posts)"
+        ).fetchone()[0]
+        assert orphans == 0
+        with pytest.raises(sqlite3.IntegrityError):
+            with db.writer() as conn:
+                conn.execute("INSERT INTO posts (platform, post_id, content, publish_time) "
+                             "VALUES ('微博', 'wb001', 'x', '2024-01-01')")
+    finally:
+        db.close()
+
+
+def test_concurrent_startups_apply_each_migration_once(tmp_path):
+    path = str(tmp_path / "shared.db")
+    managers = [ConnectionManager(path) for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda m=m: results.append(migrate(m))) for m in managers]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert all(after == LATEST_VERSION for _, after in results)
+        versions = [row[0] for row in managers[0].reader().execute("SELECT version FROM schema_version ORDER BY version")]
+        assert versions == list(range(1, LATEST_VERSION + 1))
+        assert count(managers[0], "posts") == len(TEST_POSTS)
+    finally:
+        for m in managers:
+            m.close()
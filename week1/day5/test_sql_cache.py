@@ -0,0 +1,87 @@
+"""
+SQL 缓存: 问题规范化、库结构指纹只看表和视图、执行失败即删除
+
+运行: python -m pytest week1/day5/test_sql_cache.py -q
+"""
+
+import sqlite3
+
+import pytest
+
+from db_connections import ConnectionManager
+from migrations import migrate
+from sql_cache import SQLCache, normalize_question, schema_fingerprint
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE posts (id INTEGER PRIMARY KEY, platform TEXT, likes INTEGER)")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SQLCache(path=str(tmp_path / "sql_cache.db"), enabled=True)
+    yield cache
+    cache.close()
+
+
+def test_normalize_question_ignores_width_case_and_punctuation():
+    assert normalize_question("哪个平台的帖子最多?") == normalize_question("哪个平台的帖子最多 ？")
+    assert normalize_question("Top 10 帖子") == normalize_question("top10帖子")
+
+
+def test_normalize_question_keeps_decimals_and_percent():
+    assert normalize_question("得分高于0.5的帖子") != normalize_question("得分高于05的帖子")
+    assert normalize_question("占比超过50%") != normalize_question("占比超过50")
+
+
+def test_fingerprint_ignores_indexes(conn):
+    before = schema_fingerprint(conn)
+    conn.execute("CREATE INDEX idx_posts_likes ON posts (likes)")
+    assert schema_fingerprint(conn) == before
+    conn.execute("DROP INDEX idx_posts_likes")
+    assert schema_fingerprint(conn) == before
+
+
+def test_fingerprint_changes_with_tables_and_views(conn):
+    before = schema_fingerprint(conn)
+    conn.execute("ALTER TABLE posts ADD COLUMN shares INTEGER")
+    after_column = schema_fingerprint(conn)
+    assert after_column != before
+    conn.execute("CREATE VIEW hot AS SELECT * FROM posts WHERE likes > 100")
+    assert schema_fingerprint(conn) != after_column
+
+
+def test_index_only_migrations_keep_fingerprint(tmp_path):
+    db = ConnectionManager(str(tmp_path / "sentiment.db"))
+    try:
+        migrate(db, target=5)
+        before = schema_fingerprint(db.reader())
+        migrate(db)  # v6 / v7: 唯一索引、记账表、二级索引
+        assert schema_fingerprint(db.reader()) == before
+    finally:
+        db.close()
+
+
+def test_hit_then_invalidated_by_schema_change(cache):
+    cache.record("哪个平台最火?", "SELECT platform FROM posts", "fp1", success=True)
+    assert cache.get("哪个平台最火", "fp1") == "SELECT platform FROM posts"
+    assert cache.get("哪个平台最火", "fp2") is None
+    assert cache.invalidated == 1
+    assert cache.get("哪个平台最火", "fp1") is None  # 失效的条目已删除
+
+
+def test_failed_execution_evicts(cache):
+    cache.record("平均点赞", "SELECT AVG(likes) FROM posts", "fp1", success=True)
+    cache.record("平均点赞", "SELECT AVG(likes) FROM posts", "fp1", success=False)
+    assert cache.evicted == 1
+    assert cache.get("平均点赞", "fp1") is None
+
+
+def test_namespaces_are_separate(cache):
+    cache.record("平均点赞", "SELECT 1", "fp1", success=True, namespace="a")
+    assert cache.get("平均点赞", "fp1", namespace="b") is None
+    assert cache.get("平均点赞", "fp1", namespace="a") == "SELECT 1"
@@ -7,13 +7,17 @@ Text-to-SQL Agent - 自然语言转SQL查询
 """
 
 import os
-import sqlite3
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 import json
 import re
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../day4'))
+from client_registry import get_client
+from llm_calls import chat_completion
+from governor import GOVERNOR, sqlite_pool
+from sql_cache import SQLCache, get_sql_cache, schema_fingerprint
+from db_connections import get_connection_manager
+from migrations import migrate
 
 class TextToSQLAgent:
     """Text-to-SQL Agent - Insight Engine 核心"""
@@ -21,13 +25,12 @@ class TextToSQLAgent:
     def __init__(self, db_path="week1/day5/sentiment.db"):
         # 初始化数据库
         self.db_path = db_path
+        self.db_pool = sqlite_pool(db_path)  # 全局调度器的资源池, 同一数据库文件的 Agent 共享
+        self.db = get_connection_manager(db_path)  # 每线程复用的只读连接 + 唯一的写连接 (WAL)
         self.init_database()
         
         # 初始化 LLM
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.client = get_client()  # 全进程共享客户端
         
         # 数据库结构说明
         self.schema_description = """
@@ -64,91 +67,46 @@ class TextToSQLAgent:
    - hot_score: 热度分数
    - post_count: 帖子数
 """
-    
-    def init_database(self):
-        """初始化数据库和测试数据"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 创建表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                platform VARCHAR(50),
-                post_id VARCHAR(100),
-                content TEXT,
-                author VARCHAR(100),
-                publish_time DATETIME,
-                likes INTEGER DEFAULT 0,
-                comments_count INTEGER DEFAULT 0,
-                shares INTEGER DEFAULT 0
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sentiment (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id INTEGER,
-                sentiment_score FLOAT,
-                sentiment_label VARCHAR(20),
-                confidence FLOAT
-            )
-        """)
-        
-        # 插入测试数据
-        test_posts = [
-            ('微博', 'wb001', 'AI Agent技术真的太强大了!未来可期!', '科技博主A', '2024-01-15 10:00:00', 1520, 86, 234),
-            ('微博', 'wb002', '担心AI会取代人类工作,失业率会上升', '用户B', '2024-01-15 11:30:00', 892, 156, 67),
-            ('抖音', 'dy001', 'ChatGPT帮我写代码,效率提升10倍!', '程序员C', '2024-01-15 14:20:00', 3420, 287, 456),
-            ('小红书', 'xhs001', 'AI绘画太美了,但担心画师失业', '艺术爱好者D', '2024-01-15 16:45:00', 2150, 198, 123),
-            ('微博', 'wb003', 'DeepSeek真的很强,国产AI崛起!', '数码评测E', '2024-01-16 09:15:00', 4230, 412, 678),
-        ]
-        
-        cursor.executemany(
-            "INSERT OR IGNORE INTO posts (platform, post_id, content, author, publish_time, likes, comments_count, shares) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            test_posts
-        )
         
-        # 插入情感数据
-        test_sentiment = [
-            (1, 0.85, 'positive', 0.92),
-            (2, -0.45, 'negative', 0.78),
-            (3, 0.92, 'positive', 0.95),
-            (4, -0.32, 'negative', 0.68),
-            (5, 0.88, 'positive', 0.91),
-        ]
-        
-        cursor.executemany(
-            "INSERT OR IGNORE INTO sentiment (post_id, sentiment_score, sentiment_label, confidence) VALUES (?, ?, ?, ?)",
-            test_sentiment
-        )
-        
-        conn.commit()
-        conn.close()
-        
-        print("✅ 数据库初始化完成\n")
-    
-    def generate_sql(self, question: str) -> str:
-        """将自然语言问题转换为SQL"""
-        
-        prompt = f"""你是一个SQL专家。根据用户问题生成SQL查询。
+        # 表结构和要求每次都一样, 放在 system 消息里 (可命中提供方的前缀缓存), 问题放在最后
+        self.sql_system_prompt = f"""你是一个SQL专家。根据用户问题生成SQL查询。
 
 {self.schema_description}
 
-用户问题: {question}
-
 要求:
 1. 只返回SQL语句,不要解释
 2. 使用 SQLite 语法
 3. 确保SQL安全,不要有注入风险
 4. 如果需要统计,使用聚合函数
-5. 限制结果数量 (LIMIT 10)
-
-SQL:"""
-
-        response = self.client.chat.completions.create(
+5. 限制结果数量 (LIMIT 10)"""
+        
+        # 问题 → SQL 缓存: 同一个问题 (忽略空白、标点、全半角) 直接复用执行成功过的 SQL
+        self.sql_cache = get_sql_cache()
+        self.sql_namespace = SQLCache.make_namespace(self.sql_system_prompt)
+    
+    def init_database(self):
+        """把数据库迁移到最新结构 (首次迁移时写入测试数据); 已是最新时只查一次版本号"""
+        with GOVERNOR.slot(self.db_pool):
+            before, after = migrate(self.db)
+        
+        if before == after:
+            print(f"✅ 数据库已是最新 (v{after})\n")
+        else:
+            print(f"✅ 数据库初始化完成 (v{before} → v{after})\n")
+    
+    def generate_sql(self, question: str) -> str:
+        """将自然语言问题转换为SQL (缓存里有当前库结构下执行成功过的 SQL 时直接返回)"""
+        cached = self.sql_cache.get(question, self.schema_fingerprint(), self.sql_namespace)
+        if cached is not None:
+            return cached
+        
+        response = chat_completion(self.client, agent="TextToSQLAgent",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="sql",
+            messages=[
+                {"role": "system", "content": self.sql_system_prompt},
+                {"role": "user", "content": f"用户问题: {question}\n\nSQL:"}
+            ],
             temperature=0.1  # 低温度,更确定
         )
         
@@ -159,6 +117,15 @@ SQL:"""
         
         return sql
     
+    def schema_fingerprint(self) -> str:
+        """当前库结构的指纹, 表结构变化后缓存的 SQL 自动失效"""
+        with GOVERNOR.slot(self.db_pool):
+            return schema_fingerprint(self.db.reader())
+    
+    def record_sql(self, question: str, sql: str, success: bool):
+        """记录 SQL 的执行结果: 成功的写入缓存, 失败的从缓存删除"""
+        self.sql_cache.record(question, sql, self.schema_fingerprint(), success, self.sql_namespace)
+    
     def validate_sql(self, sql: str) -> bool:
         """验证SQL安全性"""
         # 简单的安全检查
@@ -177,21 +144,13 @@ SQL:"""
         if not self.validate_sql(sql):
             return None
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            conn.close()
-            
-            return {"columns": columns, "data": results}
-        
-        except Exception as e:
-            conn.close()
-            print(f"❌ SQL执行错误: {str(e)}")
-            return None
+        with GOVERNOR.slot(self.db_pool):
+            try:
+                columns, results = self.db.query(sql)
+                return {"columns": columns, "data": results}
+            except Exception as e:
+                print(f"❌ SQL执行错误: {str(e)}")
+                return None
     
     def explain_results(self, question: str, results: dict) -> str:
         """用自然语言解释查询结果"""
@@ -210,13 +169,15 @@ SQL:"""
         prompt = f"""用户问题: {question}
 
 查询结果:
-{result_text}
-
-请用1-2句话总结这个查询结果,给出关键洞察。"""
+{result_text}"""
 
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent="TextToSQLAgent",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="analysis",
+            messages=[
+                {"role": "system", "content": "你是数据分析助手。请用1-2句话总结用户给出的查询结果,给出关键洞察。"},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.5
         )
         
@@ -237,6 +198,7 @@ SQL:"""
         # 2. 执行SQL
         print("⚙️  执行查询...")
         results = self.execute_sql(sql)
+        self.record_sql(question, sql, results is not None)
         
         if not results:
             print("❌ 查询失败")
@@ -275,4 +237,6 @@ if __name__ == "__main__":
     ]
     
     for q in questions:
-        agent.analyze(q)
\ No newline at end of file
+        agent.analyze(q)
+    
+    agent.sql_cache.print_summary()
\ No newline at end of file
@@ -4,16 +4,14 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client
+from llm_calls import chat_completion
 
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+client = lazy_client()  # 第一次调用时才创建
 
 # ========== 1. 定义工具函数 ==========
 def get_weather(city):
@@ -68,7 +66,7 @@ messages = [
 
 # ========== 4. 第一次调用 AI(带工具描述) ==========
 print("\n🤖 AI 思考中...")
-response = client.chat.completions.create(
+response = chat_completion(client,
     model="deepseek-chat",
     messages=messages,
     tools=tools,  # 🔥 告诉 AI 有哪些工具可用
@@ -104,7 +102,7 @@ if response_message.tool_calls:
     
     # ========== 8. 第二次调用 AI(带工具结果) ==========
     print("\n🤖 AI 整合信息中...")
-    final_response = client.chat.completions.create(
+    final_response = chat_completion(client,
         model="deepseek-chat",
         messages=messages
     )
@@ -4,16 +4,14 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client
+from llm_calls import chat_completion
 
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+client = lazy_client()  # 第一次调用时才创建
 
 # ========== 1. 定义多个工具函数 ==========
 
@@ -110,7 +108,7 @@ def run_conversation(user_input):
     messages = [{"role": "user", "content": user_input}]
     
     # 第一次调用 AI
-    response = client.chat.completions.create(
+    response = chat_completion(client,
         model="deepseek-chat",
         messages=messages,
         tools=tools,
@@ -148,7 +146,7 @@ def run_conversation(user_input):
             })
         
         # 第二次调用 AI
-        final_response = client.chat.completions.create(
+        final_response = chat_completion(client,
             model="deepseek-chat",
             messages=messages
         )
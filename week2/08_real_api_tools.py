@@ -4,27 +4,28 @@
 """
 
 import os
+import sys
 import json
-import requests
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client, load_env
+from llm_calls import chat_completion
+from semantic_cache import cached_search, SEARCH_CACHE
+from retry_policy import TOOL_RETRY
+from governor import GOVERNOR
 
-# 初始化客户端
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 1. 真实天气 API ==========
 def get_weather(city):
     """
     调用 OpenWeatherMap API 获取真实天气
     """
+    import requests
+    load_env()
     api_key = os.getenv("OPENWEATHER_API_KEY")
     
     # OpenWeatherMap API 需要城市的英文名
@@ -40,7 +41,16 @@ def get_weather(city):
     
     try:
         url = f"http://api.openweathermap.org/data/2.5/weather?q={english_city}&appid={api_key}&units=metric&lang=zh_cn"
-        response = requests.get(url, timeout=5)
+        
+        def fetch():
+            with GOVERNOR.slot("openweather"):
+                response = requests.get(url, timeout=5)
+            # 429 / 5xx 抛出交给重试策略退避重试; 其他状态码 (如城市不存在) 照常返回
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+            return response
+        
+        response = TOOL_RETRY.call(fetch)
         data = response.json()
         
         if response.status_code == 200:
@@ -65,7 +75,7 @@ def web_search(query):
     使用 Tavily 进行网络搜索
     """
     try:
-        response = tavily_client.search(
+        response = cached_search(tavily_client,
             query=query,
             max_results=3,  # 最多返回3个结果
             include_answer=True  # 包含 AI 总结的答案
@@ -169,7 +179,7 @@ def run_agent(user_input):
     
     messages = [{"role": "user", "content": user_input}]
     
-    response = openai_client.chat.completions.create(
+    response = chat_completion(openai_client,
         model="deepseek-chat",
         messages=messages,
         tools=tools,
@@ -199,7 +209,7 @@ def run_agent(user_input):
                 "content": function_result
             })
         
-        final_response = openai_client.chat.completions.create(
+        final_response = chat_completion(openai_client,
             model="deepseek-chat",
             messages=messages
         )
@@ -226,4 +236,6 @@ if __name__ == "__main__":
     run_agent("计算 999 * 888")
     
     # 测试4: 组合使用
-    run_agent("搜索一下今天有什么重要新闻")
\ No newline at end of file
+    run_agent("搜索一下今天有什么重要新闻")
+    
+    SEARCH_CACHE.print_summary()
@@ -4,26 +4,25 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """使用 Tavily 搜索"""
     try:
-        response = tavily_client.search(
+        response = cached_search(tavily_client,
             query=query,
             max_results=5,
             include_answer=True
@@ -109,7 +108,7 @@ def run_agent(user_input):
     messages = [{"role": "user", "content": user_input}]
     
     # 第一轮:AI 决策
-    response = openai_client.chat.completions.create(
+    response = chat_completion(openai_client,
         model="deepseek-chat",
         messages=messages,
         tools=tools,
@@ -145,7 +144,7 @@ def run_agent(user_input):
             })
         
         # 第二轮:AI 整合答案
-        final_response = openai_client.chat.completions.create(
+        final_response = chat_completion(openai_client,
             model="deepseek-chat",
             messages=messages
         )
@@ -177,4 +176,6 @@ if __name__ == "__main__":
     run_agent("什么是量子计算?")
     
     # 测试5: 组合查询
-    run_agent("比较一下 GPT-4 和 Claude 的特点")
\ No newline at end of file
+    run_agent("比较一下 GPT-4 和 Claude 的特点")
+    
+    SEARCH_CACHE.print_summary()
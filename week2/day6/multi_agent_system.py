@@ -11,12 +11,13 @@ Multi-Agent 协作系统
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 from typing import Dict, List, Any
 from agent_communication import Message, SharedState, MessageBus
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../week1/day4'))
+from client_registry import get_client
+from llm_calls import chat_completion
 
 class ResearchAgent:
     """
@@ -28,10 +29,7 @@ class ResearchAgent:
         self.name = name
         self.state = state
         self.bus = bus
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.client = get_client()  # 全进程共享客户端
         
         # 订阅消息
         self.bus.subscribe(self.name, self.handle_message)
@@ -49,16 +47,21 @@ class ResearchAgent:
         print(f"🔍 {self.name} 正在研究: {topic}")
         
         # 使用LLM生成研究内容
-        prompt = f"""你是研究专家。请针对主题"{topic}"提供:
+        # 固定要求放在 system 消息里, 主题放在后面, 每次请求前缀相同
+        system_prompt = """你是研究专家。请针对用户给出的主题提供:
 1. 核心概念 (2-3句话)
 2. 关键数据 (2-3个要点)
 3. 重要趋势 (1-2个)
 
 保持简洁,每部分不超过100字。"""
 
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent=self.name,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="analysis",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"主题: {topic}"}
+            ],
             temperature=0.7
         )
         
@@ -92,10 +95,7 @@ class AnalysisAgent:
         self.name = name
         self.state = state
         self.bus = bus
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.client = get_client()  # 全进程共享客户端
         
         self.research_results = []  # 收集的研究结果
         
@@ -126,20 +126,20 @@ class AnalysisAgent:
         ])
         
         # 使用LLM生成综合分析
-        prompt = f"""你是分析专家。基于以下研究结果:
-
-{all_research}
-
-请提供综合分析报告:
+        system_prompt = """你是分析专家。请基于用户给出的研究结果提供综合分析报告:
 1. 核心洞察 (3-4句话)
 2. 关联发现 (2-3点)
 3. 建议行动 (2点)
 
 保持专业和简洁。"""
 
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent=self.name,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="synthesis",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"研究结果:\n\n{all_research}"}
+            ],
             temperature=0.6
         )
         
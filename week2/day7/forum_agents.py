@@ -7,11 +7,12 @@
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 from typing import List, Dict
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../week1/day4'))
+from client_registry import get_client
+from llm_calls import chat_completion
 
 class ForumAgent:
     """论坛Agent基类"""
@@ -21,10 +22,18 @@ class ForumAgent:
         self.role = role  # 角色定位
         self.perspective = perspective  # 视角特点
         
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.client = get_client()  # 全进程共享客户端
+        
+        # 固定的角色和发言要求放在 system 消息里, 每次发言前缀相同, 可以命中提供方的前缀缓存
+        self.system_prompt = f"""你是{self.name}，{self.role}。
+你的视角特点: {self.perspective}
+
+你正在参加一场多位专家的论坛讨论。请从你的专业角度发表观点:
+1. 如果是第一轮,直接阐述你的观点
+2. 如果其他专家已发言,可以补充、质疑或深化
+3. 保持专业,3-4句话
+
+不要重复他人观点,提供新角度或证据。"""
         
         self.statements = []  # 自己的发言历史
         
@@ -54,25 +63,19 @@ class ForumAgent:
                 for s in others
             ])
         
-        prompt = f"""你是{self.name}，{self.role}。
-你的视角特点: {self.perspective}
-
-讨论主题: {topic}
+        prompt = f"""讨论主题: {topic}
 当前轮次: {round_num}
 
 主持人引导: {guidance}
-{others_text}
-
-请从你的专业角度发表观点:
-1. 如果是第一轮,直接阐述你的观点
-2. 如果其他专家已发言,可以补充、质疑或深化
-3. 保持专业,3-4句话
-
-不要重复他人观点,提供新角度或证据。"""
+{others_text}"""
 
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent=self.name,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="analysis",
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.8  # 提高温度增加多样性
         )
         
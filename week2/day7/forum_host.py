@@ -7,11 +7,34 @@
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 from typing import List, Dict
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../week1/day4'))
+from client_registry import get_client
+from llm_calls import chat_completion
+from llm_stream import ChatStream, print_chunk
+from token_budget import fit_blocks, prompt_budget, count_tokens
+
+# 主持人的固定指令放在 system 消息里, 讨论内容放在后面的 user 消息里,
+# 每轮请求前缀相同, 可以命中提供方的前缀缓存
+GUIDE_PROMPT = """你是论坛主持人,负责引导多位专家围绕主题深入讨论。
+
+每轮发言后请:
+1. 简要总结共识点
+2. 指出分歧或需要深入的地方
+3. 提出1-2个引导性问题
+
+保持简洁,3-4句话。"""
+
+CONCLUSION_PROMPT = """你是论坛主持人,请根据完整讨论记录总结这次讨论。
+
+请提供:
+1. 核心共识 (2-3点)
+2. 主要分歧 (1-2点)
+3. 综合建议 (2点)
+
+保持专业和简洁。"""
 
 class ForumHost:
     """
@@ -21,10 +44,7 @@ class ForumHost:
     
     def __init__(self, topic: str):
         self.topic = topic
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        self.client = get_client()  # 全进程共享客户端
         
         self.discussion_history = []  # 讨论历史
         self.current_round = 0        # 当前轮次
@@ -72,24 +92,19 @@ class ForumHost:
         ])
         
         # 生成引导语
-        prompt = f"""你是论坛主持人。
-
-讨论主题: {self.topic}
+        prompt = f"""讨论主题: {self.topic}
 当前轮次: {self.current_round}/{self.max_rounds}
 
 刚才的发言:
-{discussion_summary}
-
-请:
-1. 简要总结共识点
-2. 指出分歧或需要深入的地方
-3. 提出1-2个引导性问题
-
-保持简洁,3-4句话。"""
+{discussion_summary}"""
 
-        response = self.client.chat.completions.create(
+        response = chat_completion(self.client, agent="ForumHost",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="analysis",
+            messages=[
+                {"role": "system", "content": GUIDE_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.7
         )
         
@@ -107,31 +122,53 @@ class ForumHost:
         """判断是否继续讨论"""
         return self.current_round < self.max_rounds
     
-    def conclude_discussion(self) -> str:
-        """总结讨论"""
-        # 整理完整讨论历史
-        full_discussion = "\n\n".join([
-            f"[{s['agent']}]: {s['content']}"
-            for s in self.discussion_history
-        ])
-        
-        prompt = f"""你是论坛主持人,请总结这次讨论。
-
-主题: {self.topic}
+    def _build_conclusion_messages(self) -> List[Dict]:
+        """构建总结提示 (讨论记录超出预算时, 越早的发言越先被截短)"""
+        template = """主题: {topic}
 
 完整讨论记录:
-{full_discussion}
-
-请提供:
-1. 核心共识 (2-3点)
-2. 主要分歧 (1-2点)
-3. 综合建议 (2点)
-
-保持专业和简洁。"""
-
-        response = self.client.chat.completions.create(
+{discussion}"""
+        
+        # 整理完整讨论历史
+        entries = [f"[{s['agent']}]: {s['content']}" for s in self.discussion_history]
+        fixed = count_tokens(CONCLUSION_PROMPT) + count_tokens(template.format(topic=self.topic, discussion=""))
+        full_discussion = "\n\n".join(fit_blocks(entries, prompt_budget("deepseek-chat") - fixed))
+        
+        return [
+            {"role": "system", "content": CONCLUSION_PROMPT},
+            {"role": "user", "content": template.format(topic=self.topic, discussion=full_discussion)}
+        ]
+    
+    def stream_conclusion(self) -> ChatStream:
+        """流式总结讨论, 迭代得到文本块, 结束后 .text 是完整总结"""
+        return ChatStream(
+            self.client,
+            "deepseek-chat",
+            self._build_conclusion_messages(),
+            temperature=0.6,
+            name="ForumHost",
+            agent="ForumHost"
+        )
+    
+    def conclude_discussion(self, stream: bool = False) -> str:
+        """
+        总结讨论
+        
+        Args:
+            stream: 为 True 时边生成边打印
+        """
+        if stream:
+            print("="*70)
+            print("🎙️ 主持人总结:")
+            print("="*70)
+            conclusion = self.stream_conclusion().consume(print_chunk)
+            print("\n" + "="*70 + "\n")
+            return conclusion
+        
+        response = chat_completion(self.client, agent="ForumHost",
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="synthesis",
+            messages=self._build_conclusion_messages(),
             temperature=0.6
         )
         
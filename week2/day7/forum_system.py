@@ -6,6 +6,7 @@
 
 from forum_host import ForumHost
 from forum_agents import QueryAgent, InsightAgent, MediaAgent
+from telemetry import TELEMETRY
 from typing import List, Dict
 
 class ForumSystem:
@@ -40,7 +41,8 @@ class ForumSystem:
         """运行完整的论坛讨论"""
         
         # 1. 开场
-        self.host.open_forum()
+        with TELEMETRY.stage("0_open"):
+            self.host.open_forum()
         
         # 2. 多轮讨论
         for round_num in range(1, self.max_rounds + 1):
@@ -60,7 +62,8 @@ class ForumSystem:
                 }
                 
                 # Agent发言
-                statement = agent.speak(self.topic, context)
+                with TELEMETRY.stage(f"round_{round_num}"):
+                    statement = agent.speak(self.topic, context)
                 
                 # 记录发言
                 round_statements.append({
@@ -75,7 +78,8 @@ class ForumSystem:
             
             # 主持人引导(如果不是最后一轮)
             if round_num < self.max_rounds:
-                guidance = self.host.guide_discussion(round_statements)
+                with TELEMETRY.stage(f"round_{round_num}"):
+                    guidance = self.host.guide_discussion(round_statements)
                 # 记录主持人引导
                 self.host.discussion_history.append({
                     "agent": "Host",
@@ -93,7 +97,8 @@ class ForumSystem:
         print("📊 论坛总结")
         print("="*70 + "\n")
         
-        conclusion = self.host.conclude_discussion()
+        with TELEMETRY.stage("conclusion"):
+            conclusion = self.host.conclude_discussion(stream=True)
         
         return conclusion
 
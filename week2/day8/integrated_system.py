@@ -14,11 +14,15 @@ import os
 # 添加路径以导入之前的模块
 sys.path.append(os.path.join(os.path.dirname(__file__), '../day6'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '../day7'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../week1/day4'))
 
 from agent_communication import SharedState, MessageBus
 from forum_host import ForumHost
 from forum_agents import QueryAgent, InsightAgent, MediaAgent
 from report_agent import ReportAgent
+from client_registry import get_registry_stats
+from telemetry import TELEMETRY
+from model_router import ROUTER
 
 class IntegratedAnalysisSystem:
     """
@@ -50,6 +54,13 @@ class IntegratedAnalysisSystem:
         # 4. 报告生成Agent
         self.report_agent = ReportAgent()
         
+        # 5 个 Agent 共用同一个客户端和连接池
+        registry = get_registry_stats()
+        print(f"\n🔌 共享 LLM 客户端: {registry['active_clients']} 个 | 连接池: {registry['http_pools_created']} 个")
+        
+        # 每次 LLM 调用的明细 (未通过 LLM_TELEMETRY_JSONL 指定时写到 reports/)
+        TELEMETRY.jsonl_path = TELEMETRY.jsonl_path or os.path.join("reports", "llm_telemetry.jsonl")
+        
         print("\n✅ 系统初始化完成\n")
     
     def run_analysis(self):
@@ -60,29 +71,48 @@ class IntegratedAnalysisSystem:
         print("📊 阶段1: 并行数据收集")
         print("="*70 + "\n")
         
-        research_data = self._collect_data()
+        with TELEMETRY.stage("1_collect_data"):
+            research_data = self._collect_data()
         
         # ========== 阶段2: 论坛辩论 ==========
         print("\n" + "="*70)
         print("🎙️ 阶段2: 专家论坛辩论")
         print("="*70 + "\n")
         
-        forum_conclusion = self._run_forum_discussion(research_data)
+        with TELEMETRY.stage("2_forum_discussion"):
+            forum_conclusion = self._run_forum_discussion(research_data)
         
         # ========== 阶段3: 报告生成 ==========
         print("\n" + "="*70)
         print("📝 阶段3: 生成分析报告")
         print("="*70 + "\n")
         
-        final_report = self._generate_report(research_data, forum_conclusion)
+        with TELEMETRY.stage("3_generate_report"):
+            final_report = self._generate_report(research_data, forum_conclusion)
         
         # ========== 完成 ==========
         print("\n" + "="*70)
         print("✅ 分析完成!")
         print("="*70 + "\n")
         
+        self._print_telemetry()
+        
         return final_report
     
+    def _print_telemetry(self):
+        """打印各阶段耗时和各 Agent 的 LLM 用量, 并导出 Prometheus 指标"""
+        print("="*70)
+        print("⏱️ 阶段耗时")
+        print("="*70)
+        TELEMETRY.print_stages()
+        print("-"*70)
+        TELEMETRY.print_summary("agent")
+        TELEMETRY.print_prompt_cache("agent")
+        ROUTER.print_summary()
+        metrics_file = TELEMETRY.write_prometheus(os.path.join("reports", "llm_metrics.prom"))
+        print(f"\n📈 指标: {metrics_file} | 调用明细: {TELEMETRY.jsonl_path}")
+        print("="*70 + "\n")
+    
     def _collect_data(self):
         """阶段1: 收集数据"""
         
@@ -174,30 +204,29 @@ class IntegratedAnalysisSystem:
                     for s in round_statements
                 ])
         
-        # 总结
-        conclusion = self.forum_host.conclude_discussion()
+        # 总结 (流式输出)
+        conclusion = self.forum_host.conclude_discussion(stream=True)
         
         return conclusion
     
     def _generate_report(self, research_data, forum_conclusion):
         """阶段3: 生成报告"""
         
+        # 流式生成: 报告边写边显示
+        print("="*70)
+        print("📊 最终分析报告")
+        print("="*70)
         report = self.report_agent.generate_report(
             topic=self.topic,
             research_data=research_data,
-            forum_conclusion=forum_conclusion
+            forum_conclusion=forum_conclusion,
+            stream=True
         )
+        print("="*70)
         
         # 保存报告
         filename = self.report_agent.save_report(report, self.topic)
         
-        # 显示报告
-        print("="*70)
-        print("📊 最终分析报告")
-        print("="*70)
-        print(report[:1000] + "\n...(完整报告已保存)\n")
-        print("="*70)
-        
         return report
 
 
@@ -7,68 +7,21 @@
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
 from typing import Dict, List
 from datetime import datetime
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../week1/day4'))
+from client_registry import get_client
+from llm_calls import chat_completion, route_model
+from llm_stream import ChatStream, print_chunk
 
-class ReportAgent:
-    """
-    报告生成Agent
-    类似 BettaFish 的 ReportEngine
-    """
-    
-    def __init__(self):
-        self.name = "ReportAgent"
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
-        
-        print(f"📝 {self.name} 已启动 (报告生成专家)")
-    
-    def generate_report(
-        self,
-        topic: str,
-        research_data: Dict,
-        forum_conclusion: str
-    ) -> str:
-        """
-        生成完整分析报告
-        
-        Args:
-            topic: 分析主题
-            research_data: {
-                "query": "QueryAgent的发现",
-                "insight": "InsightAgent的分析",
-                "media": "MediaAgent的洞察"
-            }
-            forum_conclusion: 论坛讨论的总结
-        """
-        print(f"\n📝 {self.name} 正在生成报告...")
-        
-        # 整理研究数据
-        research_summary = "\n\n".join([
-            f"【{agent.upper()}】\n{content}"
-            for agent, content in research_data.items()
-        ])
-        
-        # 生成报告
-        prompt = f"""你是专业的分析报告撰写专家。
-
-主题: {topic}
+# 报告的固定要求和结构放在 system 消息里, 每次生成报告前缀相同, 可以命中提供方的前缀缓存
+REPORT_PROMPT = """你是专业的分析报告撰写专家。
 
-===== 研究数据 =====
-{research_summary}
+请根据用户提供的主题、研究数据和专家论坛讨论结论,生成一份完整的分析报告,包含:
 
-===== 专家论坛讨论结论 =====
-{forum_conclusion}
-
-请生成一份完整的分析报告,包含:
-
-# {topic} - 综合分析报告
+# <主题> - 综合分析报告
 
 ## 一、执行摘要
 (3-4句话概括核心发现)
@@ -97,12 +50,102 @@ class ReportAgent:
 (建议跟踪的3-5个关键指标)
 
 ---
-报告生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-"""
+报告末尾注明用户给出的报告生成时间。"""
+
+class ReportAgent:
+    """
+    报告生成Agent
+    类似 BettaFish 的 ReportEngine
+    """
+    
+    def __init__(self):
+        self.name = "ReportAgent"
+        self.client = get_client()  # 全进程共享客户端
+        
+        print(f"📝 {self.name} 已启动 (报告生成专家)")
+    
+    def _build_report_messages(
+        self,
+        topic: str,
+        research_data: Dict,
+        forum_conclusion: str
+    ) -> List[Dict]:
+        """构建报告提示: 固定的报告要求在前, 本次的主题和数据在后"""
+        # 整理研究数据
+        research_summary = "\n\n".join([
+            f"【{agent.upper()}】\n{content}"
+            for agent, content in research_data.items()
+        ])
+        
+        prompt = f"""主题: {topic}
 
-        response = self.client.chat.completions.create(
+===== 研究数据 =====
+{research_summary}
+
+===== 专家论坛讨论结论 =====
+{forum_conclusion}
+
+报告生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"""
+        
+        return [
+            {"role": "system", "content": REPORT_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def stream_report(
+        self,
+        topic: str,
+        research_data: Dict,
+        forum_conclusion: str
+    ) -> ChatStream:
+        """
+        流式生成报告
+        迭代返回值得到文本块, 迭代结束后 .text 是完整报告, .ttft 是首 token 时间
+        """
+        messages = self._build_report_messages(topic, research_data, forum_conclusion)
+        client, model = route_model(self.client, "report", messages, "deepseek-chat", agent=self.name)
+        return ChatStream(
+            client,
+            model,
+            messages,
+            temperature=0.4,  # 较低温度保证专业性
+            name=self.name,
+            agent=self.name
+        )
+    
+    def generate_report(
+        self,
+        topic: str,
+        research_data: Dict,
+        forum_conclusion: str,
+        stream: bool = False
+    ) -> str:
+        """
+        生成完整分析报告
+        
+        Args:
+            topic: 分析主题
+            research_data: {
+                "query": "QueryAgent的发现",
+                "insight": "InsightAgent的分析",
+                "media": "MediaAgent的洞察"
+            }
+            forum_conclusion: 论坛讨论的总结
+            stream: 为 True 时边生成边打印
+        """
+        print(f"\n📝 {self.name} 正在生成报告...")
+        
+        if stream:
+            report_stream = self.stream_report(topic, research_data, forum_conclusion)
+            report = report_stream.consume(print_chunk)
+            print(f"\n\n✅ {self.name} 报告生成完成 (TTFT: {report_stream.ttft:.2f}s, "
+                  f"{report_stream.tokens_per_sec:.1f} tokens/s)\n")
+            return report
+        
+        response = chat_completion(self.client, agent=self.name,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type="report",
+            messages=self._build_report_messages(topic, research_data, forum_conclusion),
             temperature=0.4  # 较低温度保证专业性
         )
         
@@ -149,11 +192,12 @@ if __name__ == "__main__":
 综合建议: 强化执行 + 政企合作
 """
     
-    # 生成报告
+    # 生成报告 (流式输出)
     report = agent.generate_report(
         topic="AI技术的风险与机遇",
         research_data=test_data,
-        forum_conclusion=forum_result
+        forum_conclusion=forum_result,
+        stream=True
     )
     
     print("="*70)
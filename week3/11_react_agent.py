@@ -4,26 +4,26 @@ ReAct 模式 Agent - 显式思维链
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from telemetry import TELEMETRY
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """网络搜索"""
     try:
-        response = tavily_client.search(query=query, max_results=3)
+        response = cached_search(tavily_client, query=query, max_results=3)
         results = [
             f"标题: {r['title']}\n内容: {r['content'][:200]}"
             for r in response.get('results', [])[:3]
@@ -93,11 +93,13 @@ Action: calculate: 15**2
         print(f"\n--- 第 {step + 1} 轮思考 ---")
         
         # 调用 AI
-        response = openai_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            temperature=0  # 降低随机性,更稳定
-        )
+        with TELEMETRY.stage("thought"):
+            response = chat_completion(openai_client,
+                model="deepseek-chat",
+                task_type="decision",
+                messages=messages,
+                temperature=0  # 降低随机性,更稳定
+            )
         
         ai_response = response.choices[0].message.content
         print(ai_response)
@@ -124,7 +126,8 @@ Action: calculate: 15**2
                 # 执行工具
                 if tool_name in tools:
                     print(f"\n🔧 执行: {tool_name}({arguments})")
-                    result = tools[tool_name](arguments)
+                    with TELEMETRY.stage("action"):
+                        result = tools[tool_name](arguments)
                     print(f"📊 结果:\n{result}\n")
                     
                     # 添加 Observation 到对话
@@ -159,4 +162,6 @@ if __name__ == "__main__":
     print("\n\n")
     
     # 测试3: 复杂任务
-    react_agent("2024年诺贝尔物理学奖得主是谁?他们的主要贡献是什么?")
\ No newline at end of file
+    react_agent("2024年诺贝尔物理学奖得主是谁?他们的主要贡献是什么?")
+    
+    SEARCH_CACHE.print_summary()
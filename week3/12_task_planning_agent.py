@@ -4,26 +4,26 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from telemetry import TELEMETRY
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """网络搜索"""
     try:
-        response = tavily_client.search(query=query, max_results=3, include_answer=True)
+        response = cached_search(tavily_client, query=query, max_results=3, include_answer=True)
         
         # 提取答案和结果
         answer = response.get('answer', '')
@@ -48,6 +48,37 @@ def calculate(expression):
 
 # ========== 任务规划 Agent ==========
 
+# 固定的规划要求和输出格式放在 system 消息里, 任务放在后面, 每次请求前缀相同 (可命中提供方的前缀缓存)
+PLANNING_PROMPT = """你是一个任务规划专家。用户给你一个任务,你需要将其分解成可执行的步骤。
+
+可用工具:
+- web_search: 搜索互联网信息
+- calculate: 数学计算
+
+请分析这个任务,然后制定执行计划。按以下JSON格式输出:
+
+{
+  "task_analysis": "任务分析:这个任务需要...",
+  "steps": [
+    {"step": 1, "action": "web_search", "query": "具体搜索内容", "purpose": "为什么要这样做"},
+    {"step": 2, "action": "web_search", "query": "...", "purpose": "..."},
+    ...
+  ],
+  "final_goal": "最终要达成什么目标"
+}
+
+只输出JSON,不要其他内容。"""
+
+SYNTHESIS_PROMPT = """你刚刚执行了一个多步骤任务。现在需要整合所有信息,给出最终答案。
+
+请根据用户给出的执行步骤和结果,完成原始任务。
+
+要求:
+1. 整合所有步骤的信息
+2. 给出清晰、完整的答案
+3. 用结构化的方式呈现(可以用标题、列表等)
+4. 如果某些信息不足,说明需要进一步研究什么"""
+
 def planning_agent(task):
     """
     任务规划 Agent
@@ -64,33 +95,16 @@ def planning_agent(task):
     # ========== 阶段1: 制定计划 ==========
     print("\n📋 阶段1: 制定执行计划\n")
     
-    planning_prompt = f"""你是一个任务规划专家。用户给你一个任务,你需要将其分解成可执行的步骤。
-
-可用工具:
-- web_search: 搜索互联网信息
-- calculate: 数学计算
-
-任务: {task}
-
-请分析这个任务,然后制定执行计划。按以下JSON格式输出:
-
-{{
-  "task_analysis": "任务分析:这个任务需要...",
-  "steps": [
-    {{"step": 1, "action": "web_search", "query": "具体搜索内容", "purpose": "为什么要这样做"}},
-    {{"step": 2, "action": "web_search", "query": "...", "purpose": "..."}},
-    ...
-  ],
-  "final_goal": "最终要达成什么目标"
-}}
-
-只输出JSON,不要其他内容。"""
-    
-    response = openai_client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[{"role": "user", "content": planning_prompt}],
-        temperature=0.3
-    )
+    with TELEMETRY.stage("1_plan"):
+        response = chat_completion(openai_client,
+            model="deepseek-chat",
+            task_type="analysis",  # 计划决定后续所有步骤, 不走最便宜的档位
+            messages=[
+                {"role": "system", "content": PLANNING_PROMPT},
+                {"role": "user", "content": f"任务: {task}"}
+            ],
+            temperature=0.3
+        )
     
     plan_text = response.choices[0].message.content
     
@@ -129,12 +143,13 @@ def planning_agent(task):
         print(f"   目的: {step_info['purpose']}\n")
         
         # 执行工具
-        if action == "web_search":
-            result = web_search(query)
-        elif action == "calculate":
-            result = calculate(query)
-        else:
-            result = f"未知工具: {action}"
+        with TELEMETRY.stage("2_execute"):
+            if action == "web_search":
+                result = web_search(query)
+            elif action == "calculate":
+                result = calculate(query)
+            else:
+                result = f"未知工具: {action}"
         
         print(f"✅ 结果:\n{result[:300]}...\n")
         print("-" * 80 + "\n")
@@ -153,9 +168,7 @@ def planning_agent(task):
     print("=" * 80 + "\n")
     
     # 构建整合提示
-    synthesis_prompt = f"""你刚刚执行了一个多步骤任务。现在需要整合所有信息,给出最终答案。
-
-原始任务: {task}
+    synthesis_prompt = f"""原始任务: {task}
 
 执行的步骤和结果:
 """
@@ -165,23 +178,18 @@ def planning_agent(task):
         synthesis_prompt += f"结果: {r['result'][:500]}\n"
         synthesis_prompt += "-" * 40 + "\n"
     
-    synthesis_prompt += f"""
-请根据以上所有信息,完成原始任务: {task}
-
-要求:
-1. 整合所有步骤的信息
-2. 给出清晰、完整的答案
-3. 用结构化的方式呈现(可以用标题、列表等)
-4. 如果某些信息不足,说明需要进一步研究什么
-"""
-    
     print("🤔 AI 正在整合信息...\n")
     
-    final_response = openai_client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[{"role": "user", "content": synthesis_prompt}],
-        temperature=0.5
-    )
+    with TELEMETRY.stage("3_synthesis"):
+        final_response = chat_completion(openai_client,
+            model="deepseek-chat",
+            task_type="synthesis",
+            messages=[
+                {"role": "system", "content": SYNTHESIS_PROMPT},
+                {"role": "user", "content": synthesis_prompt}
+            ],
+            temperature=0.5
+        )
     
     final_answer = final_response.choices[0].message.content
     
@@ -203,4 +211,6 @@ if __name__ == "__main__":
     print("\n\n" + "🔷" * 40 + "\n")
     
     # 测试2: 更复杂的研究任务
-    planning_agent("研究2024年诺贝尔物理学奖得主的背景和主要贡献,并说明这项工作为什么重要")
\ No newline at end of file
+    planning_agent("研究2024年诺贝尔物理学奖得主的背景和主要贡献,并说明这项工作为什么重要")
+    
+    SEARCH_CACHE.print_summary()
@@ -4,26 +4,25 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """网络搜索"""
     try:
-        response = tavily_client.search(query=query, max_results=3, include_answer=True)
+        response = cached_search(tavily_client, query=query, max_results=3, include_answer=True)
         answer = response.get('answer', '')
         results = [f"{r['title']}: {r['content'][:200]}" for r in response.get('results', [])[:2]]
         return f"总结: {answer}\n\n详情:\n" + "\n".join(results) if results else answer
@@ -48,39 +47,44 @@ def dynamic_agent(task, max_iterations=5):
         "findings": []
     }
     
+    # 固定的规划要求放在 system 消息里, 每轮请求前缀相同 (可命中提供方的前缀缓存), 本轮进度放在后面
+    system_prompt = """你是一个任务规划专家。根据当前进度,决定下一步行动。
+
+请判断:
+1. 任务是否已完成? 如果完成,返回最终答案
+2. 如果未完成,下一步应该做什么?
+
+请用JSON格式回复:
+{
+  "status": "completed" 或 "continue",
+  "reasoning": "你的思考过程",
+  "next_action": {"tool": "web_search", "query": "具体搜索内容"} 或 null,
+  "final_answer": "最终答案" 或 null
+}
+
+只输出JSON,不要其他内容。"""
+    
     for iteration in range(max_iterations):
         print(f"\n{'='*80}")
         print(f"🔄 第 {iteration + 1} 轮规划与执行")
         print("=" * 80 + "\n")
         
         # 决定下一步
-        planning_prompt = f"""你是一个任务规划专家。根据当前进度,决定下一步行动。
-
-原始任务: {task}
+        planning_prompt = f"""原始任务: {task}
 
 已完成的步骤:
 {chr(10).join([f"- {s}" for s in context['completed_steps']]) if context['completed_steps'] else "（尚未开始）"}
 
 已获得的信息:
-{chr(10).join([f"- {f[:200]}..." for f in context['findings']]) if context['findings'] else "（暂无）"}
-
-基于以上信息,请判断:
-1. 任务是否已完成? 如果完成,返回最终答案
-2. 如果未完成,下一步应该做什么?
-
-请用JSON格式回复:
-{{
-  "status": "completed" 或 "continue",
-  "reasoning": "你的思考过程",
-  "next_action": {{"tool": "web_search", "query": "具体搜索内容"}} 或 null,
-  "final_answer": "最终答案" 或 null
-}}
-
-只输出JSON,不要其他内容。"""
+{chr(10).join([f"- {f[:200]}..." for f in context['findings']]) if context['findings'] else "（暂无）"}"""
         
-        response = openai_client.chat.completions.create(
+        response = chat_completion(openai_client,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": planning_prompt}],
+            task_type="decision",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": planning_prompt}
+            ],
             temperature=0.3
         )
         
@@ -131,3 +135,5 @@ if __name__ == "__main__":
     dynamic_agent(
         "查找2024年诺贝尔物理学奖得主,然后搜索他们各自的主要学术贡献"
     )
+    
+    SEARCH_CACHE.print_summary()
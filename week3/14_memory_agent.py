@@ -4,26 +4,25 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """网络搜索"""
     try:
-        response = tavily_client.search(query=query, max_results=3, include_answer=True)
+        response = cached_search(tavily_client, query=query, max_results=3, include_answer=True)
         answer = response.get('answer', '')
         results = [f"{r['title']}: {r['content'][:150]}" for r in response.get('results', [])[:2]]
         return f"总结: {answer}\n详情: " + "; ".join(results) if results else answer
@@ -94,44 +93,27 @@ def memory_agent(task, max_iterations=6):
     # 初始化记忆
     memory = Memory()
     
-    for iteration in range(max_iterations):
-        print(f"\n{'='*80}")
-        print(f"🔄 第 {iteration + 1} 轮")
-        print("=" * 80 + "\n")
-        
-        # 显示当前记忆
-        if iteration > 0:
-            print(memory.summarize() + "\n")
-        
-        # 决定下一步
-        planning_prompt = f"""你是一个智能 Agent,正在执行任务。你有一个记忆系统可以保存重要信息。
-
-原始任务: {task}
-
-当前记忆:
-{json.dumps([{'key': f['key'], 'value': f['value'][:100]} for f in memory.get_all_facts()], ensure_ascii=False, indent=2) if memory.get_all_facts() else '(空)'}
-
-已完成的步骤:
-{chr(10).join([f"{s['step']}. {s['action']}" for s in memory.steps]) if memory.steps else '(尚未开始)'}
+    # 固定的行动说明放在 system 消息里, 每轮请求前缀相同 (可命中提供方的前缀缓存), 记忆和进度放在后面
+    system_prompt = """你是一个智能 Agent,正在执行任务。你有一个记忆系统可以保存重要信息。
 
-基于以上信息,决定下一步行动。你可以:
+根据原始任务、当前记忆和已完成的步骤,决定下一步行动。你可以:
 1. 使用 web_search 搜索信息
 2. 将重要信息保存到记忆 (save_to_memory)
 3. 完成任务并给出答案
 
 请用JSON格式回复:
-{{
+{
   "status": "continue" 或 "completed",
   "reasoning": "你的思考",
-  "action": {{
+  "action": {
     "type": "web_search" 或 "save_to_memory" 或 null,
     "query": "搜索内容" (如果是search),
     "memory_key": "记忆键名" (如果是save),
     "memory_value": "要保存的内容" (如果是save),
     "importance": "high" 或 "normal" (如果是save)
-  }},
+  },
   "final_answer": "最终答案" (如果completed)
-}}
+}
 
 记忆使用建议:
 - 将关键人名、数据、结论保存到记忆
@@ -139,10 +121,32 @@ def memory_agent(task, max_iterations=6):
 - 标记重要信息为 "high"
 
 只输出JSON。"""
+    
+    for iteration in range(max_iterations):
+        print(f"\n{'='*80}")
+        print(f"🔄 第 {iteration + 1} 轮")
+        print("=" * 80 + "\n")
+        
+        # 显示当前记忆
+        if iteration > 0:
+            print(memory.summarize() + "\n")
         
-        response = openai_client.chat.completions.create(
+        # 决定下一步
+        planning_prompt = f"""原始任务: {task}
+
+当前记忆:
+{json.dumps([{'key': f['key'], 'value': f['value'][:100]} for f in memory.get_all_facts()], ensure_ascii=False, indent=2) if memory.get_all_facts() else '(空)'}
+
+已完成的步骤:
+{chr(10).join([f"{s['step']}. {s['action']}" for s in memory.steps]) if memory.steps else '(尚未开始)'}"""
+        
+        response = chat_completion(openai_client,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": planning_prompt}],
+            task_type="decision",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": planning_prompt}
+            ],
             temperature=0.3
         )
         
@@ -203,4 +207,6 @@ if __name__ == "__main__":
     # 测试:需要记住多个信息的复杂任务
     memory_agent(
         "查找2024年诺贝尔物理学奖得主,记住他们的名字和主要贡献,然后告诉我为什么他们的工作很重要"
-    )
\ No newline at end of file
+    )
+    
+    SEARCH_CACHE.print_summary()
@@ -4,26 +4,26 @@
 """
 
 import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from tavily import TavilyClient
 
-load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '../week1/day4'))
+from client_registry import lazy_client, lazy_tavily_client
+from llm_calls import chat_completion
+from telemetry import TELEMETRY
+from semantic_cache import cached_search, SEARCH_CACHE
 
-openai_client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# 客户端在第一次调用时才创建: import 本模块不加载 SDK, 也不需要 Key
+openai_client = lazy_client()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+tavily_client = lazy_tavily_client()
 
 # ========== 工具函数 ==========
 
 def web_search(query):
     """网络搜索"""
     try:
-        response = tavily_client.search(query=query, max_results=3, include_answer=True)
+        response = cached_search(tavily_client, query=query, max_results=3, include_answer=True)
         answer = response.get('answer', '')
         results = [f"{r['title']}: {r['content'][:150]}" for r in response.get('results', [])[:2]]
         return f"总结: {answer}\n详情: " + "; ".join(results) if results else answer
@@ -40,21 +40,28 @@ class Agent:
         self.role = role
         self.expertise = expertise
         
-    def process(self, task, context=""):
-        """处理任务"""
-        prompt = f"""你是 {self.name},一个 {self.role}。
+    def process(self, task, context="", task_type="analysis"):
+        """
+        处理任务 (角色设定放在 system 消息里, 同一个 Agent 每次请求的前缀相同)
+        task_type 交给模型路由: 任务分解走快速模型, 撰写报告走高档位模型
+        """
+        system_prompt = f"""你是 {self.name},一个 {self.role}。
 
 你的专长: {self.expertise}
 
-当前任务: {task}
-
-{f"上下文信息: {context}" if context else ""}
+请完成用户给出的任务,给出你的专业意见。保持简洁专业。"""
+        
+        prompt = f"""当前任务: {task}
 
-请完成这个任务,给出你的专业意见。保持简洁专业。"""
+{f"上下文信息: {context}" if context else ""}"""
 
-        response = openai_client.chat.completions.create(
+        response = chat_completion(openai_client,
             model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+            task_type=task_type,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.7
         )
         
@@ -124,7 +131,8 @@ class WriterAgent(Agent):
         
         report = self.process(
             "基于研究和分析结果,撰写一份结构清晰的报告",
-            f"研究结果:\n{research}\n\n分析结果:\n{analysis}"
+            f"研究结果:\n{research}\n\n分析结果:\n{analysis}",
+            task_type="report"
         )
         
         print(f"✅ [{self.name}] 报告完成")
@@ -154,10 +162,12 @@ class CoordinatorAgent(Agent):
         # 1. 任务分解
         print(f"\n📋 [{self.name}] 正在分解任务...")
         
-        task_plan = self.process(
-            f"将以下用户任务分解成具体的研究主题:\n{user_task}\n\n请给出2-3个需要研究的具体方面,每个一行。",
-            ""
-        )
+        with TELEMETRY.stage("0_plan"):
+            task_plan = self.process(
+                f"将以下用户任务分解成具体的研究主题:\n{user_task}\n\n请给出2-3个需要研究的具体方面,每个一行。",
+                "",
+                task_type="analysis"  # 任务分解决定后续所有研究, 不走最便宜的档位
+            )
         
         print(f"✅ [{self.name}] 任务分解完成:")
         print(task_plan)
@@ -170,7 +180,8 @@ class CoordinatorAgent(Agent):
         research_results = []
         
         # 简化:只做一次综合研究
-        research = self.researcher.research(user_task)
+        with TELEMETRY.stage("1_research"):
+            research = self.researcher.research(user_task)
         research_results.append(research)
         
         # 3. 分析阶段
@@ -179,14 +190,16 @@ class CoordinatorAgent(Agent):
         print("=" * 80)
         
         combined_research = "\n\n".join(research_results)
-        analysis = self.analyst.analyze(combined_research)
+        with TELEMETRY.stage("2_analysis"):
+            analysis = self.analyst.analyze(combined_research)
         
         # 4. 撰写阶段
         print("\n" + "=" * 80)
         print("📝 阶段3: 报告撰写")
         print("=" * 80)
         
-        report = self.writer.write_report(combined_research, analysis)
+        with TELEMETRY.stage("3_writing"):
+            report = self.writer.write_report(combined_research, analysis)
         
         # 5. 质量审核
         print("\n" + "=" * 80)
@@ -195,10 +208,12 @@ class CoordinatorAgent(Agent):
         
         print(f"\n👔 [{self.name}] 正在审核报告...")
         
-        final_report = self.process(
-            "请审核以下报告,如果需要可以略作调整,确保质量:",
-            report
-        )
+        with TELEMETRY.stage("4_review"):
+            final_report = self.process(
+                "请审核以下报告,如果需要可以略作调整,确保质量:",
+                report,
+                task_type="report"
+            )
         
         print(f"✅ [{self.name}] 审核完成,项目交付!")
         
@@ -230,4 +245,6 @@ if __name__ == "__main__":
     # 测试任务
     run_multi_agent_system(
         "研究 2024年诺贝尔物理学奖得主的工作,分析其重要性,并撰写一份简短报告"
-    )
\ No newline at end of file
+    )
+    
+    SEARCH_CACHE.print_summary()